@@ -89,20 +89,21 @@ class DataProcessor:
     def compute_model_annotation_trends(self, start_date: str = None, end_date: str = None) -> pd.DataFrame:
         """
         按模型计算每日标注趋势。
-        直接从 DBManager 获取已过滤日期的数据。
+        按天分组计数在SQL中完成（DBManager.get_daily_annotation_counts），这里只做行列转换。
         :param start_date: 开始日期
         :param end_date: 结束日期
         """
-        df = self.db_manager.get_annotations_with_poem_info(start_date, end_date)
+        df = self.db_manager.get_daily_annotation_counts(start_date, end_date)
         if df.empty:
             logger.warning(f"在 {start_date} 到 {end_date} 范围内无标注数据用于趋势分析。")
             return pd.DataFrame()
 
-        # 转换为日期格式进行分组
-        df['annotation_date'] = pd.to_datetime(df['annotation_created_at']).dt.date
+        df['annotation_date'] = pd.to_datetime(df['annotation_date']).dt.date
         
-        # 按日期、模型、状态分组计数
-        trends_df = df.groupby(['annotation_date', 'model_identifier', 'status']).size().unstack(fill_value=0).reset_index()
+        # 按日期、模型、状态展开计数
+        trends_df = df.pivot_table(
+            index=['annotation_date', 'model_identifier'], columns='status', values='count', aggfunc='sum', fill_value=0
+        ).reset_index()
         
         # 确保 'completed' 和 'failed' 列存在
         if 'completed' not in trends_df.columns:
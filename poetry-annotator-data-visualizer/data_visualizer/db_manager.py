@@ -1,9 +1,23 @@
 import sqlite3
 import pandas as pd
+from datetime import datetime, timezone, timedelta
 from functools import lru_cache
 from data_visualizer.config import DB_PATHS, CACHE_MAX_SIZE_DB_QUERIES
 from data_visualizer.utils import logger, db_connect
 from typing import Any
+# 整数时间戳列与主项目共用同一套定义
+from src.db_adapter import ensure_epoch_columns
+
+LOCAL_TZ = timezone(timedelta(hours=8))  # 库中时间均为东八区
+
+
+def _local_epoch(value: str) -> int:
+    """
+    把日期范围的边界转为 Unix 秒。边界的日期与时间按东八区本地时间解释（忽略其自带的时区后缀），
+    与原先直接和库中本地时间字符串比较的结果一致。
+    """
+    parsed = datetime.fromisoformat(value)
+    return int(parsed.replace(tzinfo=LOCAL_TZ).timestamp())
 
 # 尝试导入 tqdm 用于进度显示
 try:
@@ -15,6 +29,8 @@ except ImportError:
 class DBManager:
     def __init__(self, db_path=DB_PATHS['SongCi']):
         self.db_path = db_path
+        # 是否可用 annotations 的整数时间戳列，由 _init_database 确定
+        self.epoch_columns = False
         self._init_database()
 
     def _init_database(self):
@@ -87,6 +103,7 @@ class DBManager:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_emotion_parent_id ON emotion_categories(parent_id)')
             cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS uidx_sentence_ref ON sentence_annotations(annotation_id, sentence_uid)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_link_emotion_id ON sentence_emotion_links(emotion_id)')
+            self.epoch_columns = ensure_epoch_columns(cursor)
 
             conn.commit()
             logger.info("数据库架构检查/初始化完成。")
@@ -151,13 +168,37 @@ class DBManager:
             JOIN poems p ON a.poem_id = p.id
             WHERE 1=1
         """
-        params = {}
+        conditions, params = self._created_at_range(start_date, end_date)
+        query += conditions
+        return self._fetch_data(query, params)
+
+    def _created_at_range(self, start_date: str = None, end_date: str = None) -> tuple[str, dict]:
+        """构造 annotations.created_at 的范围条件；有整数时间戳列时走 created_at_epoch 索引"""
+        conditions, params = "", {}
+        column = "a.created_at_epoch" if self.epoch_columns else "a.created_at"
         if start_date:
-            query += " AND a.created_at >= :start_date"
-            params['start_date'] = start_date
+            conditions += f" AND {column} >= :start_date"
+            params['start_date'] = _local_epoch(start_date) if self.epoch_columns else start_date
         if end_date:
-            query += " AND a.created_at <= :end_date"
-            params['end_date'] = end_date
+            conditions += f" AND {column} <= :end_date"
+            params['end_date'] = _local_epoch(end_date) if self.epoch_columns else end_date
+        return conditions, params
+
+    def get_daily_annotation_counts(self, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+        """在SQL中按 日期（东八区）× 模型 × 状态 统计标注数量，支持按日期过滤。"""
+        if self.epoch_columns:
+            day = "date(a.created_at_epoch, 'unixepoch', '+8 hours')"
+        else:
+            # 库中时间为东八区本地时间字符串，前10位即本地日期
+            day = "substr(a.created_at, 1, 10)"
+        conditions, params = self._created_at_range(start_date, end_date)
+        query = f"""
+            SELECT {day} AS annotation_date, a.model_identifier, a.status, COUNT(*) AS count
+            FROM annotations a
+            JOIN poems p ON a.poem_id = p.id
+            WHERE 1=1 {conditions}
+            GROUP BY annotation_date, a.model_identifier, a.status
+        """
         return self._fetch_data(query, params)
 
     def get_poem_count_by_author(self) -> pd.DataFrame:
@@ -36,6 +36,9 @@ except ImportError:
 from data_visualizer.db_manager import DBManager
 from data_visualizer.utils import db_connect
 from data_visualizer.config import DB_PATHS, project_root
+# 紧凑存储格式的标注结果需要按诗词原文还原
+from src.annotation_codec import is_compact, decode_compact, load_emotion_names
+from src.sentence_projection import project_sentences
 
 # 从主项目配置管理器获取情感分类XML文件路径
 try:
@@ -93,73 +96,72 @@ def populate_emotion_categories(conn: sqlite3.Connection, categories_data: List[
         raise
 
 
-def migrate_annotations(conn: sqlite3.Connection):
-    """迁移旧的标注数据到新表结构，确保数据完整性。"""
+def migrate_annotations(conn: sqlite3.Connection, rebuild: bool = False, batch_size: int = 1000):
+    """
+    一次性回填句子级标注表：只为尚无句子记录的成功标注生成 sentence_annotations / sentence_emotion_links。
+    新保存的标注由 DataManager 在写入时同步投影，因此重复运行的耗时与待回填数量成正比，而不是与语料规模成正比。
+
+    :param rebuild: 清空句子级表后全部重建（用于修复被手工改动的数据）
+    """
     cursor = conn.cursor()
-    
-    # 检查是否有需要迁移的数据
-    cursor.execute(
-        "SELECT COUNT(*) FROM annotations WHERE status = 'completed' AND annotation_result IS NOT NULL"
-    )
-    pending_migrations = cursor.fetchone()[0]
-    
-    if pending_migrations == 0:
-        logger.info("没有需要迁移的标注数据。")
-        return
-    
-    # 检查是否已经迁移过数据
-    cursor.execute("SELECT COUNT(*) FROM sentence_annotations")
-    already_migrated = cursor.fetchone()[0]
-    
-    if already_migrated > 0:
-        logger.info("sentence_annotations 表已包含数据，为了确保数据一致性，将重新执行迁移。")
-        # 清空现有的迁移数据
+
+    if rebuild:
+        logger.info("清空句子级标注表，将全部重建...")
         cursor.execute("DELETE FROM sentence_emotion_links")
         cursor.execute("DELETE FROM sentence_annotations")
         conn.commit()
-    
-    logger.info("开始迁移历史标注数据...")
+
+    emotion_names = load_emotion_names(cursor)
     cursor.execute(
-        "SELECT id, poem_id, annotation_result FROM annotations WHERE status = 'completed' AND annotation_result IS NOT NULL"
+        """
+        SELECT a.id, a.poem_id, a.annotation_result,
+            CASE WHEN typeof(a.annotation_result) = 'blob' THEN p.paragraphs END
+        FROM annotations a
+        LEFT JOIN poems p ON p.id = a.poem_id
+        WHERE a.status = 'completed' AND a.annotation_result IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM sentence_annotations sa WHERE sa.annotation_id = a.id)
+        """
     )
-    annotations_to_migrate = cursor.fetchall()
-    
-    migration_count = 0
+
+    write_cursor = conn.cursor()
+    annotation_count = 0
+    sentence_count = 0
     try:
-        for ann_id, poem_id, ann_result_json in annotations_to_migrate:
-            if not ann_result_json:
-                continue
-            try:
-                sentences = json.loads(ann_result_json)
-                for sentence in sentences:
-                    cursor.execute(
-                        "INSERT INTO sentence_annotations (annotation_id, poem_id, sentence_uid, sentence_text) VALUES (?, ?, ?, ?)",
-                        (ann_id, poem_id, sentence.get('sentence_id'), sentence.get('sentence_text'))
-                    )
-                    sentence_ann_id = cursor.lastrowid
-                    if primary_emotion := sentence.get('primary_emotion'):
-                        cursor.execute(
-                            "INSERT INTO sentence_emotion_links (sentence_annotation_id, emotion_id, is_primary) VALUES (?, ?, ?)",
-                            (sentence_ann_id, primary_emotion, 1)
-                        )
-                    if secondary_emotions := sentence.get('secondary_emotions', []):
-                        for sec_emotion in secondary_emotions:
-                            cursor.execute(
-                                "INSERT INTO sentence_emotion_links (sentence_annotation_id, emotion_id, is_primary) VALUES (?, ?, ?)",
-                                (sentence_ann_id, sec_emotion, 0)
-                            )
-                    migration_count += 1
-            except json.JSONDecodeError:
-                logger.warning(f"无法解析 annotation_id={ann_id} 的JSON数据，跳过。")
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            projections = []
+            for ann_id, poem_id, ann_result_json, paragraphs_json in batch:
+                try:
+                    if is_compact(ann_result_json):
+                        sentences = decode_compact(ann_result_json, emotion_names, json.loads(paragraphs_json or '[]'))
+                    else:
+                        sentences = json.loads(ann_result_json)
+                except json.JSONDecodeError:
+                    logger.warning(f"无法解析 annotation_id={ann_id} 的JSON数据，跳过。")
+                    continue
+                except (KeyError, IndexError, ValueError) as e:
+                    logger.warning(f"无法还原 annotation_id={ann_id} 的紧凑标注数据 ({e})，跳过。")
+                    continue
+                projections.append((ann_id, poem_id, sentences))
+            # 只处理尚无句子记录的标注，无需先删除
+            sentence_count += project_sentences(write_cursor, projections, replace=False)
+            annotation_count += len(projections)
         conn.commit()
-        logger.info(f"成功迁移 {len(annotations_to_migrate)} 条标注记录，共处理 {migration_count} 条句子情感数据。")
     except sqlite3.Error as e:
-        logger.error(f"迁移过程中发生数据库错误: {e}")
+        logger.error(f"回填过程中发生数据库错误: {e}")
         conn.rollback()
         raise
 
+    if annotation_count:
+        logger.info(f"成功回填 {annotation_count} 条标注记录，共写入 {sentence_count} 条句子情感数据。")
+    else:
+        logger.info("所有成功的标注均已有句子级记录，无需回填。")
+
 
-def setup_for_db(db_key: str, db_path: str, categories_data: List[Tuple[str, str, str, str, int]]) -> bool:
+def setup_for_db(db_key: str, db_path: str, categories_data: List[Tuple[str, str, str, str, int]],
+                 rebuild: bool = False) -> bool:
     """为指定的数据库执行完整的设置和迁移过程。"""
     logger.info(f"--- 开始为数据库 '{db_key}' 进行设置与数据迁移 ---")
     
@@ -187,7 +189,7 @@ def setup_for_db(db_key: str, db_path: str, categories_data: List[Tuple[str, str
         conn = db_connect(abs_db_path)
         # 步骤 2 & 3: 填充数据和迁移
         populate_emotion_categories(conn, categories_data)
-        migrate_annotations(conn)
+        migrate_annotations(conn, rebuild=rebuild)
         logger.info(f"--- 数据库 '{db_key}' 设置与数据迁移完成 ---")
         return True
     except Exception as e:
@@ -279,7 +281,7 @@ def initialize_database_schema(db_path: str):
             conn.close()
 
 
-def setup_all_databases(db_paths: Dict[str, str]) -> Dict[str, bool]:
+def setup_all_databases(db_paths: Dict[str, str], rebuild: bool = False) -> Dict[str, bool]:
     """为所有配置的数据库执行设置和迁移过程。"""
     # 解析情感分类数据（只需要解析一次）
     categories_data = parse_emotion_categories(XML_PATH)
@@ -290,7 +292,7 @@ def setup_all_databases(db_paths: Dict[str, str]) -> Dict[str, bool]:
     # 为每个数据库执行设置
     for db_key, db_path in db_paths.items():
         try:
-            results[db_key] = setup_for_db(db_key, db_path, categories_data)
+            results[db_key] = setup_for_db(db_key, db_path, categories_data, rebuild=rebuild)
         except Exception as e:
             logger.error(f"为数据库 '{db_key}' 设置时发生未预期的错误: {e}", exc_info=True)
             results[db_key] = False
@@ -307,6 +309,11 @@ def main():
         choices=list(DB_PATHS.keys()),
         help=f"指定要设置的单个数据库。可选: {', '.join(DB_PATHS.keys())}。如果未提供，则设置所有数据库。"
     )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="清空并全部重建句子级标注表（默认只回填尚无句子记录的标注）。"
+    )
     args = parser.parse_args()
 
     if args.db:
@@ -317,7 +324,7 @@ def main():
             return
             
         categories_data = parse_emotion_categories(XML_PATH)
-        success = setup_for_db(args.db, db_path, categories_data)
+        success = setup_for_db(args.db, db_path, categories_data, rebuild=args.rebuild)
         if success:
             logger.info(f"数据库 '{args.db}' 设置完成。")
         else:
@@ -325,7 +332,7 @@ def main():
     else:
         # 如果用户未指定，则处理所有已定义的数据库
         logger.info("未指定特定数据库，将为 config.py 中定义的所有数据库执行设置...")
-        results = setup_all_databases(DB_PATHS)
+        results = setup_all_databases(DB_PATHS, rebuild=args.rebuild)
         
         # 输出结果摘要
         successful = [db for db, success in results.items() if success]
@@ -5,6 +5,8 @@ import logging
 import asyncio
 import time
 import os
+import uuid
+from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
@@ -17,6 +19,8 @@ from llm_factory import LLMFactory # 导入类而不是全局实例
 from config_manager import ConfigManager # 导入类而不是全局实例
 from label_parser import LabelParser # 导入类而不是全局实例
 from annotation_data_logger import AnnotationDataLogger
+from prompt_encoding import estimate_tokens
+from utils.loop_lag import EventLoopLagProbe
 
 logger = logging.getLogger(__name__)
 
@@ -45,10 +49,25 @@ class Annotator:
         self.retry_delay_multiplier = llm_config.get('retry_delay', 1)  # 作为指数退避的乘数
         self.retry_backoff_factor = llm_config.get('retry_backoff_factor', 2) # Tenacity的wait_random_exponential没有直接用backoff_factor，它是隐式的2，但我们可以保留这个配置项以备将来使用更复杂的策略
         self.retry_max_wait = llm_config.get('retry_max_wait', 60)
+        # 标注结果攒够多少条后批量写入数据库
+        self.save_batch_size = max(1, llm_config.get('save_batch_size', 20))
+
+        # --- 长诗分块配置（模型级，0 表示不启用对应阈值） ---
+        model_config = config_manager_instance.get_model_config(self.model_identifier)
+        self.chunk_max_sentences = int(model_config.get('chunk_max_sentences') or 0)
+        self.chunk_max_tokens = int(model_config.get('chunk_max_tokens') or 0)
+        self.chunk_overlap = int(model_config.get('chunk_overlap') or 2)
+        if self.chunk_max_sentences < 0 or self.chunk_max_tokens < 0 or self.chunk_overlap < 0:
+            raise ValueError(f"模型配置 '{self.model_identifier}' 的分块参数不能为负数")
+        # 同时进行中的LLM请求上限：在每次请求（而不是每首诗）时获取，
+        # 长诗的各个窗口与其他诗词共享 max_workers 个名额，重试等待期间不占用名额
+        self.request_slots = asyncio.Semaphore(self.max_workers)
         
         label_parser_instance: LabelParser = self.project_context.label_parser
         try:
             self.emotion_schema = label_parser_instance.get_categories_text()
+            # 提示词指纹随每个标注版本保存，用于对比不同提示词版本的结果
+            self.prompt_hash = self.llm_service.prompt_hash(self.emotion_schema)
             # INFO级别：记录对用户有意义的关键流程节点
             logger.info(f"成功加载情感分类体系 - 长度: {len(self.emotion_schema)} 字符")
         except Exception as e:
@@ -58,6 +77,11 @@ class Annotator:
             
         # INFO级别：初始化信息，简洁明了
         logger.info(f"初始化标注器: 模型配置='{self.model_identifier}', 并发数={self.max_workers}")
+        if self.chunk_max_sentences or self.chunk_max_tokens:
+            logger.info(
+                f"[{self.model_identifier}] 已启用长诗分块 - 每窗口最多句数: {self.chunk_max_sentences or '不限'}, "
+                f"最多token: {self.chunk_max_tokens or '不限'}, 重叠句数: {self.chunk_overlap}"
+            )
         
         # 直接使用全局日志记录器，不再尝试导入可能出错的批次日志
         self.model_logger = logger
@@ -65,9 +89,69 @@ class Annotator:
         # 初始化标注数据集合日志器
         self.annotation_data_logger = AnnotationDataLogger(self.model_identifier)
     
-    def _generate_sentences_with_id(self, paragraphs: List[str]) -> List[Dict[str, str]]:
+    @staticmethod
+    def new_run_id() -> str:
+        """生成一次标注运行的ID（时间 + 随机后缀），同一次运行保存的所有版本共享该ID"""
+        return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    def to_save_record(self, result: Dict[str, Any], run_id: Optional[str] = None) -> Dict[str, Any]:
+        """把单首诗的标注结果转为 DataManager.save_annotations 接受的记录，附带版本元数据"""
+        return {
+            'poem_id': result['poem_id'],
+            'model_identifier': self.model_identifier,
+            'status': result['status'],
+            'annotation_result': result.get('annotation_result'),
+            'error_message': result.get('error_message'),
+            'run_id': run_id,
+            'prompt_hash': self.prompt_hash,
+            'usage': result.get('usage'),
+            'source_hash': result.get('source_hash')
+        }
+
+    def _generate_sentences_with_id(self, paragraphs: List[str], offset: int = 0) -> List[Dict[str, str]]:
         """为句子生成ID并构建JSON格式"""
-        return [{"id": f"S{i+1}", "sentence": sentence} for i, sentence in enumerate(paragraphs)]
+        return [{"id": f"S{offset+i+1}", "sentence": sentence} for i, sentence in enumerate(paragraphs)]
+
+    def _plan_windows(self, paragraphs: List[str]) -> List[Tuple[int, int, int, int]]:
+        """
+        为长诗规划分块窗口。
+
+        先按句数/token阈值把全诗贪心切分为互不重叠的“核心区间”，
+        再向两侧各扩展 chunk_overlap 句作为上下文，得到实际发送的窗口。
+        未超过阈值的诗词返回单个覆盖全诗的窗口。
+
+        Returns:
+            [(window_start, window_end, core_start, core_end), ...]，均为左闭右开的句子下标。
+        """
+        total = len(paragraphs)
+        if total == 0:
+            return [(0, 0, 0, 0)]
+
+        sentence_tokens = [estimate_tokens(sentence) for sentence in paragraphs]
+        over_sentences = self.chunk_max_sentences and total > self.chunk_max_sentences
+        over_tokens = self.chunk_max_tokens and sum(sentence_tokens) > self.chunk_max_tokens
+        if not (over_sentences or over_tokens):
+            return [(0, total, 0, total)]
+
+        cores = []
+        start = 0
+        while start < total:
+            end = start + 1
+            tokens = sentence_tokens[start]
+            while end < total:
+                if self.chunk_max_sentences and end - start >= self.chunk_max_sentences:
+                    break
+                if self.chunk_max_tokens and tokens + sentence_tokens[end] > self.chunk_max_tokens:
+                    break
+                tokens += sentence_tokens[end]
+                end += 1
+            cores.append((start, end))
+            start = end
+
+        return [
+            (max(0, core_start - self.chunk_overlap), min(total, core_end + self.chunk_overlap), core_start, core_end)
+            for core_start, core_end in cores
+        ]
     
     def _validate_and_transform_response(
         self, 
@@ -122,7 +206,36 @@ class Annotator:
         
         return final_results
 
-    async def _annotate_single_poem(self, poem: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _as_samples(output: Any) -> List[Any]:
+        """将服务返回值统一为采样列表（多采样时为列表的列表，否则包装为单元素列表）"""
+        if isinstance(output, list) and output and all(isinstance(sample, list) for sample in output):
+            return output
+        return [output]
+
+    @staticmethod
+    def _primary_agreement(samples: List[List[Dict[str, Any]]], sentence_ids: Optional[set] = None) -> float:
+        """计算多个采样在主情感上完全一致的句子占比；单个采样视为完全一致"""
+        if len(samples) < 2:
+            return 1.0
+        primaries = [
+            {item.get('id'): item.get('primary') for item in sample if isinstance(item, dict)}
+            for sample in samples
+        ]
+        ids = sentence_ids if sentence_ids is not None else set(primaries[0].keys())
+        if not ids:
+            return 1.0
+        agreed = sum(1 for sentence_id in ids if len({p.get(sentence_id) for p in primaries}) == 1)
+        return agreed / len(ids)
+
+    async def annotate_with_agreement(self, poem: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        供级联等调度模式使用：标注单首诗词，结果中额外附带 'agreement'，
+        即模型配置 n>1 时多个采样的主情感一致率（n=1 时为 1.0）。
+        """
+        return await self._annotate_single_poem(poem, collect_samples=True)
+
+    async def _annotate_single_poem(self, poem: Dict[str, Any], collect_samples: bool = False) -> Dict[str, Any]:
         """标注单首诗词，包含完整的处理流程和重试逻辑"""
         poem_id = poem['id']
         # 记录开始处理某首诗的信息到模型特定日志
@@ -131,6 +244,8 @@ class Annotator:
         # 记录诗词内容到模型特定日志，便于调试
         # self.model_logger.debug(f"诗词ID {poem_id} 内容: {poem}")  # 已注释：不再使用模型特定日志
         logger.debug(f"诗词ID {poem_id} 内容: {poem}")
+        # 本首诗所有请求（含重试与分段窗口）的token用量，随结果一起保存到标注版本
+        usage = self.llm_service.track_usage()
         
         # --- Tenacity 重试策略保持不变 ---
         @retry(
@@ -141,17 +256,35 @@ class Annotator:
                 f"将在 {retry_state.next_action.sleep:.2f} 秒后进行第 {retry_state.attempt_number + 1} 次重试..."
             )
         )
-        async def _do_llm_call_with_retry():
-            return await self.llm_service.annotate_poem(
-                poem=poem,
-                emotion_schema=self.emotion_schema
-            )
+        async def _do_llm_call_with_retry(poem_part: Dict[str, Any]):
+            async with self.request_slots:
+                if collect_samples:
+                    return await self.llm_service.annotate_poem(
+                        poem=poem_part,
+                        emotion_schema=self.emotion_schema,
+                        return_samples=True
+                    )
+                return await self.llm_service.annotate_poem(
+                    poem=poem_part,
+                    emotion_schema=self.emotion_schema
+                )
         try:
-            # [关键修改] 使用 pybreaker.call_async 来包装带有 tenacity 重试的函数。
-            # - 如果 _do_llm_call_with_retry 成功, breaker 自动记录成功。
-            # - 如果 _do_llm_call_with_retry 失败 (所有重试后), breaker 自动记录失败并重新抛出异常。
-            # - 如果 breaker 已开启, call_async 会直接抛出 CircuitBreakerError。
-            llm_output_validated = await self.breaker.call_async(_do_llm_call_with_retry)
+            windows = self._plan_windows(poem['paragraphs'])
+            agreement = None
+            if len(windows) == 1:
+                # [关键修改] 使用 pybreaker.call_async 来包装带有 tenacity 重试的函数。
+                # - 如果 _do_llm_call_with_retry 成功, breaker 自动记录成功。
+                # - 如果 _do_llm_call_with_retry 失败 (所有重试后), breaker 自动记录失败并重新抛出异常。
+                # - 如果 breaker 已开启, call_async 会直接抛出 CircuitBreakerError。
+                llm_output_validated = await self.breaker.call_async(_do_llm_call_with_retry, poem)
+                if collect_samples:
+                    samples = self._as_samples(llm_output_validated)
+                    llm_output_validated = samples[0]
+                    agreement = self._primary_agreement(samples)
+            else:
+                llm_output_validated, agreement = await self._annotate_windows(
+                    poem, windows, _do_llm_call_with_retry, collect_samples
+                )
             
             # 记录LLM原始输出到模型特定日志
             # self.model_logger.debug(f"诗词ID {poem_id} LLM原始输出: {llm_output_validated}")  # 已注释：不再使用模型特定日志
@@ -173,7 +306,10 @@ class Annotator:
                 'poem_id': poem_id, 
                 'status': 'completed', 
                 'annotation_result': json.dumps(final_results, ensure_ascii=False),
-                'error_message': None
+                'error_message': None,
+                'agreement': agreement,
+                'usage': usage or None,
+                'source_hash': poem.get('content_hash')
             }
             
         except pybreaker.CircuitBreakerError as e:
@@ -203,7 +339,9 @@ class Annotator:
                 'poem_id': poem_id, 
                 'status': 'failed',
                 'annotation_result': None, 
-                'error_message': f"Circuit breaker is open: {e}"
+                'error_message': f"Circuit breaker is open: {e}",
+                'usage': usage or None,
+                'source_hash': poem.get('content_hash')
             }
         except Exception as e:
             # 这个块会捕获从 _do_llm_call_with_retry (通过 tenacity 和 pybreaker) 抛出的最终异常
@@ -232,15 +370,80 @@ class Annotator:
                 'poem_id': poem_id, 
                 'status': 'failed',
                 'annotation_result': None, 
-                'error_message': str(e)
+                'error_message': str(e),
+                'usage': usage or None,
+                'source_hash': poem.get('content_hash')
             }
 
+    async def _annotate_windows(self, poem: Dict[str, Any],
+                                windows: List[Tuple[int, int, int, int]],
+                                call_with_retry,
+                                collect_samples: bool = False) -> Tuple[List[Dict[str, Any]], Optional[float]]:
+        """
+        并行标注长诗的各个窗口并确定性地合并结果。
+
+        每个窗口独立经过重试与熔断器，与其他诗词共享请求名额（request_slots）和速率限制器；
+        窗口内的句子ID沿用全诗编号。合并时每句只取其“核心区间”所在窗口的标注，
+        重叠部分仅作为上下文，因此结果与窗口完成顺序无关。
+        任一窗口最终失败，立即取消其余尚未完成的窗口，整首诗视为失败。
+
+        Returns:
+            (合并后的标注列表, 各窗口核心区间主情感一致率的最小值；未收集采样时为 None)
+        """
+        poem_id = poem['id']
+        paragraphs = poem['paragraphs']
+        logger.info(f"诗词ID {poem_id} 共 {len(paragraphs)} 句，拆分为 {len(windows)} 个窗口并行标注")
+
+        # 只复制服务层需要的字段：dict(poem) 会读取 author_desc，使模板不引用作者简介时也加载整个作者表
+        base_poem = {key: poem.get(key) for key in ('id', 'title', 'author', 'content_hash')}
+        if 'author_desc' in self.llm_service.user_prompt_fields:
+            base_poem['author_desc'] = poem.get('author_desc')
+        window_poems = []
+        for window_start, window_end, _, _ in windows:
+            window_poem = dict(base_poem)
+            window_poem['paragraphs'] = paragraphs[window_start:window_end]
+            window_poem['sentence_id_offset'] = window_start
+            window_poems.append(window_poem)
+
+        window_tasks = [
+            asyncio.ensure_future(self.breaker.call_async(call_with_retry, window_poem)) for window_poem in window_poems
+        ]
+        try:
+            outputs = await asyncio.gather(*window_tasks)
+        except BaseException:
+            # gather 不会取消其余任务：一个窗口失败（或整首诗被取消）后不再为其余窗口发送/等待请求
+            for task in window_tasks:
+                task.cancel()
+            await asyncio.gather(*window_tasks, return_exceptions=True)
+            raise
+
+        merged = []
+        agreement = None
+        for (window_start, window_end, core_start, core_end), output, window_poem in zip(windows, outputs, window_poems):
+            core_ids = {f"S{i+1}" for i in range(core_start, core_end)}
+            if collect_samples:
+                samples = self._as_samples(output)
+                output = samples[0]
+                window_agreement = self._primary_agreement(samples, core_ids)
+                agreement = window_agreement if agreement is None else min(agreement, window_agreement)
+            window_sentences = self._generate_sentences_with_id(window_poem['paragraphs'], window_start)
+            # 复用业务层验证，确保每个窗口返回的ID与其输入完全一致
+            self._validate_and_transform_response(window_sentences, output)
+            merged.extend(item for item in output if item['id'] in core_ids)
+
+        logger.debug(f"诗词ID {poem_id} 的 {len(windows)} 个窗口已合并，共 {len(merged)} 条标注")
+        return merged, agreement
+
     async def run(self, limit: Optional[int] = None, 
                   start_id: Optional[int] = None, 
                   end_id: Optional[int] = None,
                   force_rerun: bool = False,
-                  poem_ids: Optional[List[int]] = None) -> Dict[str, Any]:
-        """异步运行指定模型的所有标注任务"""
+                  poem_ids: Optional[List[int]] = None,
+                  only_stale: bool = False) -> Dict[str, Any]:
+        """
+        异步运行指定模型的所有标注任务。
+        only_stale 时只重新标注成功结果已过期（原文或提示词指纹已变化）的诗词。
+        """
         start_time = time.time()
         
         # INFO级别：任务启动信息，对用户清晰展示任务参数。
@@ -251,57 +454,132 @@ class Annotator:
         
         # 从项目上下文获取 DataManager 实例
         data_manager: DataManager = self.project_context.get_data_manager()
+        # 数据库读写均在 DataManager 的专用线程中进行，避免阻塞正在进行的HTTP请求
+        if poem_ids is None and only_stale:
+            poem_ids = await data_manager.run_in_db_thread(
+                data_manager.get_stale_poem_ids, self.model_identifier, self.prompt_hash,
+                limit=limit, start_id=start_id, end_id=end_id
+            )
+            logger.info(f"[{self.model_identifier}] 找到 {len(poem_ids)} 首标注已过期的诗词（原文或提示词已变化）")
         if poem_ids is not None:
-            poems = data_manager.get_poems_by_ids(poem_ids)
+            poems = await data_manager.run_in_db_thread(data_manager.get_poems_by_ids, poem_ids)
+            total_poems = len(poems)
         else:
-            poems = data_manager.get_poems_to_annotate(
-                model_identifier=self.model_identifier,
-                limit=limit, start_id=start_id, end_id=end_id, force_rerun=force_rerun
+            poems = None
+            # 强制重跑时不经过待标注队列，总数未知（进度条只显示已处理数量）
+            total_poems = None if force_rerun else await data_manager.run_in_db_thread(
+                data_manager.count_pending, self.model_identifier, start_id=start_id, end_id=end_id
             )
-            
-        if not poems:
+            if total_poems is not None and limit:
+                total_poems = min(total_poems, limit)
+
+        if total_poems == 0:
             # INFO级别：告知用户没有待处理项，是重要的流程状态。
             logger.info(f"[{self.model_identifier}] 没有找到待标注的诗词。")
             # self.model_logger.info("没有找到待标注的诗词。")  # 已注释：不再使用模型特定日志
             return {'total': 0, 'completed': 0, 'failed': 0, 'model': self.model_identifier}
         
-        total_poems = len(poems)
         # INFO级别：告知用户待处理项总数，是重要的流程状态。
-        logger.info(f"[{self.model_identifier}] 找到 {total_poems} 首待标注诗词，并发数: {self.max_workers}")
+        logger.info(f"[{self.model_identifier}] 找到 {total_poems if total_poems is not None else '若干'} 首待标注诗词，并发数: {self.max_workers}")
         # self.model_logger.info(f"找到 {total_poems} 首待标注诗词，并发数: {self.max_workers}")  # 已注释：不再使用模型特定日志
         
-        semaphore = asyncio.Semaphore(self.max_workers)
-        
-        async def work_unit(poem):
-            async with semaphore:
-                return await self._annotate_single_poem(poem)
+        run_id = self.new_run_id()
+        logger.info(f"[{self.model_identifier}] 运行ID: {run_id}, 提示词指纹: {self.prompt_hash}")
 
-        tasks = [work_unit(poem) for poem in poems]
-        
-        completed_count, failed_count = 0, 0
-        
-        progress_bar = tqdm(total=total_poems, desc=f"标注中 ({self.model_identifier})", unit="首")
-        for future in asyncio.as_completed(tasks):
-            result = await future
-            
-            # 保存标注结果
-            data_manager.save_annotation(
-                poem_id=result['poem_id'],
-                model_identifier=self.model_identifier,
-                status=result['status'],
-                annotation_result=result.get('annotation_result'),
-                error_message=result.get('error_message')
-            )
-            
-            if result['status'] == 'completed':
-                completed_count += 1
+        # 读取与标注流水线进行：生产者边分页读取边放入有界队列，内存中最多只有 2×max_workers 首等待中的诗词；
+        # max_workers 个工作协程逐首标注，结果交给下方的主循环统一计数和批量保存
+        poem_queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_workers * 2)
+        result_queue: asyncio.Queue = asyncio.Queue()
+
+        async def producer():
+            if poems is not None:
+                for poem in poems:
+                    await poem_queue.put(poem)
             else:
-                failed_count += 1
-                
-            progress_bar.set_postfix({'成功': completed_count, '失败': failed_count})
-            progress_bar.update(1)
-        
-        progress_bar.close()
+                async for poem in data_manager.stream_pending(
+                    self.model_identifier,
+                    limit=limit, start_id=start_id, end_id=end_id, force_rerun=force_rerun
+                ):
+                    await poem_queue.put(poem)
+            for _ in range(self.max_workers):
+                await poem_queue.put(None)
+
+        async def worker():
+            while True:
+                poem = await poem_queue.get()
+                if poem is None:
+                    return
+                await result_queue.put(await self._annotate_single_poem(poem))
+
+        processed, completed_count, failed_count = 0, 0, 0
+        pending_saves: List[Dict[str, Any]] = []
+
+        async def flush():
+            # 保存失败时整批保留（事务未提交，诗词仍在待标注队列中），下一次保存时一起重试
+            nonlocal pending_saves
+            if not pending_saves:
+                return
+            saved = await data_manager.save_annotations(pending_saves)
+            if saved == len(pending_saves):
+                pending_saves = []
+            else:
+                logger.warning(f"[{self.model_identifier}] {len(pending_saves)} 条标注结果保存失败，将在下一次保存时重试")
+
+        lag_probe = EventLoopLagProbe()
+        lag_probe.start()
+        progress_bar = tqdm(total=total_poems, desc=f"标注中 ({self.model_identifier})", unit="首")
+        producer_task = asyncio.ensure_future(producer())
+        worker_tasks = [asyncio.ensure_future(worker()) for _ in range(self.max_workers)]
+        all_tasks = asyncio.gather(producer_task, *worker_tasks)
+        # 生产者和工作协程全部结束（或其中之一出错）后，用 None 通知主循环停止
+        all_tasks.add_done_callback(lambda _: result_queue.put_nowait(None))
+        try:
+            while True:
+                result = await result_queue.get()
+                if result is None:
+                    break
+                processed += 1
+
+                # 保存标注结果：攒够一批后在数据库线程中一次性提交
+                pending_saves.append(self.to_save_record(result, run_id))
+                if len(pending_saves) >= self.save_batch_size:
+                    await flush()
+
+                if result['status'] == 'completed':
+                    completed_count += 1
+                else:
+                    failed_count += 1
+
+                progress_bar.set_postfix({'成功': completed_count, '失败': failed_count})
+                progress_bar.update(1)
+            # 读取诗词出错时在此抛出
+            await all_tasks
+        finally:
+            # 出错、取消或 Ctrl-C 时也先停止其余请求，再保存已经得到的结果。
+            # 生产者出错时 gather 已经结束，取消它不会传递到仍在运行的工作协程，因此逐个取消
+            for task in (producer_task, *worker_tasks):
+                task.cancel()
+            await asyncio.gather(producer_task, *worker_tasks, return_exceptions=True)
+            progress_bar.close()
+            # 主循环退出后工作协程仍可能放入结果，一并保存
+            while not result_queue.empty():
+                result = result_queue.get_nowait()
+                if result is not None:
+                    pending_saves.append(self.to_save_record(result, run_id))
+            await flush()
+            if pending_saves:
+                logger.error(
+                    f"[{self.model_identifier}] {len(pending_saves)} 条标注结果最终未能保存，"
+                    f"这些诗词将在下次运行时重新标注: {[record['poem_id'] for record in pending_saves]}"
+                )
+            await lag_probe.stop()
+
+        if processed == 0:
+            logger.info(f"[{self.model_identifier}] 没有找到待标注的诗词。")
+            return {'total': 0, 'completed': 0, 'failed': 0, 'model': self.model_identifier}
+        total_poems = processed
+        lag = lag_probe.summary()
+        logger.debug(f"[{self.model_identifier}] 事件循环延迟 - 平均: {lag['mean_lag_ms']:.2f}ms, 最大: {lag['max_lag_ms']:.2f}ms")
         execution_time = time.time() - start_time
         
         success_rate = (completed_count / total_poems * 100) if total_poems > 0 else 0
@@ -330,6 +608,8 @@ class Annotator:
             'completed': completed_count,
             'failed': failed_count,
             'model': self.model_identifier,
+            'run_id': run_id,
+            'unsaved': len(pending_saves),
             'execution_time': execution_time,
             'success_rate': success_rate
         }
@@ -2,28 +2,100 @@ import sqlite3
 import json
 import os
 import logging
+import asyncio
+import functools
+import hashlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Iterable, Iterator, Tuple
 from datetime import datetime
 
 # 使用绝对导入，因为此模块将被动态加载，不再是包的一部分
-from db_adapter import get_database_adapter, normalize_poem_data
+from db_adapter import get_database_adapter, normalize_poem_data, poem_content_hash, normalize_search_text, normalized_text_sql, recount_counters
+from agreement import primary_labels_from_result, sentence_agreement, primary_entropy
+from annotation_codec import collect_emotions, encode_compact, decode_compact, rehydrate, is_compact
+from result_exporter import open_export_writer, load_manifest, write_manifest, EXPORT_FORMATS, COLUMNAR_FORMATS, MANIFEST_VERSION
+from sentence_projection import project_sentences
+from poem_record import PoemRecord, AuthorDescriptions, POEM_RECORD_COLUMNS, poem_records
+
+
+# poem_agreement 表在 change_cursors 中使用的消费者名
+AGREEMENT_CONSUMER = 'poem_agreement'
+
+
+def _normalize_poem(poem_data: Dict[str, Any]) -> tuple:
+    """
+    把原始诗词字典规范化为 (title, author, paragraphs_json, full_text, author_desc, content_hash)。
+    title/rhythmic 的差异在此直接处理，不复制字典；content_hash 用于识别内容变化。
+    """
+    paragraphs = poem_data.get('paragraphs') or []
+    title = poem_data['title'] if 'title' in poem_data else poem_data.get('rhythmic', '')
+    author = poem_data.get('author', '')
+    full_text = '\n'.join(paragraphs)
+    content_hash = poem_content_hash(title, author, full_text)
+    return (
+        title,
+        author,
+        json.dumps(paragraphs, ensure_ascii=False),
+        full_text,
+        poem_data.get('author_desc', ''),
+        content_hash
+    )
+
+
+def _parse_poem_file(json_file: str) -> Tuple[List[tuple], Optional[str]]:
+    """
+    [子进程] 读取并规范化一个诗词JSON文件。
+    返回 (规范化后的行列表, 错误信息)，出错时行列表为空。
+    """
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [_normalize_poem(poem_data) for poem_data in data], None
+    except Exception as e:
+        return [], str(e)
+
+
+def _read_json_list(json_file: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """[子进程] 读取一个JSON数组文件，返回 (数据, 错误信息)"""
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            return json.load(f), None
+    except Exception as e:
+        return [], str(e)
 
 
 class DataManager:
     """数据管理器，负责数据库操作和数据预处理"""
     
-    def __init__(self, db_path: str, source_dir: str, output_dir: str, db_name_alias: str = "default"):
+    ANNOTATION_STORAGE_MODES = ('json', 'compact')
+
+    def __init__(self, db_path: str, source_dir: str, output_dir: str, db_name_alias: str = "default",
+                 annotation_storage: str = "json"):
         self.db_path = db_path
         self.source_dir = source_dir
         self.output_dir = output_dir
         self.db_name = db_name_alias # 用于ID前缀设置和日志记录
+        if annotation_storage not in self.ANNOTATION_STORAGE_MODES:
+            raise ValueError(f"不支持的标注存储格式: {annotation_storage}。支持的格式: {list(self.ANNOTATION_STORAGE_MODES)}")
+        # 新写入的标注结果使用的存储格式；读取时两种格式均透明支持
+        self.annotation_storage = annotation_storage
 
         self.logger = logging.getLogger(__name__)
         self.logger.info(f"数据管理器初始化 - 数据库: {self.db_path}, 数据源: {self.source_dir}, 输出: {self.output_dir}")
         
         # 初始化数据库适配器
         self.db_adapter = get_database_adapter('sqlite', self.db_path)
+        # 异步接口使用的专用数据库线程（懒加载），所有异步读写在此线程内串行执行
+        self._db_executor: Optional[ThreadPoolExecutor] = None
+        # 已确认登记到待标注队列的模型
+        self._queue_models: set = set()
+        # 情感ID驻留编码缓存 (emotion_codes 表)
+        self._emotion_codes: Dict[str, int] = {}
+        self._emotion_names: Dict[int, str] = {}
+        # 作者简介映射：待标注诗词不再 JOIN authors，提示词需要时才一次性加载
+        self._author_descriptions = AuthorDescriptions(self._load_author_descriptions)
         self._init_database()
         
         # 为不同数据库设置ID前缀，确保全局唯一性
@@ -79,32 +151,62 @@ class DataManager:
         self.logger.debug(f"JSON文件 {json_file} 加载完成，包含 {len(data)} 条记录")
         return data
     
-    def load_all_json_files(self) -> List[Dict[str, Any]]:
-        """加载所有JSON文件的数据 - [修改] 适配唐诗/宋诗文件格式"""
+    def find_poem_json_files(self) -> List[Path]:
+        """查找数据源目录下所有 poet.*.*.json 和 ci.*.*.json 文件（按文件名排序）"""
         source_path = Path(self.source_dir)
         if not source_path.exists():
             raise FileNotFoundError(f"数据源目录不存在: {source_path}")
-        
-        all_data = []
-        
-        # [修改] 查找所有 poet.*.*.json 和 ci.*.*.json 文件
+
         poet_files = list(source_path.glob('poet.*.*.json'))
         ci_files = list(source_path.glob('ci.*.*.json'))
-        json_files = poet_files + ci_files
-        json_files.sort()  # 确保按文件名排序
-        
+        json_files = sorted(poet_files + ci_files)  # 确保按文件名排序
+
         self.logger.info(f"找到 {len(json_files)} 个JSON文件 ({len(poet_files)} 个poet文件, {len(ci_files)} 个ci文件)")
-        
+        return json_files
+
+    def iter_poems_from_json_files(self, json_files: Optional[List[Path]] = None) -> Iterator[Dict[str, Any]]:
+        """逐个文件读取诗词并逐首产出，内存中同时只保留一个文件的数据"""
+        if json_files is None:
+            json_files = self.find_poem_json_files()
         for json_file in json_files:
             try:
                 self.logger.debug(f"处理文件: {json_file.name}")
                 with open(json_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                all_data.extend(data)
-                self.logger.debug(f"文件 {json_file.name} 处理完成，包含 {len(data)} 条记录")
             except Exception as e:
                 self.logger.error(f"处理文件 {json_file.name} 时出错: {e}")
-        
+                continue
+            self.logger.debug(f"文件 {json_file.name} 读取完成，包含 {len(data)} 条记录")
+            yield from data
+
+    def _map_files(self, func: Callable, files: List[Path], workers: Optional[int] = None) -> Iterator[Tuple[Path, Any]]:
+        """
+        在进程池中对文件列表执行 func，并按文件顺序产出 (文件, 结果)。
+        保持顺序是为了让后续的ID分配与单进程时完全一致。workers<=1 或只有一个文件时在当前进程执行。
+        """
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(files) <= 1:
+            for path in files:
+                yield path, func(str(path))
+            return
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            yield from zip(files, executor.map(func, [str(path) for path in files], chunksize=4))
+
+    def iter_normalized_poem_rows(self, json_files: Optional[List[Path]] = None,
+                                  workers: Optional[int] = None) -> Iterator[tuple]:
+        """在多个进程中并行解析并规范化诗词文件，按文件顺序逐行产出规范化结果"""
+        if json_files is None:
+            json_files = self.find_poem_json_files()
+        for json_file, (rows, error) in self._map_files(_parse_poem_file, json_files, workers):
+            if error:
+                self.logger.error(f"处理文件 {json_file.name} 时出错: {error}")
+                continue
+            self.logger.debug(f"文件 {json_file.name} 解析完成，包含 {len(rows)} 条记录")
+            yield from rows
+
+    def load_all_json_files(self) -> List[Dict[str, Any]]:
+        """加载所有JSON文件的数据 - [修改] 适配唐诗/宋诗文件格式"""
+        all_data = list(self.iter_poems_from_json_files())
         self.logger.info(f"所有JSON文件加载完成，总计 {len(all_data)} 条记录")
         return all_data
     
@@ -127,14 +229,12 @@ class DataManager:
 
         self.logger.info(f"找到 {len(author_files)} 个作者文件: {[f.name for f in author_files]}")
 
-        for author_file in author_files:
-            try:
-                with open(author_file, 'r', encoding='utf-8') as f:
-                    authors = json.load(f)
-                all_authors.extend(authors)
-                self.logger.info(f"从 {author_file.name} 加载了 {len(authors)} 位作者信息。")
-            except Exception as e:
-                self.logger.error(f"加载作者文件 {author_file.name} 时出错: {e}")
+        for author_file, (authors, error) in self._map_files(_read_json_list, author_files):
+            if error:
+                self.logger.error(f"加载作者文件 {author_file.name} 时出错: {error}")
+                continue
+            all_authors.extend(authors)
+            self.logger.info(f"从 {author_file.name} 加载了 {len(authors)} 位作者信息。")
         
         self.logger.info(f"所有作者文件加载完成，总计加载了 {len(all_authors)} 位作者信息。")
         return all_authors
@@ -143,153 +243,457 @@ class DataManager:
         """批量插入作者信息 - [修改] 适配新的 'desc' 字段"""
         from datetime import datetime, timezone, timedelta
         self.logger.info(f"开始批量插入 {len(authors_data)} 位作者信息...")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
 
-        inserted_count = 0
         tz = timezone(timedelta(hours=8))  # 东八区
         now = datetime.now(tz).isoformat()
-        for author_data in authors_data:
-            try:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO authors 
-                    (name, description, short_description, created_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    author_data.get('name', ''),
-                    author_data.get('desc', ''),  # [修改] 使用 'desc' 字段
-                    author_data.get('short_description', ''), # 新格式无此字段，优雅降级
-                    now
-                ))
-                inserted_count += 1
-            except Exception as e:
-                self.logger.error(f"插入作者 {author_data.get('name', 'Unknown')} 时出错: {e}")
+        rows = [
+            (
+                author_data.get('name', ''),
+                author_data.get('desc', ''),  # [修改] 使用 'desc' 字段
+                author_data.get('short_description', ''), # 新格式无此字段，优雅降级
+                now
+            )
+            for author_data in authors_data
+        ]
 
-        conn.commit()
-        conn.close()
+        conn = self.db_adapter.connect()
+        try:
+            # UPSERT 而非 INSERT OR REPLACE：覆盖已有作者时不删除旧行，计数触发器保持准确
+            conn.executemany('''
+                INSERT INTO authors 
+                (name, description, short_description, created_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    description = excluded.description,
+                    short_description = excluded.short_description,
+                    created_at = excluded.created_at
+            ''', rows)
+            conn.commit()
+        finally:
+            conn.close()
 
-        self.logger.info(f"作者信息插入完成，成功插入 {inserted_count} 位作者")
-        return inserted_count
+        self._author_descriptions.invalidate()
+        self.logger.info(f"作者信息插入完成，成功插入 {len(rows)} 位作者")
+        return len(rows)
     
-    def batch_insert_poems(self, poems_data: List[Dict[str, Any]], start_id: Optional[int] = None) -> int:
-        """批量插入诗词到数据库 - [修改] 适配 'title' 字段"""
+    # 批量导入时使用的PRAGMA：关闭fsync并加大缓存，导入结束后连接即关闭，不影响常规连接
+    BULK_LOAD_PRAGMAS = {
+        'synchronous': 'OFF',
+        'cache_size': -262144,  # 256MB
+        'temp_store': 'MEMORY',
+    }
+
+    def stream_insert_poems(self, poems: Iterable[Dict[str, Any]], start_id: Optional[int] = None,
+                            chunk_size: int = 20000) -> int:
+        """流式批量导入诗词字典（在当前进程中规范化）"""
+        return self.bulk_insert_poem_rows((_normalize_poem(poem_data) for poem_data in poems),
+                                          start_id=start_id, chunk_size=chunk_size)
+
+    # 诗词UPSERT：按ID原地更新，内容哈希未变化的行不改写（保留 updated_at，标注不受影响）
+    _UPSERT_POEM_SQL = '''
+        INSERT INTO poems 
+        (id, title, author, paragraphs, full_text, author_desc, content_hash, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            title = excluded.title,
+            author = excluded.author,
+            paragraphs = excluded.paragraphs,
+            full_text = excluded.full_text,
+            author_desc = excluded.author_desc,
+            content_hash = excluded.content_hash,
+            updated_at = excluded.updated_at
+        WHERE poems.content_hash IS NOT excluded.content_hash
+    '''
+
+    @contextmanager
+    def _bulk_load_connection(self, drop_indexes: bool = True):
+        """
+        提供一个用于批量导入的连接：使用面向批量导入的PRAGMA，
+        drop_indexes 时在导入期间删除 poems 表上的二级索引，结束后（无论成功与否）重建。
+        """
+        conn = self.db_adapter.connect()
+        for name, value in self.BULK_LOAD_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+        # 只处理显式创建的索引（sql 为空的是主键等自动索引）
+        indexes = []
+        if drop_indexes:
+            indexes = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'poems' AND sql IS NOT NULL"
+            ).fetchall()
+        try:
+            for index_name, _ in indexes:
+                conn.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+            yield conn
+        except Exception:
+            conn.rollback() # 丢弃未完成的块，已提交的块保留
+            raise
+        finally:
+            for _, index_sql in indexes:
+                conn.execute(index_sql)
+            conn.commit()
+            conn.execute("PRAGMA optimize")
+            conn.close()
+
+    def bulk_insert_poem_rows(self, rows: Iterable[tuple], start_id: Optional[int] = None,
+                              chunk_size: int = 20000) -> int:
+        """
+        由单一写入者导入已规范化的诗词行：按块 executemany，每块一个事务。
+        ID 按行的顺序依次分配为 id_prefix + current_id，与输入来源（单进程或进程池）无关。
+        用于向空的ID区间整体导入；更新已有语料请使用 ingest_incremental（按内容与标题/作者匹配原有ID）。
+        """
         from datetime import datetime, timezone, timedelta
-        self.logger.info(f"开始批量插入 {len(poems_data)} 首诗词...")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        from itertools import islice
+        tz = timezone(timedelta(hours=8))
+        now = datetime.now(tz).isoformat()
+        first_id = self.id_prefix + (start_id or 1)
+        overwrite = bool(self.db_adapter.execute_query("SELECT 1 FROM poems WHERE id >= ? LIMIT 1", (first_id,)))
+        if overwrite:
+            self.logger.warning(
+                f"ID {first_id} 之后已有诗词，将按行号覆盖；原文变化的诗词会重新入队，其原有标注成为过期标注"
+            )
+        id_rows = ((first_id + offset, *row, now, now) for offset, row in enumerate(rows))
 
         inserted_count = 0
-        current_id = start_id or 1
+        with self._bulk_load_connection() as conn:
+            while True:
+                chunk = list(islice(id_rows, chunk_size))
+                if not chunk:
+                    break
+                if overwrite:
+                    self._preserve_compact_results(conn, ((row[0], row[6]) for row in chunk))
+                conn.executemany(self._UPSERT_POEM_SQL, chunk)
+                conn.commit()
+                inserted_count += len(chunk)
+                self.logger.debug(f"已导入 {inserted_count} 首诗词")
+
+        self.logger.info(f"诗词导入完成，成功插入 {inserted_count} 首诗词")
+        return inserted_count
+
+    @staticmethod
+    def _file_digest(path: Path) -> str:
+        """计算文件内容的MD5（分块读取）"""
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _match_existing_ids(self, conn, id_ranges: List[List[int]], rows: List[tuple]) -> Tuple[List[Optional[int]], int]:
+        """
+        为变化文件中的每一行找回其在原ID区间中的相对ID：先按 content_hash 匹配（内容未变），
+        再按 (title, author) 匹配（原文被修订）；都匹配不上的是新增诗词（None）。
+        文件中间插入或删除诗词不会使后续诗词的ID错位、让已有标注挂到别的诗词上。
+
+        :return: (每行的相对ID或None, 原区间中未被匹配的旧诗词数)
+        """
+        from collections import defaultdict, deque
+        by_hash: Dict[Any, deque] = defaultdict(deque)
+        by_name: Dict[Tuple[Any, Any], deque] = defaultdict(deque)
+        existing = 0
+        for start, end in id_ranges:
+            for poem_id, title, author, content_hash in conn.execute(
+                "SELECT id, title, author, content_hash FROM poems WHERE id BETWEEN ? AND ? ORDER BY id",
+                (self.id_prefix + start, self.id_prefix + end)
+            ):
+                relative_id = poem_id - self.id_prefix
+                by_hash[content_hash].append(relative_id)
+                by_name[(title, author)].append(relative_id)
+                existing += 1
+
+        ids: List[Optional[int]] = [None] * len(rows)
+        used = set()
+
+        def take(candidates: Optional[deque]) -> Optional[int]:
+            while candidates:
+                relative_id = candidates.popleft()
+                if relative_id not in used:
+                    used.add(relative_id)
+                    return relative_id
+            return None
+
+        # 行格式见 _normalize_poem: (title, author, paragraphs_json, full_text, author_desc, content_hash)
+        for i, row in enumerate(rows):
+            if row[5] is not None:
+                ids[i] = take(by_hash.get(row[5]))
+        for i, row in enumerate(rows):
+            if ids[i] is None:
+                ids[i] = take(by_name.get((row[0], row[1])))
+        return ids, existing - len(used)
+
+    def ingest_incremental(self, workers: Optional[int] = None) -> Dict[str, int]:
+        """
+        基于 ingest_manifest 表增量导入诗词：
+        - 大小和修改时间都未变化的文件直接跳过；只变了时间戳但内容哈希相同的文件只更新清单；
+        - 新文件在现有最大ID之后分配连续ID；
+        - 内容变化的文件逐首找回原有ID（见 _match_existing_ids，按内容或标题/作者匹配，而不是按行号），
+          内容未变的诗词不会改写，其标注保留；原文被修订的诗词原地更新并重新入队；
+          匹配不上的新诗词追加到末尾，并作为新的ID区间记入清单。
+        清单为空时（首次导入或旧数据库），按文件顺序从 id_prefix+1 开始分配，与全量导入的ID一致。
+
+        :return: {'new_files', 'changed_files', 'unchanged_files', 'poems'}
+        """
+        from datetime import datetime, timezone, timedelta
         tz = timezone(timedelta(hours=8))
         now = datetime.now(tz).isoformat()
 
-        for poem_data in poems_data:
-            # 标准化诗词数据，处理字段命名差异
-            normalized_data = normalize_poem_data(poem_data)
-            
-            paragraphs = normalized_data.get('paragraphs', [])
-            full_text = '\n'.join(paragraphs)
+        source_path = Path(self.source_dir)
+        json_files = self.find_poem_json_files()
+        manifest = {
+            row['file_path']: dict(row)
+            for row in self.db_adapter.execute_query("SELECT * FROM ingest_manifest")
+        }
 
-            # 使用全局唯一ID
-            global_id = self.id_prefix + current_id
+        # 下一个可分配的相对ID
+        if manifest:
+            last_ids = [end for entry in manifest.values() for _, end in json.loads(entry['id_ranges'])]
+            rows = self.db_adapter.execute_query("SELECT MAX(id) FROM poems")
+            next_id = max(last_ids + [(rows[0][0] or self.id_prefix) - self.id_prefix]) + 1
+        else:
+            next_id = 1
 
-            # 使用 'title' 字段
-            cursor.execute('''
-                INSERT OR REPLACE INTO poems 
-                (id, title, author, paragraphs, full_text, author_desc, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                global_id,  # 使用全局唯一ID
-                normalized_data.get('title', ''), # 从 'title' 获取
-                normalized_data.get('author', ''),
-                json.dumps(paragraphs, ensure_ascii=False),
-                full_text,
-                normalized_data.get('author_desc', ''),
-                now,
-                now
-            ))
-            inserted_count += 1
-            current_id += 1
+        to_parse: List[Tuple[Path, str, Optional[Dict[str, Any]]]] = []
+        stats = {'new_files': 0, 'changed_files': 0, 'unchanged_files': 0, 'poems': 0}
+        for json_file in json_files:
+            relative = json_file.relative_to(source_path).as_posix()
+            entry = manifest.get(relative)
+            stat = json_file.stat()
+            if entry and entry['file_size'] == stat.st_size and entry['file_mtime'] == stat.st_mtime:
+                stats['unchanged_files'] += 1
+                continue
+            digest = self._file_digest(json_file)
+            if entry and entry['content_hash'] == digest:
+                # 仅时间戳变化，更新清单即可
+                self.db_adapter.execute_update(
+                    "UPDATE ingest_manifest SET file_size = ?, file_mtime = ? WHERE file_path = ?",
+                    (stat.st_size, stat.st_mtime, relative)
+                )
+                stats['unchanged_files'] += 1
+                continue
+            to_parse.append((json_file, digest, entry))
 
-        conn.commit()
-        conn.close()
+        if not to_parse:
+            self.logger.info(f"所有 {len(json_files)} 个源文件均未变化，无需导入")
+            return stats
 
-        self.logger.info(f"诗词插入完成，成功插入 {inserted_count} 首诗词")
-        return inserted_count
+        self.logger.info(f"需要导入 {len(to_parse)} 个新增或变化的文件（共 {len(json_files)} 个）")
+        entries = {json_file: (digest, entry) for json_file, digest, entry in to_parse}
+        # 首次导入整个语料时删除索引以加速；增量导入少量文件时保留索引
+        with self._bulk_load_connection(drop_indexes=not manifest) as conn:
+            for json_file, (rows, error) in self._map_files(_parse_poem_file, list(entries.keys()), workers):
+                if error:
+                    self.logger.error(f"处理文件 {json_file.name} 时出错: {error}")
+                    continue
+                digest, entry = entries[json_file]
+
+                # 为该文件的每一行确定相对ID：找回原有ID，新诗词在末尾追加新区间
+                id_ranges = json.loads(entry['id_ranges']) if entry else []
+                ids, unmatched = self._match_existing_ids(conn, id_ranges, rows)
+                missing = [i for i, poem_id in enumerate(ids) if poem_id is None]
+                if missing:
+                    id_ranges.append([next_id, next_id + len(missing) - 1])
+                    for offset, i in enumerate(missing):
+                        ids[i] = next_id + offset
+                    next_id += len(missing)
+                if unmatched:
+                    self.logger.warning(
+                        f"文件 {json_file.name} 中有 {unmatched} 首旧诗词在新版本中找不到对应，"
+                        f"这些诗词及其标注仍保留在数据库中"
+                    )
+
+                if entry:
+                    self._preserve_compact_results(conn, ((self.id_prefix + poem_id, row[5]) for poem_id, row in zip(ids, rows)))
+                conn.executemany(self._UPSERT_POEM_SQL, [
+                    (self.id_prefix + poem_id, *row, now, now) for poem_id, row in zip(ids, rows)
+                ])
+                stat = json_file.stat()
+                conn.execute('''
+                    INSERT INTO ingest_manifest (file_path, file_size, file_mtime, content_hash, id_ranges, poem_count, ingested_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(file_path) DO UPDATE SET
+                        file_size = excluded.file_size,
+                        file_mtime = excluded.file_mtime,
+                        content_hash = excluded.content_hash,
+                        id_ranges = excluded.id_ranges,
+                        poem_count = excluded.poem_count,
+                        ingested_at = excluded.ingested_at
+                ''', (json_file.relative_to(source_path).as_posix(), stat.st_size, stat.st_mtime, digest,
+                      json.dumps(id_ranges), len(rows), now))
+                conn.commit()
+
+                stats['changed_files' if entry else 'new_files'] += 1
+                stats['poems'] += len(rows)
+                self.logger.debug(f"文件 {json_file.name} 已导入 {len(rows)} 首诗词")
+
+        self.logger.info(
+            f"增量导入完成 - 新文件: {stats['new_files']}, 变化文件: {stats['changed_files']}, "
+            f"未变化: {stats['unchanged_files']}, 导入诗词: {stats['poems']}"
+        )
+        return stats
+
+    def batch_insert_poems(self, poems_data: List[Dict[str, Any]], start_id: Optional[int] = None) -> int:
+        """批量插入诗词到数据库 - [修改] 适配 'title' 字段"""
+        self.logger.info(f"开始批量插入 {len(poems_data)} 首诗词...")
+        return self.stream_insert_poems(poems_data, start_id=start_id)
     
+    def ensure_pending_queue(self, model_identifier: str):
+        """
+        确保模型已登记到待标注队列 (annotation_queue)。
+        首次登记时一次性写入该模型所有未成功标注的诗词，之后由触发器随写入自动维护。
+        """
+        if model_identifier in self._queue_models:
+            return
+        from datetime import datetime, timezone, timedelta
+        tz = timezone(timedelta(hours=8))
+        conn = self.db_adapter.connect()
+        try:
+            # IMMEDIATE 事务：登记与填充期间阻止其他写入，避免漏掉并发保存的标注
+            conn.execute("BEGIN IMMEDIATE")
+            registered = conn.execute(
+                "SELECT 1 FROM annotation_queue_models WHERE model_identifier = ?", (model_identifier,)
+            ).fetchone()
+            if not registered:
+                self.logger.info(f"为模型 [{model_identifier}] 建立待标注队列...")
+                conn.execute(
+                    "INSERT INTO annotation_queue_models (model_identifier, registered_at) VALUES (?, ?)",
+                    (model_identifier, datetime.now(tz).isoformat())
+                )
+                # 成功标注的来源指纹与诗词当前原文不符（原文已修订）的也需要重新标注
+                conn.execute("""
+                    INSERT OR IGNORE INTO annotation_queue (model_identifier, poem_id)
+                    SELECT ?, p.id FROM poems p
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM annotations an
+                        WHERE an.model_identifier = ? AND an.poem_id = p.id AND an.status = 'completed'
+                            AND an.source_hash IS p.content_hash
+                    )
+                """, (model_identifier, model_identifier))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self._queue_models.add(model_identifier)
+
+    def count_pending(self, model_identifier: str,
+                      start_id: Optional[int] = None,
+                      end_id: Optional[int] = None) -> int:
+        """统计指定模型待标注的诗词数量（只扫描待标注队列）"""
+        self.ensure_pending_queue(model_identifier)
+        query = "SELECT COUNT(*) FROM annotation_queue WHERE model_identifier = ?"
+        params: List[Any] = [model_identifier]
+        if start_id is not None:
+            query += " AND poem_id >= ?"
+            params.append(start_id)
+        if end_id is not None:
+            query += " AND poem_id <= ?"
+            params.append(end_id)
+        return self.db_adapter.execute_query(query, tuple(params))[0][0]
+
+    def _load_author_descriptions(self) -> List[Tuple[str, Optional[str]]]:
+        """读取全部作者简介，供 AuthorDescriptions 一次性加载"""
+        rows = self.db_adapter.execute_query("SELECT name, description FROM authors")
+        return [(row[0], row[1]) for row in rows]
+
     def get_poems_to_annotate(self, model_identifier: str, 
                                limit: Optional[int] = None, 
                                start_id: Optional[int] = None, 
                                end_id: Optional[int] = None,
-                               force_rerun: bool = False) -> List[Dict[str, Any]]:
-        """获取指定模型待标注的诗词 - [修改] 查询 'title'"""
-        params = []
-        
-        # [修改] 查询 'title' 而不是 'rhythmic'
-        query = """
-            SELECT p.id, p.title, p.author, p.paragraphs, p.full_text, au.description as author_desc
-            FROM poems p
-            LEFT JOIN authors au ON p.author = au.name
+                               force_rerun: bool = False,
+                               after_id: Optional[int] = None) -> List[PoemRecord]:
+        """
+        获取指定模型待标注的诗词 - [修改] 查询 'title'
+        非强制重跑时从待标注队列读取，代价与待标注数量成正比；
+        after_id 用于按ID分页（WHERE id > after_id），避免 OFFSET 扫描。
+        返回只读的 PoemRecord（paragraphs 首次访问时才解码）。
         """
+        params = []
         
-        # 如果不是强制重跑，则排除已完成的
+        # 如果不是强制重跑，则只取队列中的诗词（即未成功标注的）
         if not force_rerun:
-            query += """
-                LEFT JOIN annotations an ON p.id = an.poem_id AND an.model_identifier = ?
-                WHERE (an.status IS NULL OR an.status != 'completed')
+            self.ensure_pending_queue(model_identifier)
+            query = f"""
+                SELECT {POEM_RECORD_COLUMNS}
+                FROM annotation_queue q
+                JOIN poems p ON p.id = q.poem_id
+                WHERE q.model_identifier = ?
             """
             params.append(model_identifier)
+            id_column = "q.poem_id"
         else:
-            query += " WHERE 1=1"
+            # [修改] 查询 'title' 而不是 'rhythmic'
+            query = f"""
+                SELECT {POEM_RECORD_COLUMNS}
+                FROM poems p
+                WHERE 1=1
+            """
+            id_column = "p.id"
 
         if start_id is not None:
-             query += " AND p.id >= ?"
+             query += f" AND {id_column} >= ?"
              params.append(start_id)
+        if after_id is not None:
+             query += f" AND {id_column} > ?"
+             params.append(after_id)
         if end_id is not None:
-             query += " AND p.id <= ?"
+             query += f" AND {id_column} <= ?"
              params.append(end_id)
         
-        query += " ORDER BY p.id"
+        query += f" ORDER BY {id_column}"
         
         if limit:
             query += " LIMIT ?"
             params.append(limit)
         
         rows = self.db_adapter.execute_query(query, tuple(params))
+        return poem_records(rows, self._author_descriptions)
 
-        poems = []
-        for row in rows:
-            poem = dict(row)
-            if poem.get('paragraphs'):
-                poem['paragraphs'] = json.loads(poem['paragraphs'])
-            poems.append(poem)
-
-        return poems
+    def get_stale_poem_ids(self, model_identifier: str, prompt_hash: Optional[str] = None,
+                           limit: Optional[int] = None, start_id: Optional[int] = None,
+                           end_id: Optional[int] = None) -> List[int]:
+        """
+        获取指定模型成功标注已过期的诗词ID：标注时的原文指纹与诗词当前的 content_hash 不同，
+        或（给出 prompt_hash 时）标注时的提示词指纹与当前不同。提示词指纹未知的旧标注不按提示词判定过期。
+        """
+        query = """
+            SELECT an.poem_id
+            FROM annotations an
+            JOIN poems p ON p.id = an.poem_id
+            WHERE an.model_identifier = ? AND an.status = 'completed'
+              AND (an.source_hash IS NOT p.content_hash
+        """
+        params: List[Any] = [model_identifier]
+        if prompt_hash is not None:
+            query += " OR (an.prompt_hash IS NOT NULL AND an.prompt_hash != ?)"
+            params.append(prompt_hash)
+        query += ")"
+        if start_id is not None:
+            query += " AND an.poem_id >= ?"
+            params.append(start_id)
+        if end_id is not None:
+            query += " AND an.poem_id <= ?"
+            params.append(end_id)
+        query += " ORDER BY an.poem_id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [row[0] for row in self.db_adapter.execute_query(query, tuple(params))]
 
-    def get_poems_by_ids(self, poem_ids: List[int]) -> List[Dict[str, Any]]:
+    def get_poems_by_ids(self, poem_ids: List[int]) -> List[PoemRecord]:
         """根据ID列表获取诗词信息 - [修改] 查询 'title'"""
         if not poem_ids:
             return []
         
-        # [修改] 查询 'title'
-        placeholders = ','.join('?' * len(poem_ids))
+        # [修改] 查询 'title'；ID集合通过临时表连接，不受参数数量上限限制
         query = f"""
-            SELECT p.id, p.title, p.author, p.paragraphs, p.full_text, au.description as author_desc
-            FROM poems p
-            LEFT JOIN authors au ON p.author = au.name
-            WHERE p.id IN ({placeholders})
+            SELECT {POEM_RECORD_COLUMNS}
+            FROM {{ids}} t
+            JOIN poems p ON p.id = t.id
         """
         
-        rows = self.db_adapter.execute_query(query, tuple(poem_ids))
-        
-        poems = []
-        for row in rows:
-            poem = dict(row)
-            if poem.get('paragraphs'):
-                poem['paragraphs'] = json.loads(poem['paragraphs'])
-            poems.append(poem)
-        
-        return poems
+        rows = self.db_adapter.execute_query_with_ids(query, poem_ids)
+        return poem_records(rows, self._author_descriptions)
 
     
     def get_poem_by_id(self, poem_id: int) -> Optional[Dict[str, Any]]:
@@ -311,10 +715,167 @@ class DataManager:
         
         return None
     
+    # --- 标注结果存储格式：json（完整JSON文本）或 compact（句子序号 + 情感编码的紧凑BLOB）---
+
+    def _load_emotion_codes(self):
+        """从 emotion_codes 表刷新情感ID编码缓存"""
+        rows = self.db_adapter.execute_query("SELECT code, emotion_id FROM emotion_codes")
+        self._emotion_names = {row[0]: row[1] for row in rows}
+        self._emotion_codes = {emotion_id: code for code, emotion_id in self._emotion_names.items()}
+
+    def _intern_emotions(self, emotions: set):
+        """确保所有情感ID都已在 emotion_codes 表中分配编码"""
+        missing = emotions - self._emotion_codes.keys()
+        if missing:
+            self.db_adapter.execute_many(
+                "INSERT OR IGNORE INTO emotion_codes (emotion_id) VALUES (?)", [(e,) for e in sorted(missing)]
+            )
+            self._load_emotion_codes()
+
+    @staticmethod
+    def _decode_results(annotations: List[Dict[str, Any]]) -> Dict[int, Any]:
+        """解码成功标注的JSON结果，返回 {在 annotations 中的下标: 解码后的结果}，无法解析的跳过"""
+        decoded = {}
+        for i, annotation in enumerate(annotations):
+            value = annotation.get('annotation_result')
+            if annotation['status'] == 'completed' and isinstance(value, str):
+                try:
+                    decoded[i] = json.loads(value)
+                except json.JSONDecodeError:
+                    continue
+        return decoded
+
+    def _storage_values(self, annotations: List[Dict[str, Any]], storage: Optional[str] = None,
+                        decoded: Optional[Dict[int, Any]] = None) -> List[Any]:
+        """
+        按存储格式（默认为当前的 annotation_storage）计算每条标注要写入 annotation_result 的值。
+        compact 模式下成功的结果编码为紧凑BLOB；无法无损还原的（如句子文本与诗词原文不一致）仍保存JSON。
+        """
+        values = [a.get('annotation_result') for a in annotations]
+        if (storage or self.annotation_storage) != 'compact':
+            return values
+
+        if decoded is None:
+            decoded = self._decode_results(annotations)
+        if not decoded:
+            return values
+
+        rows = self.db_adapter.execute_query_with_ids(
+            "SELECT p.id, p.paragraphs FROM {ids} t JOIN poems p ON p.id = t.id",
+            {annotations[i]['poem_id'] for i in decoded}
+        )
+        paragraphs = {row[0]: json.loads(row[1]) if row[1] else [] for row in rows}
+        self._intern_emotions(set().union(*(
+            collect_emotions(results) for results in decoded.values() if isinstance(results, list)
+        )))
+        for i, results in decoded.items():
+            blob = encode_compact(results, self._emotion_codes, paragraphs.get(annotations[i]['poem_id'], []))
+            if blob is not None:
+                values[i] = blob
+        return values
+
+    def _rehydrate_result(self, value: Any, paragraphs: Any) -> Any:
+        """
+        把读出的 annotation_result 透明还原为JSON字符串（紧凑格式时）；JSON文本原样返回。
+        紧凑数据与当前原文不符（原文已修订）或已损坏时记录警告并返回 None，不把标注套到错误的文本上。
+        """
+        if not is_compact(value):
+            return value
+        try:
+            try:
+                return rehydrate(value, self._emotion_names, paragraphs)
+            except KeyError:
+                # 编码可能由其他进程新分配，刷新缓存后重试
+                self._load_emotion_codes()
+                return rehydrate(value, self._emotion_names, paragraphs)
+        except (ValueError, KeyError) as e:
+            self.logger.warning(f"无法还原紧凑格式的标注结果: {e}")
+            return None
+
+    def _preserve_compact_results(self, conn, poem_rows: Iterable[Tuple[int, Optional[str]]]) -> int:
+        """
+        原文即将被修订的诗词：先把其紧凑格式的标注结果（当前结果与历史版本）按修订前的原文改写回JSON，
+        修订后仍能读出模型当时针对原文给出的结果。不提交事务。
+
+        :param poem_rows: (诗词ID, 即将写入的 content_hash)，哈希未变化的诗词不处理
+        :return: 改写的条数
+        """
+        changed = [
+            poem_id for poem_id, content_hash in poem_rows
+            if conn.execute("SELECT 1 FROM poems WHERE id = ? AND content_hash IS NOT ?", (poem_id, content_hash)).fetchone()
+        ]
+        rewritten = 0
+        for table in ('annotations', 'annotation_versions'):
+            for poem_id in changed:
+                rows = conn.execute(f"""
+                    SELECT t.id, t.annotation_result, p.paragraphs
+                    FROM {table} t JOIN poems p ON p.id = t.poem_id
+                    WHERE t.poem_id = ? AND typeof(t.annotation_result) = 'blob'
+                """, (poem_id,)).fetchall()
+                updates = []
+                for row_id, blob, paragraphs in rows:
+                    value = self._rehydrate_result(blob, paragraphs)
+                    if value is not None:
+                        updates.append((value, row_id))
+                conn.executemany(f"UPDATE {table} SET annotation_result = ? WHERE id = ?", updates)
+                rewritten += len(updates)
+        if rewritten:
+            self.logger.info(f"{len(changed)} 首诗词的原文将被修订，已把其 {rewritten} 条紧凑格式标注结果改写为JSON")
+        return rewritten
+
+    def convert_annotation_storage(self, target: Optional[str] = None, batch_size: int = 1000,
+                                   vacuum: bool = False) -> int:
+        """
+        把已有的成功标注结果改写为指定的存储格式（默认为当前的 annotation_storage）。
+        只改写 annotation_result，不修改 updated_at；释放出的空间需 VACUUM 后才会归还给文件系统。
+
+        :return: 实际改写的条数
+        """
+        target = target or self.annotation_storage
+        if target not in self.ANNOTATION_STORAGE_MODES:
+            raise ValueError(f"不支持的标注存储格式: {target}。支持的格式: {list(self.ANNOTATION_STORAGE_MODES)}")
+        source_type = 'text' if target == 'compact' else 'blob'
+
+        converted = 0
+        last_id = 0
+        while True:
+            rows = self.db_adapter.execute_query("""
+                SELECT an.id, an.poem_id, an.annotation_result, p.paragraphs
+                FROM annotations an
+                LEFT JOIN poems p ON p.id = an.poem_id
+                WHERE an.id > ? AND an.status = 'completed' AND typeof(an.annotation_result) = ?
+                ORDER BY an.id
+                LIMIT ?
+            """, (last_id, source_type, batch_size))
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            if target == 'compact':
+                values = self._storage_values(
+                    [{'poem_id': row[1], 'status': 'completed', 'annotation_result': row[2]} for row in rows],
+                    storage='compact'
+                )
+            else:
+                values = [self._rehydrate_result(row[2], row[3]) for row in rows]
+            # 无法还原（原文已修订）的紧凑数据保持原样
+            updates = [(value, row[0]) for row, value in zip(rows, values) if value is not row[2] and value is not None]
+            if updates:
+                self.db_adapter.execute_many("UPDATE annotations SET annotation_result = ? WHERE id = ?", updates)
+                converted += len(updates)
+            self.logger.debug(f"存储格式转换进度 - 已改写 {converted} 条, 当前ID: {last_id}")
+
+        self.logger.info(f"已将 {converted} 条标注结果转换为 {target} 格式")
+        if vacuum:
+            self.logger.info("正在执行 VACUUM 回收空间...")
+            self.db_adapter.execute_update("VACUUM")
+        return converted
+
     def save_annotation(self, poem_id: int, model_identifier: str, status: str,
                         annotation_result: Optional[str] = None, 
-                        error_message: Optional[str] = None) -> bool:
-        """保存标注结果到annotations表 (UPSERT)，时间戳带时区"""
+                        error_message: Optional[str] = None,
+                        run_id: Optional[str] = None, prompt_hash: Optional[str] = None,
+                        usage: Optional[Dict[str, Any]] = None, source_hash: Optional[str] = None) -> bool:
+        """保存标注结果到annotations表 (UPSERT) 并追加一个历史版本，时间戳带时区"""
         # 不再记录分散的日志，使用AnnotationDataLogger进行统一聚合记录
         from datetime import datetime, timezone, timedelta
         self.logger.debug(f"保存标注结果 - 诗词ID: {poem_id}, 模型: {model_identifier}, 状态: {status}")
@@ -323,43 +884,539 @@ class DataManager:
         now = datetime.now(tz).isoformat()
 
         try:
-            rowcount = self.db_adapter.execute_update('''
-                INSERT INTO annotations (poem_id, model_identifier, status, annotation_result, error_message, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+            self._write_annotations([{
+                'poem_id': poem_id, 'model_identifier': model_identifier, 'status': status,
+                'annotation_result': annotation_result, 'error_message': error_message,
+                'run_id': run_id, 'prompt_hash': prompt_hash, 'usage': usage, 'source_hash': source_hash
+            }], now)
+            self.logger.debug(f"标注结果保存成功 - 诗词ID: {poem_id}, 模型: {model_identifier}")
+            return True
+        except Exception as e:
+            self.logger.error(f"保存标注结果失败 - 诗词ID: {poem_id}, 模型: {model_identifier}, 错误: {e}")
+            return False
+
+    # --- 异步接口：数据库操作在专用线程中执行，不阻塞事件循环 ---
+
+    async def run_in_db_thread(self, func: Callable, *args, **kwargs) -> Any:
+        """在专用数据库线程中执行同步的数据库操作，并等待其结果"""
+        if self._db_executor is None:
+            self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-{self.db_name}")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db_executor, functools.partial(func, *args, **kwargs))
+
+    def _write_annotations(self, annotations: List[Dict[str, Any]], now: str) -> int:
+        """
+        在一个事务中追加标注版本并写入当前结果 (UPSERT)，再把句子级结果投影到
+        sentence_annotations / sentence_emotion_links，使可视化查询的句子表始终与 annotations 一致。
+        版本总是以紧凑格式保存；annotations.current_version_id 指向本次追加的版本。
+        source_hash（标注时诗词的 content_hash，未提供时取诗词当前值）与 prompt_hash 同时写入两张表，
+        供过期标注查询使用。
+        """
+        decoded = self._decode_results(annotations)
+        values = self._storage_values(annotations, decoded=decoded)
+        version_values = values if self.annotation_storage == 'compact' else \
+            self._storage_values(annotations, storage='compact', decoded=decoded)
+        versions = [
+            (a['poem_id'], a['model_identifier'], a.get('run_id'), a.get('prompt_hash'), a.get('source_hash'), a['poem_id'],
+             a['status'], value, a.get('error_message'), json.dumps(a['usage']) if a.get('usage') else None, now)
+            for a, value in zip(annotations, version_values)
+        ]
+        records = [
+            (a['poem_id'], a['model_identifier'], a['status'], value, a.get('error_message'), now, now,
+             a.get('source_hash'), a['poem_id'], a.get('prompt_hash'), a['poem_id'], a['model_identifier'])
+            for a, value in zip(annotations, values)
+        ]
+        with self.db_adapter.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO annotation_versions (poem_id, model_identifier, run_id, prompt_hash, source_hash, status,
+                                                 annotation_result, error_message, usage, created_at)
+                VALUES (?, ?, ?, ?, COALESCE(?, (SELECT content_hash FROM poems WHERE id = ?)), ?, ?, ?, ?, ?)
+            ''', versions)
+            cursor.executemany('''
+                INSERT INTO annotations (poem_id, model_identifier, status, annotation_result, error_message, created_at, updated_at,
+                                         source_hash, prompt_hash, current_version_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, (SELECT content_hash FROM poems WHERE id = ?)), ?, (
+                    SELECT MAX(id) FROM annotation_versions WHERE poem_id = ? AND model_identifier = ?
+                ))
                 ON CONFLICT(poem_id, model_identifier) DO UPDATE SET
                     status = excluded.status,
                     annotation_result = excluded.annotation_result,
                     error_message = excluded.error_message,
-                    updated_at = excluded.updated_at
-            ''', (poem_id, model_identifier, status, annotation_result, error_message, now, now))
+                    updated_at = excluded.updated_at,
+                    source_hash = excluded.source_hash,
+                    prompt_hash = excluded.prompt_hash,
+                    current_version_id = excluded.current_version_id
+            ''', records)
+            projections = []
+            for i, a in enumerate(annotations):
+                cursor.execute(
+                    "SELECT id FROM annotations WHERE poem_id = ? AND model_identifier = ?",
+                    (a['poem_id'], a['model_identifier'])
+                )
+                projections.append((cursor.fetchone()[0], a['poem_id'], decoded.get(i)))
+            project_sentences(cursor, projections)
+        return len(records)
 
-            success = rowcount > 0
-            if success:
-                self.logger.debug(f"标注结果保存成功 - 诗词ID: {poem_id}, 模型: {model_identifier}")
-            return success
+    def _save_annotations_sync(self, annotations: List[Dict[str, Any]]) -> int:
+        """在一个事务中批量保存标注结果 (UPSERT)，时间戳带时区"""
+        from datetime import datetime, timezone, timedelta
+        tz = timezone(timedelta(hours=8))
+        return self._write_annotations(annotations, datetime.now(tz).isoformat())
+
+    async def save_annotations(self, annotations: List[Dict[str, Any]]) -> int:
+        """
+        异步批量保存标注结果。
+        每项为包含 poem_id, model_identifier, status, annotation_result, error_message 的字典，
+        可选的 run_id, prompt_hash, usage, source_hash 记入追加的历史版本，
+        prompt_hash 与 source_hash 同时作为当前结果的来源指纹。
+
+        :return: 保存的条数；失败时记录错误并返回0
+        """
+        if not annotations:
+            return 0
+        try:
+            return await self.run_in_db_thread(self._save_annotations_sync, annotations)
         except Exception as e:
-            self.logger.error(f"保存标注结果失败 - 诗词ID: {poem_id}, 模型: {model_identifier}, 错误: {e}")
+            self.logger.error(f"批量保存 {len(annotations)} 条标注结果失败: {e}")
+            return 0
+
+    async def stream_pending(self, model_identifier: str,
+                             limit: Optional[int] = None,
+                             start_id: Optional[int] = None,
+                             end_id: Optional[int] = None,
+                             force_rerun: bool = False,
+                             page_size: int = 500) -> AsyncIterator[PoemRecord]:
+        """
+        异步逐首产出指定模型待标注的诗词。
+        按ID键集分页（WHERE id > 上一页最后的ID）在数据库线程中读取，两页之间事件循环保持可响应。
+        """
+        remaining = limit
+        last_id = None
+        while remaining is None or remaining > 0:
+            page_limit = page_size if remaining is None else min(page_size, remaining)
+            page = await self.run_in_db_thread(
+                self.get_poems_to_annotate, model_identifier,
+                limit=page_limit, start_id=start_id, end_id=end_id, force_rerun=force_rerun, after_id=last_id
+            )
+            for poem in page:
+                yield poem
+            if len(page) < page_limit:
+                break
+            last_id = page[-1]['id']
+            if remaining is not None:
+                remaining -= len(page)
+
+    def close(self):
+        """关闭专用数据库线程和适配器持有的连接"""
+        if self._db_executor is not None:
+            self._db_executor.shutdown(wait=True)
+            self._db_executor = None
+        self.db_adapter.close()
+
+    def get_poems_pending_cascade(self, cascade_id: str,
+                                  limit: Optional[int] = None,
+                                  start_id: Optional[int] = None,
+                                  end_id: Optional[int] = None,
+                                  force_rerun: bool = False) -> List[PoemRecord]:
+        """获取在指定级联中尚未得到成功结果的诗词"""
+        params = []
+        query = f"""
+            SELECT {POEM_RECORD_COLUMNS}
+            FROM poems p
+        """
+
+        if not force_rerun:
+            query += """
+                LEFT JOIN cascade_decisions cd ON p.id = cd.poem_id AND cd.cascade_id = ?
+                WHERE (cd.status IS NULL OR cd.status != 'completed')
+            """
+            params.append(cascade_id)
+        else:
+            query += " WHERE 1=1"
+
+        if start_id is not None:
+            query += " AND p.id >= ?"
+            params.append(start_id)
+        if end_id is not None:
+            query += " AND p.id <= ?"
+            params.append(end_id)
+
+        query += " ORDER BY p.id"
+
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        rows = self.db_adapter.execute_query(query, tuple(params))
+        return poem_records(rows, self._author_descriptions)
+
+    def save_cascade_decision(self, poem_id: int, cascade_id: str, final_model: Optional[str],
+                              status: str, escalations: int, reason: Optional[str] = None) -> bool:
+        """记录某首诗在级联中的最终决策 (UPSERT)，时间戳带时区"""
+        from datetime import datetime, timezone, timedelta
+        tz = timezone(timedelta(hours=8))
+        now = datetime.now(tz).isoformat()
+
+        try:
+            rowcount = self.db_adapter.execute_update('''
+                INSERT INTO cascade_decisions (poem_id, cascade_id, final_model, status, escalations, reason, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(poem_id, cascade_id) DO UPDATE SET
+                    final_model = excluded.final_model,
+                    status = excluded.status,
+                    escalations = excluded.escalations,
+                    reason = excluded.reason,
+                    updated_at = excluded.updated_at
+            ''', (poem_id, cascade_id, final_model, status, escalations, reason, now, now))
+            return rowcount > 0
+        except Exception as e:
+            self.logger.error(f"保存级联决策失败 - 诗词ID: {poem_id}, 级联: {cascade_id}, 错误: {e}")
             return False
 
+    def get_cascade_statistics(self, cascade_id: str) -> Dict[str, int]:
+        """按最终模型统计某个级联的成功结果数量"""
+        rows = self.db_adapter.execute_query("""
+            SELECT final_model, COUNT(*) FROM cascade_decisions
+            WHERE cascade_id = ? AND status = 'completed'
+            GROUP BY final_model
+        """, (cascade_id,))
+        return {model: count for model, count in rows}
+
+    def get_poem_ids(self, limit: Optional[int] = None,
+                     start_id: Optional[int] = None,
+                     end_id: Optional[int] = None) -> List[int]:
+        """按ID顺序获取指定范围内的诗词ID（不读取正文）"""
+        params = []
+        query = "SELECT id FROM poems WHERE 1=1"
+        if start_id is not None:
+            query += " AND id >= ?"
+            params.append(start_id)
+        if end_id is not None:
+            query += " AND id <= ?"
+            params.append(end_id)
+        query += " ORDER BY id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self.db_adapter.execute_query(query, tuple(params))
+        return [row[0] for row in rows]
+
+    def get_completed_annotations(self, poem_ids: List[int],
+                                  model_identifiers: Optional[List[str]] = None) -> Dict[int, Dict[str, str]]:
+        """
+        获取一组诗词已成功的标注结果（JSON字符串，不解码；紧凑格式的结果会先还原为JSON）。
+        model_identifiers 为 None 时返回所有模型的结果。
+
+        :return: {poem_id: {model_identifier: annotation_result}}
+        """
+        results: Dict[int, Dict[str, str]] = {}
+        if not poem_ids or model_identifiers == []:
+            return results
+
+        model_filter, model_params = "", ()
+        if model_identifiers is not None:
+            model_filter = f"AND an.model_identifier IN ({','.join('?' * len(model_identifiers))})"
+            model_params = tuple(model_identifiers)
+        rows = self.db_adapter.execute_query_with_ids(f"""
+            SELECT an.poem_id, an.model_identifier, an.annotation_result,
+                CASE WHEN typeof(an.annotation_result) = 'blob' THEN p.paragraphs END AS paragraphs
+            FROM {{ids}} t
+            JOIN annotations an ON an.poem_id = t.id
+            LEFT JOIN poems p ON p.id = an.poem_id
+            WHERE an.status = 'completed'
+                {model_filter}
+        """, poem_ids, model_params)
+        for poem_id, model_identifier, annotation_result, paragraphs in rows:
+            results.setdefault(poem_id, {})[model_identifier] = self._rehydrate_result(annotation_result, paragraphs)
+        return results
+
+    # --- 标注变更日志（annotation_changes）：下游按各自的游标增量消费 ---
+
+    def get_change_cursor(self, consumer: str) -> Optional[int]:
+        """返回消费者已处理到的变更序号；尚未登记的消费者返回 None"""
+        rows = self.db_adapter.execute_query(
+            "SELECT last_seq FROM change_cursors WHERE consumer = ?", (consumer,)
+        )
+        return rows[0][0] if rows else None
+
+    def advance_change_cursor(self, consumer: str, seq: int):
+        """把消费者的游标推进到 seq（不会后退）"""
+        from datetime import datetime, timezone, timedelta
+        tz = timezone(timedelta(hours=8))
+        now = datetime.now(tz).isoformat()
+        self.db_adapter.execute_update("""
+            INSERT INTO change_cursors (consumer, last_seq, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(consumer) DO UPDATE SET
+                last_seq = MAX(last_seq, excluded.last_seq),
+                updated_at = excluded.updated_at
+        """, (consumer, seq, now))
+
+    def get_latest_change_seq(self) -> int:
+        """变更日志当前的最大序号（日志为空时为 0）"""
+        rows = self.db_adapter.execute_query("SELECT COALESCE(MAX(seq), 0) FROM annotation_changes")
+        return rows[0][0]
+
+    def get_annotation_changes(self, after_seq: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按序号顺序读取 after_seq 之后的变更"""
+        rows = self.db_adapter.execute_query("""
+            SELECT seq, annotation_id, poem_id, model_identifier, op, status, updated_at
+            FROM annotation_changes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        """, (after_seq, limit))
+        return [dict(row) for row in rows]
+
+    def consume_annotation_changes(self, consumer: str,
+                                   handler: Callable[[List[Dict[str, Any]]], None],
+                                   batch_size: int = 1000) -> int:
+        """
+        把消费者游标之后的变更按批交给 handler 处理，每批处理成功后推进游标；
+        handler 抛出异常时游标停在上一批，下次从该批重新开始（handler 应可重复执行）。
+
+        :return: 本次处理的变更条数
+        """
+        last_seq = self.get_change_cursor(consumer) or 0
+        processed = 0
+        while True:
+            changes = self.get_annotation_changes(last_seq, batch_size)
+            if not changes:
+                break
+            handler(changes)
+            last_seq = changes[-1]['seq']
+            self.advance_change_cursor(consumer, last_seq)
+            processed += len(changes)
+        return processed
+
+    def prune_annotation_changes(self) -> int:
+        """删除所有已登记消费者都已处理过的变更；没有消费者时不删除。返回删除的条数"""
+        rows = self.db_adapter.execute_query("SELECT MIN(last_seq) FROM change_cursors")
+        min_seq = rows[0][0] if rows else None
+        if not min_seq:
+            return 0
+        deleted = self.db_adapter.execute_update("DELETE FROM annotation_changes WHERE seq <= ?", (min_seq,))
+        self.logger.info(f"已清理 {deleted} 条已消费的标注变更")
+        return deleted
+
+    def get_annotation_versions(self, poem_id: Optional[int] = None, model_identifier: Optional[str] = None,
+                                prompt_hash: Optional[str] = None, run_id: Optional[str] = None,
+                                limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按条件读取标注历史版本（按版本ID升序），annotation_result 还原为JSON字符串，usage 解码为字典；
+        is_current 表示该版本是否为 annotations 中的当前结果。
+        """
+        conditions, params = [], []
+        for column, value in (('v.poem_id', poem_id), ('v.model_identifier', model_identifier),
+                              ('v.prompt_hash', prompt_hash), ('v.run_id', run_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        query = """
+            SELECT v.id, v.poem_id, v.model_identifier, v.run_id, v.prompt_hash, v.source_hash, v.status,
+                   v.annotation_result, v.error_message, v.usage, v.created_at,
+                   an.current_version_id IS v.id AS is_current, p.paragraphs
+            FROM annotation_versions v
+            LEFT JOIN annotations an ON an.poem_id = v.poem_id AND an.model_identifier = v.model_identifier
+            LEFT JOIN poems p ON p.id = v.poem_id
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY v.id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        versions = []
+        for row in self.db_adapter.execute_query(query, tuple(params)):
+            version = dict(row)
+            paragraphs = version.pop('paragraphs')
+            version['annotation_result'] = self._rehydrate_result(version['annotation_result'], paragraphs)
+            version['usage'] = json.loads(version['usage']) if version['usage'] else None
+            version['is_current'] = bool(version['is_current'])
+            versions.append(version)
+        return versions
+
+    def compare_prompt_versions(self, model_identifier: str, prompt_hash_a: str,
+                                prompt_hash_b: str) -> List[Dict[str, Any]]:
+        """
+        对比同一模型在两个提示词版本下都有成功结果的诗词：每首诗取两个版本各自最新的一次结果，
+        返回 poem_id、version_a / version_b（版本ID）及还原后的 result_a / result_b。
+        """
+        rows = self.db_adapter.execute_query("""
+            WITH latest AS (
+                SELECT prompt_hash, poem_id, MAX(id) AS version_id
+                FROM annotation_versions
+                WHERE model_identifier = ? AND prompt_hash IN (?, ?) AND status = 'completed'
+                GROUP BY prompt_hash, poem_id
+            )
+            SELECT a.poem_id, a.version_id, va.annotation_result, b.version_id, vb.annotation_result, p.paragraphs
+            FROM latest a
+            JOIN latest b ON b.poem_id = a.poem_id AND b.prompt_hash = ?
+            JOIN annotation_versions va ON va.id = a.version_id
+            JOIN annotation_versions vb ON vb.id = b.version_id
+            LEFT JOIN poems p ON p.id = a.poem_id
+            WHERE a.prompt_hash = ?
+            ORDER BY a.poem_id
+        """, (model_identifier, prompt_hash_a, prompt_hash_b, prompt_hash_b, prompt_hash_a))
+        return [{
+            'poem_id': row[0],
+            'version_a': row[1],
+            'result_a': self._rehydrate_result(row[2], row[5]),
+            'version_b': row[3],
+            'result_b': self._rehydrate_result(row[4], row[5]),
+        } for row in rows]
+
+    def refresh_poem_agreement(self, batch_size: int = 500) -> int:
+        """
+        增量刷新 poem_agreement 表：只重新计算自上次刷新后标注有变化的诗词。
+        变化的诗词取自 annotation_changes 中游标 'poem_agreement' 之后的变更；
+        首次运行（尚无游标）时回退为比较 annotations.updated_at 与记录的 source_updated_at。
+
+        :return: 本次重新计算的诗词数量
+        """
+        from datetime import datetime, timezone, timedelta
+        # 先记下日志位置：计算期间新产生的变更留给下一次刷新
+        head_seq = self.get_latest_change_seq()
+        last_seq = self.get_change_cursor(AGREEMENT_CONSUMER)
+        if last_seq is None:
+            rows = self.db_adapter.execute_query("""
+                SELECT a.poem_id
+                FROM annotations a
+                LEFT JOIN poem_agreement pa ON pa.poem_id = a.poem_id
+                GROUP BY a.poem_id
+                HAVING pa.source_updated_at IS NULL OR MAX(a.updated_at) > pa.source_updated_at
+            """)
+        else:
+            rows = self.db_adapter.execute_query("""
+                SELECT DISTINCT poem_id FROM annotation_changes
+                WHERE seq > ? AND seq <= ? AND poem_id IS NOT NULL
+            """, (last_seq, head_seq))
+        stale_ids = [row[0] for row in rows]
+        if not stale_ids:
+            self.advance_change_cursor(AGREEMENT_CONSUMER, head_seq)
+            self.logger.debug("一致性表已是最新")
+            return 0
+
+        tz = timezone(timedelta(hours=8))
+        now = datetime.now(tz).isoformat()
+        conn = self.db_adapter.connect()
+        cursor = conn.cursor()
+        for i in range(0, len(stale_ids), batch_size):
+            batch = stale_ids[i:i + batch_size]
+            last_updates = dict(self.db_adapter.execute_query_with_ids("""
+                SELECT an.poem_id, MAX(an.updated_at)
+                FROM {ids} t
+                JOIN annotations an ON an.poem_id = t.id
+                GROUP BY an.poem_id
+            """, batch))
+            annotations = self.get_completed_annotations(batch)
+            records = []
+            for poem_id in batch:
+                label_maps = [primary_labels_from_result(result) for result in annotations.get(poem_id, {}).values()]
+                records.append((
+                    poem_id, len(label_maps), sentence_agreement(label_maps), primary_entropy(label_maps),
+                    last_updates.get(poem_id), now
+                ))
+            cursor.executemany('''
+                INSERT INTO poem_agreement (poem_id, model_count, agreement, primary_entropy, source_updated_at, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(poem_id) DO UPDATE SET
+                    model_count = excluded.model_count,
+                    agreement = excluded.agreement,
+                    primary_entropy = excluded.primary_entropy,
+                    source_updated_at = excluded.source_updated_at,
+                    computed_at = excluded.computed_at
+            ''', records)
+            conn.commit()
+        conn.close()
+        self.advance_change_cursor(AGREEMENT_CONSUMER, head_seq)
+
+        self.logger.info(f"一致性表已刷新 {len(stale_ids)} 首诗词")
+        return len(stale_ids)
+
+    def get_backfill_queue(self, model_identifier: str, strategy: str = 'disagreement',
+                           limit: Optional[int] = None, strata: int = 4, seed: int = 42) -> List[int]:
+        """
+        为新模型生成按优先级排序的待标注诗词ID队列。
+        只考虑已有至少两个模型成功标注、且该模型尚未成功标注的诗词，数据来自 poem_agreement 表。
+
+        :param strategy: 'disagreement' 按一致率升序；'entropy' 按主情感熵降序；
+                         'strata' 按一致率均分为若干层，层内随机、层间轮流抽取，保证各分歧程度都有覆盖。
+        :param strata: strata 策略下的分层数量。
+        """
+        order_by = {
+            'disagreement': "pa.agreement ASC, pa.model_count DESC, pa.poem_id",
+            'entropy': "pa.primary_entropy DESC, pa.model_count DESC, pa.poem_id",
+            'strata': "pa.poem_id",
+        }
+        if strategy not in order_by:
+            raise ValueError(f"不支持的回填策略: {strategy}。支持的策略: {list(order_by.keys())}")
+
+        query = f"""
+            SELECT pa.poem_id, pa.agreement
+            FROM poem_agreement pa
+            LEFT JOIN annotations an
+                ON an.poem_id = pa.poem_id AND an.model_identifier = ? AND an.status = 'completed'
+            WHERE an.poem_id IS NULL AND pa.agreement IS NOT NULL
+            ORDER BY {order_by[strategy]}
+        """
+        params: List[Any] = [model_identifier]
+        if limit and strategy != 'strata':
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self.db_adapter.execute_query(query, tuple(params))
+        if strategy != 'strata':
+            return [row[0] for row in rows]
+
+        import random
+        rng = random.Random(seed)
+        buckets: List[List[int]] = [[] for _ in range(max(1, strata))]
+        for poem_id, agreement in rows:
+            buckets[min(int(agreement * len(buckets)), len(buckets) - 1)].append(poem_id)
+        for bucket in buckets:
+            rng.shuffle(bucket)
+        queue = []
+        # 从分歧最大的层开始轮流抽取
+        position = 0
+        while any(position < len(bucket) for bucket in buckets):
+            queue.extend(bucket[position] for bucket in buckets if position < len(bucket))
+            position += 1
+        return queue[:limit] if limit else queue
+
+    def _table_count(self, table_name: str) -> int:
+        """从 table_counters 读取表的行数"""
+        rows = self.db_adapter.execute_query(
+            "SELECT row_count FROM table_counters WHERE table_name = ?", (table_name,)
+        )
+        return rows[0][0] if rows else 0
+
+    def _annotation_counts(self) -> List[Any]:
+        """从 annotation_counters 读取 (model_identifier, status, count)，不含已归零的组合"""
+        return self.db_adapter.execute_query("""
+            SELECT model_identifier, status, count
+            FROM annotation_counters
+            WHERE count > 0
+            ORDER BY model_identifier, status
+        """)
+
+    def rebuild_counters(self):
+        """按当前数据重新统计计数表（计数因绕过触发器的写入而偏差时使用）"""
+        with self.db_adapter.transaction() as cursor:
+            recount_counters(cursor)
+        self.logger.info("计数表已重新统计")
+
     def get_statistics(self) -> Dict[str, Any]:
-        """获取数据库统计信息 (增强版)"""
+        """获取数据库统计信息 (增强版)；计数来自触发器维护的计数表，无需全表扫描"""
         self.logger.debug("开始获取数据库统计信息...")
         
         # 总诗词数量
-        rows = self.db_adapter.execute_query("SELECT COUNT(*) FROM poems")
-        total_poems = rows[0][0]
+        total_poems = self._table_count('poems')
         
         # 总作者数
-        rows = self.db_adapter.execute_query("SELECT COUNT(*) FROM authors")
-        total_authors = rows[0][0]
+        total_authors = self._table_count('authors')
         
         # 按模型和状态统计标注数量
-        rows = self.db_adapter.execute_query("""
-            SELECT model_identifier, status, COUNT(*) 
-            FROM annotations 
-            GROUP BY model_identifier, status
-        """)
-        model_status_counts = rows
+        model_status_counts = self._annotation_counts()
         
         # 格式化模型统计
         stats_by_model = {}
@@ -377,15 +1434,22 @@ class DataManager:
             'stats_by_model': stats_by_model
         }
     
-    def initialize_database_from_json(self, clear_existing: bool = False) -> Dict[str, int]:
-        """从JSON文件初始化数据库"""
+    def initialize_database_from_json(self, clear_existing: bool = False, workers: Optional[int] = None) -> Dict[str, int]:
+        """
+        从JSON文件初始化数据库。不清空时为增量导入，已有的标注保留。
+        :param workers: 解析JSON的进程数，默认为CPU核数
+        """
         self.logger.info("开始初始化数据库...")
         
         if clear_existing:
             self.logger.info("清空现有数据...")
+            self.db_adapter.execute_update("DELETE FROM sentence_emotion_links")
+            self.db_adapter.execute_update("DELETE FROM sentence_annotations")
             self.db_adapter.execute_update("DELETE FROM annotations")
+            self.db_adapter.execute_update("DELETE FROM annotation_versions")
             self.db_adapter.execute_update("DELETE FROM poems")
             self.db_adapter.execute_update("DELETE FROM authors")
+            self.db_adapter.execute_update("DELETE FROM ingest_manifest")
             self.logger.info("现有数据已清空")
         
         # 加载作者数据
@@ -395,12 +1459,9 @@ class DataManager:
             author_count = self.batch_insert_authors(authors)
             self.logger.info(f"插入了 {author_count} 位作者信息")
         
-        # 加载诗词数据
-        poems = self.load_all_json_files()
-        poem_count = 0
-        if poems:
-            # 使用 batch_insert_poems 并从ID=1开始
-            poem_count = self.batch_insert_poems(poems, start_id=1)
+        # 按清单增量导入诗词数据：只解析新增或变化的文件（清单为空时即为从ID=1开始的全量导入）
+        poem_count = self.ingest_incremental(workers=workers)['poems']
+        if poem_count:
             print(f"插入了 {poem_count} 首诗词")
         
         print("数据库初始化完成!")
@@ -409,18 +1470,35 @@ class DataManager:
             'poems': poem_count
         }
     
-    def export_results(self, output_format: str = 'jsonl', 
-                       output_file: Optional[str] = None,
-                       model_filter: Optional[str] = None) -> str:
-        """导出标注结果 - [修改] 导出 'title'"""
-        # 构建查询条件
-        where_clause = ""
-        params = []
-        if model_filter:
-            where_clause = "WHERE a.model_identifier = ?"
-            params.append(model_filter)
-        
-        # [修改] 查询 'title'
+    def _decode_annotation_result(self, value: Any, paragraphs: Any) -> Optional[List[Dict[str, Any]]]:
+        """把读出的 annotation_result（JSON文本或紧凑BLOB）解码为句子列表，无法解析时返回 None"""
+        if not value:
+            return None
+        try:
+            if not is_compact(value):
+                return json.loads(value)
+            if isinstance(paragraphs, str):
+                paragraphs = json.loads(paragraphs)
+            try:
+                return decode_compact(value, self._emotion_names, paragraphs or [])
+            except KeyError:
+                # 编码可能由其他进程新分配，刷新缓存后重试
+                self._load_emotion_codes()
+                return decode_compact(value, self._emotion_names, paragraphs or [])
+        except (ValueError, IndexError, KeyError):
+            return None
+
+    def _export_to_file(self, output_path: Path, output_format: str, conditions: List[str], params: List[Any],
+                        batch_size: int = 5000, row_group_size: int = 100000,
+                        compression: str = 'zstd') -> Dict[str, Any]:
+        """
+        按条件流式导出 poems JOIN annotations 的结果到文件。
+        游标按批读取（独立连接上的一致快照），写入器按批/按行组写出，内存占用与导出规模无关。
+
+        :return: {'annotations': 导出的标注条数, 'rows': 写出的行数, 'max_updated_at': 导出数据中最大的 updated_at}
+        """
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # 按 annotations 的 (poem_id, model_identifier) 唯一索引顺序读取，无需排序即可流式输出
         query = f"""
             SELECT 
                 p.id as poem_id,
@@ -435,28 +1513,21 @@ class DataManager:
                 a.error_message,
                 a.created_at,
                 a.updated_at
-            FROM poems p
-            INNER JOIN annotations a ON p.id = a.poem_id
+            FROM annotations a
+            INNER JOIN poems p ON p.id = a.poem_id
             {where_clause}
-            ORDER BY p.id, a.model_identifier
+            ORDER BY a.poem_id, a.model_identifier
         """
-        
-        results = self.db_adapter.execute_query(query, tuple(params))
-        
-        # 确定输出文件路径
-        if not output_file:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            model_suffix = f"_{model_filter}" if model_filter else ""
-            output_file = f"data/output/export_{timestamp}{model_suffix}.{output_format}"
-        
-        # 确保输出目录存在
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        if output_format == 'jsonl':
-            with open(output_path, 'w', encoding='utf-8') as f:
-                for row in results:
-                    result_dict = {
+
+        columnar = output_format in COLUMNAR_FORMATS
+        writer = open_export_writer(str(output_path), output_format,
+                                    row_group_size=row_group_size, compression=compression)
+        annotation_count = 0
+        max_updated_at = None
+        try:
+            for rows in self.db_adapter.iter_query(query, tuple(params), batch_size=batch_size):
+                for row in rows:
+                    record = {
                         'poem_id': row[0],
                         'title': row[1], # [修改]
                         'author': row[2],
@@ -465,50 +1536,179 @@ class DataManager:
                         'author_desc': row[5],
                         'model_identifier': row[6],
                         'status': row[7],
-                        'annotation_result': row[8],
+                        'annotation_result': None if columnar else self._rehydrate_result(row[8], row[3]),
                         'error_message': row[9],
                         'created_at': row[10],
                         'updated_at': row[11]
                     }
-                    f.write(json.dumps(result_dict, ensure_ascii=False) + '\n')
+                    sentences = self._decode_annotation_result(row[8], row[3]) if columnar else None
+                    writer.write(record, sentences)
+                    if row[11] and (max_updated_at is None or row[11] > max_updated_at):
+                        max_updated_at = row[11]
+                annotation_count += len(rows)
+                self.logger.debug(f"已导出 {annotation_count} 条标注")
+        finally:
+            writer.close()
+
+        return {'annotations': annotation_count, 'rows': writer.rows_written, 'max_updated_at': max_updated_at}
+
+    def export_results(self, output_format: str = 'jsonl', 
+                       output_file: Optional[str] = None,
+                       model_filter: Optional[str] = None,
+                       since: Optional[str] = None,
+                       until: Optional[str] = None,
+                       batch_size: int = 5000,
+                       row_group_size: int = 100000,
+                       compression: str = 'zstd') -> str:
+        """
+        导出标注结果 - [修改] 导出 'title'
+        jsonl 每条标注一行；parquet / arrow 把句子级标注展开为带类型的列（需要 pyarrow）。
+
+        :param since: 只导出 updated_at >= since 的标注（ISO日期或时间，如 2025-01-01）
+        :param until: 只导出 updated_at < until 的标注
+        :param row_group_size: 列式格式每个行组（记录批）的句子行数
+        :param compression: 列式格式的压缩算法 (zstd/snappy/gzip/lz4/none)
+        """
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {output_format}。支持的格式: {list(EXPORT_FORMATS)}")
+
+        # 构建查询条件（过滤下推到SQL）
+        conditions = []
+        params = []
+        if model_filter:
+            conditions.append("a.model_identifier = ?")
+            params.append(model_filter)
+        if since:
+            conditions.append("a.updated_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("a.updated_at < ?")
+            params.append(until)
+        
+        # 确定输出文件路径
+        if not output_file:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            model_suffix = f"_{model_filter}" if model_filter else ""
+            output_file = f"data/output/export_{timestamp}{model_suffix}.{output_format}"
         
+        # 确保输出目录存在
+        output_path = Path(output_file)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        stats = self._export_to_file(output_path, output_format, conditions, params, batch_size=batch_size,
+                                     row_group_size=row_group_size, compression=compression)
+        self.logger.info(f"导出完成 - 标注: {stats['annotations']} 条, 写出: {stats['rows']} 行, 格式: {output_format}")
         return str(output_file)
 
+    def export_incremental(self, output_dir: Optional[str] = None,
+                           output_format: str = 'jsonl',
+                           model_filter: Optional[str] = None,
+                           lag_seconds: int = 60,
+                           batch_size: int = 5000,
+                           row_group_size: int = 100000,
+                           compression: str = 'zstd') -> Optional[Dict[str, Any]]:
+        """
+        增量导出：只导出自上次成功导出以来 updated_at 有变化的标注，写成输出目录中的一个新分片。
+        水位线保存在目录的 manifest.json 中，分片写完后才推进；导出失败时清单不变，下次从原水位线重试。
+        同一标注再次更新后会出现在后续分片中，下游按分片顺序应用、以最新一条为准。
+
+        :param lag_seconds: 只导出早于（当前时间 - lag_seconds）的更新，给仍在提交中的写入留出余量，
+                            避免它们以更早的时间戳提交而落在水位线之后被漏掉
+        :return: 本次分片的清单条目；没有新的变更时返回 None
+        """
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {output_format}。支持的格式: {list(EXPORT_FORMATS)}")
+
+        if not output_dir:
+            model_suffix = f"_{model_filter}" if model_filter else ""
+            output_dir = f"data/output/incremental{model_suffix}"
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+
+        manifest = load_manifest(output_path)
+        if manifest is None:
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'format': output_format,
+                'model_filter': model_filter,
+                'watermark': None,
+                'shards': []
+            }
+        elif manifest.get('format') != output_format or manifest.get('model_filter') != model_filter:
+            raise ValueError(
+                f"输出目录 {output_path} 已用于格式 {manifest.get('format')}、模型 {manifest.get('model_filter')} 的增量导出，"
+                f"不能改为格式 {output_format}、模型 {model_filter}"
+            )
+
+        from datetime import timezone, timedelta
+        tz = timezone(timedelta(hours=8))  # 东八区
+        cutoff = (datetime.now(tz) - timedelta(seconds=lag_seconds)).isoformat()
+
+        conditions = ["a.updated_at < ?"]
+        params = [cutoff]
+        if manifest['watermark']:
+            conditions.append("a.updated_at > ?")
+            params.append(manifest['watermark'])
+        if model_filter:
+            conditions.append("a.model_identifier = ?")
+            params.append(model_filter)
+
+        shard_index = len(manifest['shards']) + 1
+        shard_name = f"part-{shard_index:05d}.{output_format}"
+        shard_path = output_path / shard_name
+        try:
+            stats = self._export_to_file(shard_path, output_format, conditions, params, batch_size=batch_size,
+                                         row_group_size=row_group_size, compression=compression)
+        except Exception:
+            shard_path.unlink(missing_ok=True)
+            raise
+
+        if not stats['annotations']:
+            shard_path.unlink(missing_ok=True)
+            self.logger.info(f"增量导出: 水位线 {manifest['watermark']} 之后没有新的变更")
+            return None
+
+        shard = {
+            'file': shard_name,
+            'annotations': stats['annotations'],
+            'rows': stats['rows'],
+            'after': manifest['watermark'],
+            'watermark': stats['max_updated_at'],
+            'exported_at': datetime.now(tz).isoformat()
+        }
+        manifest['shards'].append(shard)
+        manifest['watermark'] = stats['max_updated_at']
+        write_manifest(output_path, manifest)
+
+        self.logger.info(f"增量导出完成 - 分片: {shard_path}, 标注: {stats['annotations']} 条, 水位线: {manifest['watermark']}")
+        return shard
+
     def get_annotation_statistics(self) -> Dict[str, Any]:
-        """获取标注统计信息"""
+        """获取标注统计信息（读取计数表）"""
+        by_model: Dict[str, List[int]] = {}
+        by_status: Dict[str, int] = {}
+        for model, status, count in self._annotation_counts():
+            totals = by_model.setdefault(model, [0, 0, 0])
+            totals[0] += count
+            if status == 'completed':
+                totals[1] += count
+            elif status == 'failed':
+                totals[2] += count
+            by_status[status] = by_status.get(status, 0) + count
+
         # 获取总体统计
-        rows = self.db_adapter.execute_query("""
-            SELECT 
-                COUNT(DISTINCT p.id) as total_poems,
-                COUNT(a.id) as total_annotations,
-                COUNT(CASE WHEN a.status = 'completed' THEN 1 END) as completed_annotations,
-                COUNT(CASE WHEN a.status = 'failed' THEN 1 END) as failed_annotations
-            FROM poems p
-            LEFT JOIN annotations a ON p.id = a.poem_id
-        """)
-        
-        overall_stats = rows[0]
+        overall_stats = (
+            self._table_count('poems'),
+            sum(by_status.values()),
+            by_status.get('completed', 0),
+            by_status.get('failed', 0)
+        )
         
         # 按模型统计
-        model_stats = self.db_adapter.execute_query("""
-            SELECT 
-                model_identifier,
-                COUNT(*) as total,
-                COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed,
-                COUNT(CASE WHEN status = 'failed' THEN 1 END) as failed
-            FROM annotations
-            GROUP BY model_identifier
-            ORDER BY model_identifier
-        """)
+        model_stats = [(model, *totals) for model, totals in by_model.items()]
         
         # 按状态统计
-        status_stats = self.db_adapter.execute_query("""
-            SELECT 
-                status,
-                COUNT(*) as count
-            FROM annotations
-            GROUP BY status
-        """)
+        status_stats = by_status.items()
         
         return {
             'overall': {
@@ -538,8 +1738,12 @@ class DataManager:
         
         return [dict(row) for row in rows]
 
-    def search_poems(self, author: Optional[str] = None, title: Optional[str] = None, page: int = 1, per_page: int = 10) -> Dict[str, Any]:
-        """根据作者和标题搜索诗词，并支持分页 - [修改] 适配 'title'"""
+    def search_poems(self, author: Optional[str] = None, title: Optional[str] = None, page: int = 1, per_page: int = 10,
+                     text: Optional[str] = None) -> Dict[str, Any]:
+        """
+        根据作者、标题和正文片段搜索诗词，并支持分页 - [修改] 适配 'title'
+        标题和正文（忽略标点）在至少3个字符时走 poems_fts 全文索引。
+        """
         # [修改] 查询 'title'
         query = "SELECT p.id, p.title, p.author, p.paragraphs, p.full_text, au.description as author_desc FROM poems p LEFT JOIN authors au ON p.author = au.name"
         conditions = []
@@ -551,9 +1755,20 @@ class DataManager:
         
         if title:
             # [修改] 按 'title' 字段搜索
-            conditions.append("p.title LIKE ?")
+            if self.db_adapter.fts_enabled and len(title) >= 3:
+                conditions.append("p.id IN (SELECT rowid FROM poems_fts WHERE title LIKE ?)")
+            else:
+                conditions.append("p.title LIKE ?")
             params.append(f"%{title}%")
 
+        needle = normalize_search_text(text) if text else ''
+        if needle:
+            if self.db_adapter.fts_enabled and len(needle) >= 3:
+                conditions.append("p.id IN (SELECT rowid FROM poems_fts WHERE body LIKE ?)")
+            else:
+                conditions.append(f"{normalized_text_sql('p.full_text')} LIKE ?")
+            params.append(f"%{needle.replace('%', '_')}%")
+
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
         
@@ -598,19 +1813,14 @@ class DataManager:
 
         completed_ids = set()
         try:
-            # 使用参数化查询防止SQL注入
-            placeholders = ','.join('?' * len(poem_ids))
-            query = f"""
-                SELECT poem_id
-                FROM annotations
-                WHERE 
-                    poem_id IN ({placeholders})
-                    AND model_identifier = ?
-                    AND status = 'completed'
+            # ID集合写入临时表后做一次索引连接，不受参数数量上限限制
+            query = """
+                SELECT an.poem_id
+                FROM {ids} t
+                JOIN annotations an
+                    ON an.model_identifier = ? AND an.poem_id = t.id AND an.status = 'completed'
             """
-            
-            params = poem_ids + [model_identifier]
-            rows = self.db_adapter.execute_query(query, tuple(params))
+            rows = self.db_adapter.execute_query_with_ids(query, poem_ids, (model_identifier,))
             
             # 使用生成器表达式和 set.update 最高效地处理结果
             completed_ids.update(row[0] for row in rows)
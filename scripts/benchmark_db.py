@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+数据库访问基准测试
+- query: 在临时数据库上对比“每次调用新建连接”（旧行为）与 SQLiteAdapter 持久连接的单次查询/更新开销。
+- ingest: 对比“全部加载后逐行插入”（旧行为）与流式 executemany 导入诗词语料的耗时和内存峰值。
+"""
+
+import sys
+import os
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# 添加项目根目录到Python路径，确保能正确导入src下的模块
+project_root = Path(__file__).parent.parent.absolute()
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.db_adapter import SQLiteAdapter, normalize_poem_data
+from src.data_manager import DataManager
+
+
+def _populate(adapter: SQLiteAdapter, poem_count: int):
+    """写入测试用的诗词数据"""
+    adapter.init_database()
+    conn = adapter.connect()
+    conn.executemany(
+        "INSERT INTO poems (id, title, author, paragraphs, full_text) VALUES (?, ?, ?, ?, ?)",
+        ((i, f"诗{i}", f"作者{i % 100}", '["床前明月光，疑是地上霜。"]', "床前明月光，疑是地上霜。")
+         for i in range(1, poem_count + 1))
+    )
+    conn.commit()
+    conn.close()
+
+
+def _connect_per_call_query(db_path: str, query: str, params: tuple):
+    """旧行为：每次查询新建并关闭连接"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+    return rows
+
+
+def _connect_per_call_update(db_path: str, query: str, params: tuple):
+    """旧行为：每次更新新建连接并提交"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(query, params)
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+def _time_per_op(func, iterations: int) -> float:
+    """返回每次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run_benchmark(iterations: int, poem_count: int):
+    query = "SELECT id, title, author, paragraphs FROM poems WHERE id = ?"
+    update = ("INSERT INTO annotations (poem_id, model_identifier, status, annotation_result, created_at, updated_at) "
+              "VALUES (?, ?, 'completed', '[]', '', '') "
+              "ON CONFLICT(poem_id, model_identifier) DO UPDATE SET updated_at = excluded.updated_at")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 旧行为使用默认的回滚日志模式，单独建库以免受WAL设置影响
+        legacy_path = os.path.join(tmp_dir, 'legacy.db')
+        legacy = SQLiteAdapter(legacy_path, pragmas={'journal_mode': 'DELETE', 'synchronous': 'FULL'})
+        _populate(legacy, poem_count)
+        legacy.close()
+
+        pooled_path = os.path.join(tmp_dir, 'pooled.db')
+        pooled = SQLiteAdapter(pooled_path)
+        _populate(pooled, poem_count)
+
+        results = {
+            '查询 - 每次新建连接': _time_per_op(
+                lambda i: _connect_per_call_query(legacy_path, query, (i % poem_count + 1,)), iterations),
+            '查询 - 持久连接(WAL)': _time_per_op(
+                lambda i: pooled.execute_query(query, (i % poem_count + 1,)), iterations),
+            '更新 - 每次新建连接': _time_per_op(
+                lambda i: _connect_per_call_update(legacy_path, update, (i % poem_count + 1, 'bench')), iterations),
+            '更新 - 持久连接(WAL)': _time_per_op(
+                lambda i: pooled.execute_update(update, (i % poem_count + 1, 'bench')), iterations),
+        }
+        pooled.close()
+
+    print(f"\n=== 数据库访问微基准 (迭代: {iterations}, 诗词: {poem_count}) ===")
+    for name, micros in results.items():
+        print(f"{name:<20}{micros:>12.1f} µs/次")
+    print()
+
+
+def _write_synthetic_corpus(source_dir: str, poem_count: int, per_file: int = 1000):
+    """按 chinese-poetry 的文件格式生成合成语料 (poet.tang.N.json)"""
+    for file_index, start in enumerate(range(0, poem_count, per_file)):
+        poems = [
+            {
+                'author': f"作者{i % 3000}",
+                'title': f"诗{i}",
+                'paragraphs': ["床前明月光，疑是地上霜。", "举头望明月，低头思故乡。"],
+            }
+            for i in range(start, min(start + per_file, poem_count))
+        ]
+        with open(os.path.join(source_dir, f"poet.tang.{file_index * per_file}.json"), 'w', encoding='utf-8') as f:
+            json.dump(poems, f, ensure_ascii=False)
+
+
+def _legacy_ingest(dm: DataManager) -> int:
+    """旧行为：全部JSON加载到一个列表后逐行 execute 插入"""
+    poems = dm.load_all_json_files()
+    conn = sqlite3.connect(dm.db_path)
+    cursor = conn.cursor()
+    for offset, poem_data in enumerate(poems):
+        normalized = normalize_poem_data(poem_data)
+        paragraphs = normalized.get('paragraphs', [])
+        cursor.execute(
+            "INSERT OR REPLACE INTO poems (id, title, author, paragraphs, full_text, author_desc, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (offset + 1, normalized.get('title', ''), normalized.get('author', ''),
+             json.dumps(paragraphs, ensure_ascii=False), '\n'.join(paragraphs), '', '', '')
+        )
+    conn.commit()
+    conn.close()
+    return len(poems)
+
+
+def _measure(func, trace_memory: bool):
+    """返回 (结果, 耗时秒, 内存峰值MB)"""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak_mb = 0.0
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return result, elapsed, peak_mb
+
+
+def run_ingest_benchmark(source_dir: str, synthetic: int, trace_memory: bool, skip_legacy: bool,
+                         workers: int = 0):
+    source_label = source_dir or f"合成语料 {synthetic} 首"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if not source_dir:
+            source_dir = os.path.join(tmp_dir, 'corpus')
+            os.makedirs(source_dir)
+            _write_synthetic_corpus(source_dir, synthetic)
+
+        results = {}
+        if not skip_legacy:
+            legacy_dm = DataManager(os.path.join(tmp_dir, 'legacy.db'), source_dir, tmp_dir)
+            results['旧行为 (全部加载 + 逐行插入)'] = _measure(lambda: _legacy_ingest(legacy_dm), trace_memory)
+            legacy_dm.close()
+
+        stream_dm = DataManager(os.path.join(tmp_dir, 'stream.db'), source_dir, tmp_dir)
+        results['流式 executemany (单进程)'] = _measure(
+            lambda: stream_dm.bulk_insert_poem_rows(stream_dm.iter_normalized_poem_rows(workers=1), start_id=1),
+            trace_memory
+        )
+        stream_dm.close()
+
+        if workers != 1:
+            parallel_dm = DataManager(os.path.join(tmp_dir, 'parallel.db'), source_dir, tmp_dir)
+            results[f"流式 executemany ({workers or os.cpu_count()} 进程解析)"] = _measure(
+                lambda: parallel_dm.bulk_insert_poem_rows(parallel_dm.iter_normalized_poem_rows(workers=workers),
+                                                          start_id=1),
+                trace_memory
+            )
+            parallel_dm.close()
+
+    print(f"\n=== 诗词导入基准 (数据源: {source_label}) ===")
+    for name, (count, elapsed, peak_mb) in results.items():
+        rate = count / elapsed if elapsed else 0
+        memory = f", 内存峰值 {peak_mb:.1f} MB" if trace_memory else ""
+        print(f"{name:<32}{count:>10} 首 {elapsed:>8.2f} 秒 ({rate:,.0f} 首/秒){memory}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库访问基准测试')
+    subparsers = parser.add_subparsers(dest='command')
+
+    query_parser = subparsers.add_parser('query', help='单次查询/更新开销对比 (默认)')
+    query_parser.add_argument('--iterations', type=int, default=2000, help='每项测试的调用次数 (默认: 2000)')
+    query_parser.add_argument('--poems', type=int, default=10000, help='测试数据库中的诗词数量 (默认: 10000)')
+
+    ingest_parser = subparsers.add_parser('ingest', help='诗词语料导入耗时与内存对比')
+    ingest_parser.add_argument('--source-dir', help='chinese-poetry JSON 目录；不指定则生成合成语料')
+    ingest_parser.add_argument('--synthetic', type=int, default=100000, help='合成语料的诗词数量 (默认: 100000)')
+    ingest_parser.add_argument('--trace-memory', action='store_true', help='使用 tracemalloc 统计内存峰值（会变慢）')
+    ingest_parser.add_argument('--skip-legacy', action='store_true', help='只测试流式导入')
+    ingest_parser.add_argument('--workers', type=int, default=0, help='并行解析的进程数 (默认: CPU核数)')
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        run_ingest_benchmark(args.source_dir, args.synthetic, args.trace_memory, args.skip_legacy, args.workers)
+    else:
+        run_benchmark(getattr(args, 'iterations', 2000), getattr(args, 'poems', 10000))
+
+
+if __name__ == '__main__':
+    main()
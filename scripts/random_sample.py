@@ -11,6 +11,7 @@ if project_root not in sys.path:
 
 from src.data_manager import DataManager
 from src.config_manager import config_manager
+from src.db_router import MultiDatabaseRouter
 
 def get_random_poem_ids(db_path, sample_size=1, filter_enabled=False, exclude_annotated=False, model_identifier=None):
     """
@@ -36,43 +37,27 @@ def get_random_poem_ids(db_path, sample_size=1, filter_enabled=False, exclude_an
         if filter_enabled:
             where_conditions.append(filter_clause)
         
-        # 如果需要排除已标注的诗词
-        completed_ids_list = []
+        # 如果需要排除已标注的诗词：使用 NOT EXISTS 子查询，由 annotations 上的索引完成判断，
+        # 不再把已完成的ID展开成超长的 NOT IN (?, ?, ...) 参数列表
+        query_params = []
         if exclude_annotated:
             if model_identifier:
-                # 查询指定模型已成功标注的诗词ID
-                completed_query = """
-                    SELECT poem_id FROM annotations 
-                    WHERE model_identifier = ? AND status = 'completed'
-                """
-                cursor.execute(completed_query, (model_identifier,))
-                completed_ids = {row[0] for row in cursor.fetchall()}
+                # 排除指定模型已成功标注的诗词
+                where_conditions.append(
+                    "NOT EXISTS (SELECT 1 FROM annotations an WHERE an.poem_id = poems.id "
+                    "AND an.model_identifier = ? AND an.status = 'completed')"
+                )
+                query_params.append(model_identifier)
             else:
-                # 查询所有已成功标注的诗词ID（不区分模型）
-                completed_query = """
-                    SELECT poem_id FROM annotations 
-                    WHERE status = 'completed'
-                """
-                cursor.execute(completed_query)
-                completed_ids = {row[0] for row in cursor.fetchall()}
-            
-            if completed_ids:
-                # 构造排除已完成ID的条件
-                placeholders = ','.join('?' * len(completed_ids))
-                where_conditions.append(f"id NOT IN ({placeholders})")
-                completed_ids_list = list(completed_ids)
+                # 排除任何模型已成功标注的诗词
+                where_conditions.append(
+                    "NOT EXISTS (SELECT 1 FROM annotations an WHERE an.poem_id = poems.id AND an.status = 'completed')"
+                )
         
         # 构建WHERE子句
         where_clause = ""
-        query_params = []
         if where_conditions:
             where_clause = "WHERE " + " AND ".join(where_conditions)
-            if exclude_annotated and model_identifier:
-                query_params.extend([model_identifier] + completed_ids_list)
-            elif exclude_annotated and not model_identifier:
-                query_params.extend(completed_ids_list)
-            elif completed_ids_list:
-                query_params.extend(completed_ids_list)
         
         # 获取最大ID和符合条件的记录总数
         cursor.execute("SELECT MAX(id) FROM poems")
@@ -106,7 +91,8 @@ def get_random_poem_ids(db_path, sample_size=1, filter_enabled=False, exclude_an
             random.shuffle(all_ids) 
             selected_ids.update(all_ids[:sample_size]) 
         else:
-            # 传统随机抽样
+            # 传统随机抽样：候选ID写入临时表后与 poems 连接，避免超长的 IN 参数列表
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS candidate_ids (id INTEGER PRIMARY KEY)")
             while len(selected_ids) < sample_size:
                 ids_to_fetch_more = sample_size - len(selected_ids)
                 candidates_k = min(max_id, ids_to_fetch_more * 2 if ids_to_fetch_more > 0 else 1) 
@@ -115,25 +101,20 @@ def get_random_poem_ids(db_path, sample_size=1, filter_enabled=False, exclude_an
                 potential_candidate_ids = random.sample(range(1, max_id + 1), candidates_k)
                 if not potential_candidate_ids: break
 
-                placeholders = ','.join('?' * len(potential_candidate_ids))
+                cursor.execute("DELETE FROM candidate_ids")
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO candidate_ids (id) VALUES (?)",
+                    ((pid,) for pid in potential_candidate_ids)
+                )
                 
                 # --- 动态拼接查询语句 --- 
-                query = f"SELECT id FROM poems WHERE id IN ({placeholders})"
-                query_params_local = list(potential_candidate_ids)
+                query = "SELECT id FROM poems WHERE id IN (SELECT id FROM candidate_ids)"
                 
                 # 添加过滤条件
                 if where_conditions:
-                    query += f" AND {filter_clause}" if filter_enabled else ""
-                    if exclude_annotated and model_identifier and completed_ids_list:
-                        completed_placeholders = ','.join('?' * len(completed_ids_list))
-                        query += f" AND id NOT IN ({completed_placeholders})"
-                        query_params_local.extend(completed_ids_list)
-                    elif exclude_annotated and not model_identifier and completed_ids_list:
-                        completed_placeholders = ','.join('?' * len(completed_ids_list))
-                        query += f" AND id NOT IN ({completed_placeholders})"
-                        query_params_local.extend(completed_ids_list)
+                    query += " AND " + " AND ".join(where_conditions)
                 
-                cursor.execute(query, query_params_local)
+                cursor.execute(query, query_params)
                 # 只添加需要的数量，避免超过sample_size
                 fetched_ids = [row[0] for row in cursor.fetchall()]
                 for pid in fetched_ids:
@@ -160,6 +141,52 @@ def get_random_poem_ids(db_path, sample_size=1, filter_enabled=False, exclude_an
         if conn:
             conn.close()
 
+def get_random_poem_ids_all_dbs(db_paths, sample_size=1, filter_enabled=False, exclude_annotated=False, model_identifier=None):
+    """
+    在所有数据库中随机抽取诗词ID（各库的ID由 id_prefix 保证全局唯一）。
+    通过 MultiDatabaseRouter 的 all_poems / all_annotations 视图一条SQL完成，
+    各库诗词被抽中的概率相同，不按库数平分名额。
+    """
+    where_conditions = []
+    query_params = []
+    if filter_enabled:
+        where_conditions.append("(IFNULL(p.title, '') || IFNULL(p.author, '') || IFNULL(p.full_text, '')) NOT LIKE '%□%'")
+    if exclude_annotated:
+        # 诗词ID只在本库内与标注对应，因此同时比较 db_name
+        annotated = ("NOT EXISTS (SELECT 1 FROM all_annotations an WHERE an.db_name = p.db_name "
+                     "AND an.poem_id = p.id AND an.status = 'completed'")
+        if model_identifier:
+            annotated += " AND an.model_identifier = ?"
+            query_params.append(model_identifier)
+        where_conditions.append(annotated + ")")
+    where_clause = ("WHERE " + " AND ".join(where_conditions)) if where_conditions else ""
+
+    try:
+        with MultiDatabaseRouter(db_paths) as router:
+            # ORDER BY RANDOM() LIMIT n 只保留前 n 行，不对全部诗词排序
+            rows = router.execute_query(
+                f"SELECT p.id FROM all_poems p {where_clause} ORDER BY RANDOM() LIMIT ?",
+                tuple(query_params) + (sample_size,)
+            )
+    except (sqlite3.Error, FileNotFoundError, ValueError) as e:
+        print(f"数据库错误: {e}", file=sys.stderr)
+        return []
+    if not rows:
+        print("数据库中没有符合条件的诗词记录。", file=sys.stderr)
+    return [row[0] for row in rows]
+
+def get_all_db_paths():
+    """
+    获取配置中的所有数据库路径 {数据库名: 路径}
+    """
+    db_config = config_manager.get_database_config()
+    if db_config.get('db_paths'):
+        return dict(db_config['db_paths'])
+    elif db_config.get('db_path'):
+        return {'default': db_config['db_path']}
+    else:
+        raise ValueError("配置中未找到数据库路径。")
+
 def get_db_path_by_name(db_name):
     """
     根据数据库名称获取数据库路径
@@ -180,6 +207,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='随机抽取诗词ID并输出到文件')
     parser.add_argument('--db', type=str, default='poetry.db', help='SQLite数据库文件路径 (默认: poetry.db)')
     parser.add_argument('--db-name', type=str, help='数据库名称（从配置文件中获取路径）')
+    parser.add_argument('--all-dbs', action='store_true', help='从配置中的所有数据库抽样（ATTACH 后一次查询完成）')
     parser.add_argument('-n', '--count', type=int, default=1, help='要抽取的诗词ID数量 (默认: 1)')
     
     parser.add_argument('--filter-missing', action='store_true', 
@@ -205,6 +233,8 @@ if __name__ == "__main__":
     # --- 互斥参数检查 ---
     if args.db_name and args.db and args.db != 'poetry.db':
         parser.error("错误: --db-name 和 --db 参数不能同时使用。")
+    if args.all_dbs and (args.db_name or args.db != 'poetry.db'):
+        parser.error("错误: --all-dbs 不能与 --db-name 或 --db 参数同时使用。")
         
     if args.output_file:
         if args.output_dir:
@@ -226,13 +256,27 @@ if __name__ == "__main__":
             sys.exit(1)
 
     # --- 获取诗词ID ---
-    poem_ids = get_random_poem_ids(
-        db_path, 
-        args.count, 
-        filter_enabled=args.filter_missing,
-        exclude_annotated=args.exclude_annotated,
-        model_identifier=args.model
-    )
+    if args.all_dbs:
+        try:
+            all_db_paths = get_all_db_paths()
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            sys.exit(1)
+        poem_ids = get_random_poem_ids_all_dbs(
+            all_db_paths,
+            args.count,
+            filter_enabled=args.filter_missing,
+            exclude_annotated=args.exclude_annotated,
+            model_identifier=args.model
+        )
+    else:
+        poem_ids = get_random_poem_ids(
+            db_path, 
+            args.count, 
+            filter_enabled=args.filter_missing,
+            exclude_annotated=args.exclude_annotated,
+            model_identifier=args.model
+        )
     
     # --- 处理输出排序 ---
     if args.sort:
@@ -22,6 +22,9 @@ project_root = Path(__file__).resolve().parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
+# 全文检索辅助函数（仅依赖标准库）
+from src.db_adapter import normalize_search_text, search_poem_ids_by_text
+
 # 初始化全局变量
 config_manager = None
 DataManager = None
@@ -119,18 +122,14 @@ def extract_and_validate_json_blocks(log_file_path: str, cache_file_path: str) -
     return validated_json_blocks
 
 def search_poems_by_sentence(cursor: sqlite3.Cursor, sentence_text: str, candidate_ids: Optional[List[int]] = None) -> List[int]:
-    cleaned_text = re.sub(r'[，。？！\s]', '', sentence_text.strip())
-    if not cleaned_text:
+    """按句子（忽略标点）查找诗词ID；给定 candidate_ids 时只在候选中筛选。使用 poems_fts 全文索引。"""
+    if not normalize_search_text(sentence_text):
         return candidate_ids if candidate_ids is not None else []
-    query = "SELECT id FROM poems WHERE REPLACE(REPLACE(REPLACE(REPLACE(full_text, '，', ''), '。', ''), '？', ''), '！', '') LIKE ?"
-    params = [f'%{cleaned_text}%']
-    if candidate_ids:
-        if not candidate_ids: return []
-        placeholders = ','.join('?' * len(candidate_ids))
-        query += f" AND id IN ({placeholders})"
-        params.extend(candidate_ids)
-    cursor.execute(query, params)
-    return [row[0] for row in cursor.fetchall()]
+    poem_ids = search_poem_ids_by_text(cursor, sentence_text)
+    if candidate_ids is not None:
+        candidates = set(candidate_ids)
+        poem_ids = [poem_id for poem_id in poem_ids if poem_id in candidates]
+    return poem_ids
 
 def find_poem_id_for_annotation(cursor: sqlite3.Cursor, annotation_block: List[Dict[str, Any]]) -> Optional[int]:
     sentences = [item['sentence_text'] for item in annotation_block if item.get('sentence_text')]
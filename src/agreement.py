@@ -0,0 +1,68 @@
+"""
+多模型标注一致性计算
+
+基于 annotations 表中已保存的标注结果，在句子级别比较不同模型给出的主情感，
+供共识早停（多模型分波次调度）等模式判断是否还需要更多模型参与，
+也用于回填规划时按分歧程度为新模型排列待标注诗词。
+"""
+
+import json
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Union
+
+
+def primary_labels_from_result(annotation_result: Union[str, List[Dict], None]) -> Dict[str, str]:
+    """
+    从一条标注结果中提取 {句子ID: 主情感}。
+    annotation_result 可以是 annotations 表中保存的JSON字符串，也可以是已解码的列表。
+    无法解析时返回空字典。
+    """
+    if not annotation_result:
+        return {}
+    if isinstance(annotation_result, str):
+        try:
+            annotation_result = json.loads(annotation_result)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+    if not isinstance(annotation_result, list):
+        return {}
+    return {
+        item['sentence_id']: item.get('primary_emotion')
+        for item in annotation_result
+        if isinstance(item, dict) and 'sentence_id' in item
+    }
+
+
+def sentence_agreement(label_maps: List[Dict[str, str]]) -> Optional[float]:
+    """
+    计算多个模型在主情感上完全一致的句子占比。
+    只比较所有模型都给出标注的句子；不足两个模型时返回 None（无法判断一致性）。
+    """
+    label_maps = [labels for labels in label_maps if labels]
+    if len(label_maps) < 2:
+        return None
+    shared_ids = set(label_maps[0]).intersection(*label_maps[1:])
+    if not shared_ids:
+        return 0.0
+    agreed = sum(1 for sentence_id in shared_ids if len({labels[sentence_id] for labels in label_maps}) == 1)
+    return agreed / len(shared_ids)
+
+
+def primary_entropy(label_maps: List[Dict[str, str]]) -> Optional[float]:
+    """
+    计算各句主情感分布的香农熵（以2为底）的平均值，衡量模型间分歧的程度。
+    所有模型一致时为0；不足两个模型时返回 None。
+    """
+    label_maps = [labels for labels in label_maps if labels]
+    if len(label_maps) < 2:
+        return None
+    sentence_ids = set().union(*label_maps)
+    if not sentence_ids:
+        return None
+    total = 0.0
+    for sentence_id in sentence_ids:
+        counts = Counter(labels[sentence_id] for labels in label_maps if sentence_id in labels)
+        n = sum(counts.values())
+        total -= sum((c / n) * math.log2(c / n) for c in counts.values())
+    return total / len(sentence_ids)
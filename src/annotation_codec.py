@@ -0,0 +1,166 @@
+"""
+标注结果的紧凑存储格式
+
+annotations.annotation_result 默认保存完整的JSON数组，每一句都重复保存 sentence_text，
+而这些文本在 poems.paragraphs 中已经有一份。紧凑格式只保存句子序号和驻留（interned）
+为整数编码的情感ID，句子文本与句子ID在读取时根据诗词原文还原，得到与原JSON逐字节相同的结果。
+
+二进制布局（小端）：
+    1字节格式标记，COMPACT_RAW_FP / COMPACT_ZLIB_FP 后跟8字节的原文指纹（编码时诗词句子列表的哈希），
+    其后为（可能经zlib压缩的）句子记录序列；
+    每条记录为 <句子序号 uint16, 主情感编码 uint16 (0 表示无), 次情感数量 uint8>，
+    后跟若干个次情感编码 uint16。
+早期写入的 COMPACT_RAW / COMPACT_ZLIB 没有原文指纹，只能校验句子序号是否越界。
+
+紧凑格式依赖诗词原文才能还原：原文被修订后指纹不再一致，decode_compact 拒绝还原（StaleCompactError），
+不会把情感标注套到模型从未见过的文本上。导入修订后的原文前应先把受影响的结果改写回JSON。
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import struct
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+COMPACT_RAW = 0x01
+COMPACT_ZLIB = 0x02
+COMPACT_RAW_FP = 0x03
+COMPACT_ZLIB_FP = 0x04
+FINGERPRINT_SIZE = 8
+
+_SENTENCE_ID_RE = re.compile(r'^S(\d+)$')
+_RECORD = struct.Struct('<HHB')
+_MAX_INDEX = 0xFFFF
+_MAX_SECONDARY = 0xFF
+
+
+class StaleCompactError(ValueError):
+    """紧凑数据的原文指纹与当前诗词原文不一致（原文已被修订），无法可靠还原"""
+
+
+def paragraphs_fingerprint(paragraphs: List[str]) -> bytes:
+    """句子列表的8字节指纹（逐句分隔，句子边界变化也会改变指纹）"""
+    return hashlib.md5('\x1f'.join(paragraphs).encode('utf-8')).digest()[:FINGERPRINT_SIZE]
+
+
+def is_compact(value: Any) -> bool:
+    """判断数据库中读出的 annotation_result 是否为紧凑格式（BLOB）"""
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+def collect_emotions(results: Iterable[Dict[str, Any]]) -> Set[str]:
+    """收集一条标注结果中出现的所有情感ID，用于事先驻留编码"""
+    emotions = set()
+    for item in results:
+        if not isinstance(item, dict):
+            continue
+        if isinstance(item.get('primary_emotion'), str):
+            emotions.add(item['primary_emotion'])
+        secondary = item.get('secondary_emotions')
+        if isinstance(secondary, list):
+            emotions.update(e for e in secondary if isinstance(e, str))
+    return emotions
+
+
+def encode_compact(results: List[Dict[str, Any]], emotion_codes: Dict[str, int],
+                   paragraphs: List[str]) -> Optional[bytes]:
+    """
+    把标注结果（已解码的列表）编码为紧凑格式。
+    句子ID必须为 S1, S2...，且句子文本必须与诗词原文逐句一致，否则无法无损还原，返回 None
+    （调用方应回退为保存原JSON）。
+    """
+    if not isinstance(results, list) or not results:
+        return None
+    body = bytearray()
+    for item in results:
+        if not isinstance(item, dict) or set(item) != {'sentence_id', 'sentence_text', 'primary_emotion', 'secondary_emotions'}:
+            return None
+        match = _SENTENCE_ID_RE.match(str(item['sentence_id']))
+        if not match:
+            return None
+        index = int(match.group(1)) - 1
+        if not 0 <= index < min(len(paragraphs), _MAX_INDEX) or paragraphs[index] != item['sentence_text']:
+            return None
+        primary = item['primary_emotion']
+        secondary = item['secondary_emotions']
+        if primary is not None and (not isinstance(primary, str) or primary not in emotion_codes):
+            return None
+        if not isinstance(secondary, list) or len(secondary) > _MAX_SECONDARY \
+                or any(not isinstance(e, str) or e not in emotion_codes for e in secondary):
+            return None
+        body += _RECORD.pack(index, emotion_codes[primary] if primary is not None else 0, len(secondary))
+        body += struct.pack(f'<{len(secondary)}H', *(emotion_codes[e] for e in secondary))
+
+    fingerprint = paragraphs_fingerprint(paragraphs)
+    compressed = zlib.compress(bytes(body), 9)
+    # 短诗的记录本身只有几十字节，压缩反而更大，只在确有收益时使用
+    if len(compressed) < len(body):
+        return bytes([COMPACT_ZLIB_FP]) + fingerprint + compressed
+    return bytes([COMPACT_RAW_FP]) + fingerprint + bytes(body)
+
+
+def decode_compact(blob: Union[bytes, memoryview], emotion_names: Dict[int, str],
+                   paragraphs: List[str]) -> List[Dict[str, Any]]:
+    """
+    把紧凑格式还原为标注结果列表，结构与 Annotator 生成的JSON一致。
+    原文指纹不一致时抛出 StaleCompactError，数据损坏或句子序号越界时抛出 ValueError。
+    """
+    blob = bytes(blob)
+    if not blob:
+        raise ValueError("紧凑标注数据为空")
+    marker = blob[0]
+    if marker in (COMPACT_RAW_FP, COMPACT_ZLIB_FP):
+        if blob[1:1 + FINGERPRINT_SIZE] != paragraphs_fingerprint(paragraphs):
+            raise StaleCompactError("诗词原文已变化，紧凑标注数据无法按当前原文还原")
+        payload = blob[1 + FINGERPRINT_SIZE:]
+    elif marker in (COMPACT_RAW, COMPACT_ZLIB):
+        payload = blob[1:]
+    else:
+        raise ValueError(f"未知的紧凑标注格式标记: {marker}")
+    try:
+        body = zlib.decompress(payload) if marker in (COMPACT_ZLIB, COMPACT_ZLIB_FP) else payload
+    except zlib.error as e:
+        raise ValueError(f"紧凑标注数据损坏: {e}") from e
+
+    results = []
+    offset = 0
+    while offset < len(body):
+        try:
+            index, primary_code, secondary_count = _RECORD.unpack_from(body, offset)
+            offset += _RECORD.size
+            secondary_codes = struct.unpack_from(f'<{secondary_count}H', body, offset)
+        except struct.error as e:
+            raise ValueError(f"紧凑标注数据损坏: {e}") from e
+        offset += 2 * secondary_count
+        if index >= len(paragraphs):
+            raise StaleCompactError(f"句子序号 S{index + 1} 超出诗词原文的句数 {len(paragraphs)}")
+        results.append({
+            "sentence_id": f"S{index + 1}",
+            "sentence_text": paragraphs[index],
+            "primary_emotion": emotion_names[primary_code] if primary_code else None,
+            "secondary_emotions": [emotion_names[code] for code in secondary_codes]
+        })
+    return results
+
+
+def rehydrate(value: Any, emotion_names: Dict[int, str], paragraphs: Union[str, List[str], None]) -> Any:
+    """
+    读取时透明还原：紧凑格式还原为JSON字符串，其余值（JSON字符串、None）原样返回。
+    paragraphs 可以是 poems.paragraphs 中的JSON字符串或已解码的列表。
+    """
+    if not is_compact(value):
+        return value
+    if isinstance(paragraphs, str):
+        paragraphs = json.loads(paragraphs)
+    return json.dumps(decode_compact(value, emotion_names, paragraphs or []), ensure_ascii=False)
+
+
+def load_emotion_names(cursor) -> Dict[int, str]:
+    """读取 emotion_codes 表，返回 {编码: 情感ID}；表不存在时返回空字典"""
+    try:
+        cursor.execute("SELECT code, emotion_id FROM emotion_codes")
+    except sqlite3.OperationalError:
+        return {}
+    return {code: emotion_id for code, emotion_id in cursor.fetchall()}
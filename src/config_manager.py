@@ -81,7 +81,8 @@ class ConfigManager:
             'max_workers': self.config.getint('LLM', 'max_workers'),
             'max_model_pipelines': self.config.getint('LLM', 'max_model_pipelines'),
             'max_retries': self.config.getint('LLM', 'max_retries'),
-            'retry_delay': self.config.getint('LLM', 'retry_delay')
+            'retry_delay': self.config.getint('LLM', 'retry_delay'),
+            'save_batch_size': self.config.getint('LLM', 'save_batch_size', fallback=20)
         }
     
     def get_model_config(self, config_name: str) -> Dict[str, Any]:
@@ -135,6 +136,12 @@ class ConfigManager:
         # 如果都没有配置，则返回空字典
         return {}
     
+    def get_storage_config(self) -> Dict[str, str]:
+        """获取标注结果存储格式配置 (json: 完整JSON文本; compact: 句子序号 + 情感编码的紧凑格式)"""
+        return {
+            'annotation_storage': self.config.get('Database', 'annotation_storage', fallback='json')
+        }
+
     def get_data_config(self) -> Dict[str, str]:
         """获取数据路径配置"""
         return {
@@ -209,6 +216,7 @@ class ConfigManager:
         all_configs = {
             'llm': self.get_llm_config(),
             'database': self.get_database_config(),
+            'storage': self.get_storage_config(),
             'data': self.get_data_config(),
             'categories': self.get_categories_config(),
             'prompt': self.get_prompt_config(),
@@ -1,6 +1,10 @@
+import re
+import hashlib
 import sqlite3
 import logging
-from typing import Dict, Any, Optional, List
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterable, Iterator
 from abc import ABC, abstractmethod
 
 
@@ -10,6 +14,10 @@ class DatabaseAdapter(ABC):
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.logger = logging.getLogger(__name__)
+        # 是否可用诗词全文索引 (poems_fts)，由 init_database 确定
+        self.fts_enabled = False
+        # 是否可用 annotations 的整数时间戳列 (created_at_epoch / updated_at_epoch)，由 init_database 确定
+        self.epoch_columns = False
     
     @abstractmethod
     def connect(self):
@@ -31,13 +39,89 @@ class DatabaseAdapter(ABC):
         """执行更新操作"""
         pass
 
+    @abstractmethod
+    def execute_many(self, query: str, params_seq) -> int:
+        """在一个事务中批量执行同一条更新语句"""
+        pass
+
+    @abstractmethod
+    def execute_query_with_ids(self, query: str, ids: Iterable[int], params: Optional[tuple] = None):
+        """以一组ID作为可连接的集合执行查询（query 中用 {ids} 引用该集合）"""
+        pass
+
+    @abstractmethod
+    def iter_query(self, query: str, params: Optional[tuple] = None, batch_size: int = 5000) -> Iterator[List[Any]]:
+        """分批产出查询结果，不把整个结果集读入内存"""
+        pass
+
+    @abstractmethod
+    def transaction(self):
+        """上下文管理器：返回一个游标，块内的多条语句在同一个事务中提交或回滚"""
+        pass
+
+    def close(self):
+        """释放适配器持有的连接（默认无操作）"""
+        pass
+
 
 class SQLiteAdapter(DatabaseAdapter):
-    """SQLite数据库适配器"""
-    
+    """
+    SQLite数据库适配器
+    每个线程复用一个持久连接（WAL模式 + 调优的PRAGMA），避免每次查询重复打开连接，
+    并允许标注进程写入的同时可视化工具并发读取。
+    """
+
+    # 连接级PRAGMA：WAL允许读写并发；busy_timeout 让写锁冲突时等待而不是立即报 "database is locked"
+    DEFAULT_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,        # 毫秒
+        'cache_size': -65536,        # 负数表示KiB，即64MB页缓存
+        'mmap_size': 268435456,      # 256MB内存映射读取
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'OFF',
+    }
+    # sqlite3 模块按SQL文本缓存预编译语句，重复的参数化查询可直接复用
+    STATEMENT_CACHE_SIZE = 256
+
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, Any]] = None):
+        super().__init__(db_path)
+        self.pragmas = {**self.DEFAULT_PRAGMAS, **(pragmas or {})}
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
     def connect(self):
-        """建立SQLite数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """建立一个新的、已应用PRAGMA的SQLite连接（由调用方负责关闭）"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.pragmas['busy_timeout'] / 1000,
+            cached_statements=self.STATEMENT_CACHE_SIZE,
+            # 持久连接只在创建它的线程中使用；关闭允许在任意线程进行
+            check_same_thread=False,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的持久连接，首次使用时创建"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+            self.logger.debug(f"为线程 {threading.current_thread().name} 创建数据库连接: {self.db_path}")
+        return conn
+
+    def close(self):
+        """关闭所有线程的持久连接"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
     
     def init_database(self):
         """初始化SQLite数据库表结构"""
@@ -54,6 +138,7 @@ class SQLiteAdapter(DatabaseAdapter):
                 paragraphs TEXT,
                 full_text TEXT,
                 author_desc TEXT,
+                content_hash TEXT,
                 created_at TEXT,
                 updated_at TEXT
             )
@@ -84,41 +169,535 @@ class SQLiteAdapter(DatabaseAdapter):
             )
         ''')
 
+        # 创建级联标注决策表：记录每首诗在某个级联（模型序列）中最终由哪个模型给出结果
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cascade_decisions (
+                poem_id INTEGER NOT NULL,
+                cascade_id TEXT NOT NULL,
+                final_model TEXT,
+                status TEXT NOT NULL CHECK(status IN ('completed', 'failed')),
+                escalations INTEGER NOT NULL DEFAULT 0,
+                reason TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (poem_id, cascade_id),
+                FOREIGN KEY(poem_id) REFERENCES poems(id)
+            )
+        ''')
+
+        # 创建多模型一致性表：由 annotations 增量刷新，供回填规划按分歧程度排序
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS poem_agreement (
+                poem_id INTEGER PRIMARY KEY,
+                model_count INTEGER NOT NULL DEFAULT 0,
+                agreement REAL,
+                primary_entropy REAL,
+                source_updated_at TEXT,
+                computed_at TEXT,
+                FOREIGN KEY(poem_id) REFERENCES poems(id)
+            )
+        ''')
+
+        # 创建导入清单表：记录每个源文件的状态及其产生的ID区间（JSON数组 [[start, end], ...]，不含ID前缀）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                file_path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                file_mtime REAL NOT NULL,
+                content_hash TEXT NOT NULL,
+                id_ranges TEXT NOT NULL,
+                poem_count INTEGER NOT NULL,
+                ingested_at TEXT
+            )
+        ''')
+
+        # 创建待标注队列：每个已登记模型尚未成功标注的诗词，由下方触发器随 annotations/poems 的写入同步维护，
+        # 使查找待标注诗词的代价与待标注数量成正比，而不是每次扫描整个 poems 表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS annotation_queue_models (
+                model_identifier TEXT PRIMARY KEY,
+                registered_at TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS annotation_queue (
+                model_identifier TEXT NOT NULL,
+                poem_id INTEGER NOT NULL,
+                PRIMARY KEY (model_identifier, poem_id)
+            ) WITHOUT ROWID
+        ''')
+        self._create_queue_triggers(cursor)
+        self.fts_enabled = self._create_poem_fts(cursor)
+
+        # 创建标注变更日志：由触发器在 annotations 写入的同一事务内追加，下游按序号增量消费
+        self._create_annotation_changes(cursor)
+
+        # 创建计数表：由触发器随写入精确维护，统计命令无需每次全表 COUNT(*)
+        self._create_counters(cursor)
+
+        # 创建标注历史：每次保存都追加一个版本，annotations.current_version_id 指向当前版本
+        self._create_annotation_versions(cursor)
+
+        # 创建句子级标注表：每次保存标注时在同一事务内由 annotations 投影写入，供可视化与统计直接查询
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS emotion_categories (
+                id TEXT PRIMARY KEY,
+                name_zh TEXT NOT NULL,
+                name_en TEXT,
+                parent_id TEXT,
+                level INTEGER NOT NULL,
+                FOREIGN KEY(parent_id) REFERENCES emotion_categories(id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sentence_annotations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                annotation_id INTEGER NOT NULL,
+                poem_id INTEGER NOT NULL,
+                sentence_uid TEXT NOT NULL,
+                sentence_text TEXT,
+                FOREIGN KEY(annotation_id) REFERENCES annotations(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sentence_emotion_links (
+                sentence_annotation_id INTEGER NOT NULL,
+                emotion_id TEXT NOT NULL,
+                is_primary BOOLEAN NOT NULL,
+                PRIMARY KEY (sentence_annotation_id, emotion_id),
+                FOREIGN KEY(sentence_annotation_id) REFERENCES sentence_annotations(id) ON DELETE CASCADE,
+                FOREIGN KEY(emotion_id) REFERENCES emotion_categories(id)
+            )
+        ''')
+
+        # 创建情感ID驻留表：紧凑存储格式中以整数编码代替情感ID字符串
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS emotion_codes (
+                code INTEGER PRIMARY KEY,
+                emotion_id TEXT NOT NULL UNIQUE
+            )
+        ''')
+
+        # 兼容旧数据库：补充后续新增的列
+        if self._ensure_column(cursor, 'poems', 'content_hash', 'TEXT'):
+            # 旧数据库的诗词按库中原文补算指纹（与导入时的算法一致），否则首次增量导入会把每首诗都当作原文被修订，
+            # 改写全部诗词并使已有标注全部过期
+            cursor.connection.create_function('poem_content_hash', 3, poem_content_hash, deterministic=True)
+            cursor.execute("UPDATE poems SET content_hash = poem_content_hash(title, author, full_text)")
+        # 标注的来源指纹：生成结果时诗词的 content_hash 与提示词指纹，与当前值比较即可找出过期的标注。
+        # 旧标注的来源指纹按当前原文回填（视为与当前原文一致），提示词指纹未知则保持为空
+        if self._ensure_column(cursor, 'annotations', 'source_hash', 'TEXT'):
+            cursor.execute(
+                "UPDATE annotations SET source_hash = (SELECT p.content_hash FROM poems p WHERE p.id = annotations.poem_id)"
+            )
+        self._ensure_column(cursor, 'annotations', 'prompt_hash', 'TEXT')
+        self._ensure_column(cursor, 'annotation_versions', 'source_hash', 'TEXT')
+        # 诗词原文被修订（content_hash 变化）时，对所有已登记模型重新入队；原有标注因来源指纹不符而成为过期标注。
+        # 触发器在导入的 INSERT ... ON CONFLICT DO UPDATE 中执行，此时 INSERT OR IGNORE 会沿用外层语句的
+        # 冲突处理而中止整条语句，因此显式跳过已在队列中的诗词。旧版本触发器没有这一判断，先删除再重建
+        cursor.execute('DROP TRIGGER IF EXISTS trg_queue_poem_text_update')
+        cursor.execute('''
+            CREATE TRIGGER trg_queue_poem_text_update
+            AFTER UPDATE OF content_hash ON poems
+            WHEN NEW.content_hash IS NOT OLD.content_hash
+            BEGIN
+                INSERT INTO annotation_queue (model_identifier, poem_id)
+                SELECT m.model_identifier, NEW.id FROM annotation_queue_models m
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM annotation_queue q
+                    WHERE q.model_identifier = m.model_identifier AND q.poem_id = NEW.id
+                );
+            END
+        ''')
+        # 整数时间戳列（由 created_at / updated_at 生成，带索引），供按时间范围过滤和按天分组
+        self.epoch_columns = ensure_epoch_columns(cursor)
+
         # 创建索引
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_poem_author ON poems(author)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_annotation_poem_model ON annotations(poem_id, model_identifier)')
         cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS uidx_poem_model ON annotations(poem_id, model_identifier)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_annotation_status ON annotations(status)')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_annotation_model_completed ON annotations(model_identifier, poem_id) "
+            "WHERE status = 'completed'"
+        )
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_annotation_queue_poem ON annotation_queue(poem_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_annotation_poem_updated ON annotations(poem_id, updated_at)')
+        # 增量导出按 updated_at 水位线做范围扫描
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_annotation_updated ON annotations(updated_at)')
+        # 过期标注查询只需扫描该覆盖索引，再按主键比对 poems.content_hash
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_annotation_fingerprint '
+            'ON annotations(model_identifier, status, poem_id, source_hash, prompt_hash)'
+        )
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_poem_agreement_agreement ON poem_agreement(agreement)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_poem_agreement_entropy ON poem_agreement(primary_entropy)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_emotion_parent_id ON emotion_categories(parent_id)')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS uidx_sentence_ref ON sentence_annotations(annotation_id, sentence_uid)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_link_emotion_id ON sentence_emotion_links(emotion_id)')
 
         conn.commit()
         conn.close()
         self.logger.info("SQLite数据库初始化完成")
     
+    def _create_annotation_changes(self, cursor):
+        """
+        创建只追加的 annotation_changes 变更日志及其触发器。seq 为 AUTOINCREMENT，单调递增且清理后不复用；
+        每个下游消费者在 change_cursors 中记录自己已处理到的 seq，只需读取其后的变更。
+        只改写存储格式（updated_at 与 status 均不变）的 UPDATE 不记录。
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS annotation_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                annotation_id INTEGER NOT NULL,
+                poem_id INTEGER,
+                model_identifier TEXT,
+                op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete')),
+                status TEXT,
+                updated_at TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_cursors (
+                consumer TEXT PRIMARY KEY,
+                last_seq INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_annotation_changes_insert AFTER INSERT ON annotations
+            BEGIN
+                INSERT INTO annotation_changes (annotation_id, poem_id, model_identifier, op, status, updated_at)
+                VALUES (NEW.id, NEW.poem_id, NEW.model_identifier, 'insert', NEW.status, NEW.updated_at);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_annotation_changes_update AFTER UPDATE ON annotations
+            WHEN NEW.updated_at IS NOT OLD.updated_at OR NEW.status IS NOT OLD.status
+            BEGIN
+                INSERT INTO annotation_changes (annotation_id, poem_id, model_identifier, op, status, updated_at)
+                VALUES (NEW.id, NEW.poem_id, NEW.model_identifier, 'update', NEW.status, NEW.updated_at);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_annotation_changes_delete AFTER DELETE ON annotations
+            BEGIN
+                INSERT INTO annotation_changes (annotation_id, poem_id, model_identifier, op, status, updated_at)
+                VALUES (OLD.id, OLD.poem_id, OLD.model_identifier, 'delete', NULL, NULL);
+            END
+        ''')
+
+    def _create_counters(self, cursor):
+        """
+        创建 annotation_counters（按 模型 × 状态 的标注数）与 table_counters（poems / authors 行数）及其触发器。
+        新建时从已有数据一次性统计填充。绕过触发器的写入（如 INSERT OR REPLACE 覆盖已有行）会使计数偏差，
+        可用 DataManager.rebuild_counters() 重新统计。
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'annotation_counters'"
+        ).fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS annotation_counters (
+                model_identifier TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (model_identifier, status)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS table_counters (
+                table_name TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_annotation_counters_insert AFTER INSERT ON annotations
+            BEGIN
+                INSERT INTO annotation_counters (model_identifier, status, count) VALUES (NEW.model_identifier, NEW.status, 1)
+                ON CONFLICT(model_identifier, status) DO UPDATE SET count = count + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_annotation_counters_update AFTER UPDATE OF model_identifier, status ON annotations
+            WHEN NEW.model_identifier IS NOT OLD.model_identifier OR NEW.status IS NOT OLD.status
+            BEGIN
+                UPDATE annotation_counters SET count = count - 1
+                WHERE model_identifier = OLD.model_identifier AND status = OLD.status;
+                INSERT INTO annotation_counters (model_identifier, status, count) VALUES (NEW.model_identifier, NEW.status, 1)
+                ON CONFLICT(model_identifier, status) DO UPDATE SET count = count + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_annotation_counters_delete AFTER DELETE ON annotations
+            BEGIN
+                UPDATE annotation_counters SET count = count - 1
+                WHERE model_identifier = OLD.model_identifier AND status = OLD.status;
+            END
+        ''')
+        for table in ('poems', 'authors'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_counter_insert AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO table_counters (table_name, row_count) VALUES ('{table}', 1)
+                    ON CONFLICT(table_name) DO UPDATE SET row_count = row_count + 1;
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_counter_delete AFTER DELETE ON {table}
+                BEGIN
+                    UPDATE table_counters SET row_count = row_count - 1 WHERE table_name = '{table}';
+                END
+            ''')
+
+        if not exists:
+            self.logger.info("新建计数表，从已有数据统计填充...")
+            recount_counters(cursor)
+
+    def _create_annotation_versions(self, cursor):
+        """
+        创建只追加的 annotation_versions 标注历史表。每次保存标注（包括 --force-rerun 覆盖）都追加一行，
+        记录运行ID、提示词指纹与token用量；annotations 仍只保存每个 (诗词, 模型) 的当前结果，
+        并以 current_version_id 指向对应的版本。新建时把已有标注作为各自的第一个版本回填。
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'annotation_versions'"
+        ).fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS annotation_versions (
+                id INTEGER PRIMARY KEY,
+                poem_id INTEGER NOT NULL,
+                model_identifier TEXT NOT NULL,
+                run_id TEXT,
+                prompt_hash TEXT,
+                status TEXT NOT NULL,
+                annotation_result,
+                error_message TEXT,
+                usage TEXT,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        self._ensure_column(cursor, 'annotations', 'current_version_id', 'INTEGER')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_versions_poem_model ON annotation_versions(poem_id, model_identifier, id)'
+        )
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_versions_model_prompt ON annotation_versions(model_identifier, prompt_hash, poem_id)'
+        )
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_versions_run ON annotation_versions(run_id)')
+
+        if not exists:
+            self.logger.info("新建标注历史表，把已有标注回填为第一个版本...")
+            cursor.execute('''
+                INSERT INTO annotation_versions (poem_id, model_identifier, status, annotation_result, error_message, created_at)
+                SELECT poem_id, model_identifier, status, annotation_result, error_message, COALESCE(updated_at, created_at, '')
+                FROM annotations ORDER BY id
+            ''')
+            cursor.execute('''
+                UPDATE annotations SET current_version_id = (
+                    SELECT MAX(v.id) FROM annotation_versions v
+                    WHERE v.poem_id = annotations.poem_id AND v.model_identifier = annotations.model_identifier
+                )
+            ''')
+
+    def _create_poem_fts(self, cursor) -> bool:
+        """
+        创建诗词全文索引 poems_fts（FTS5 trigram 分词，rowid 即 poems.id）：
+        title 为原标题，body 为去除标点和空白后的正文；由触发器随 poems 的写入同步维护。
+        新建时从已有诗词一次性填充。SQLite 不支持 FTS5/trigram (需 3.34+) 时返回 False，搜索回退为扫描。
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'poems_fts'"
+        ).fetchone()
+        try:
+            # 只做子串 LIKE 匹配，不需要词位置信息；detail=none 使索引更小
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS poems_fts USING fts5(title, body, tokenize='trigram', detail=none)"
+            )
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"当前SQLite不支持FTS5 trigram全文索引，诗词搜索将回退为全表扫描: {e}")
+            return False
+
+        body = normalized_text_sql('NEW.full_text')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_poems_fts_insert AFTER INSERT ON poems
+            BEGIN
+                INSERT OR REPLACE INTO poems_fts (rowid, title, body) VALUES (NEW.id, NEW.title, {body});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_poems_fts_update AFTER UPDATE OF title, full_text ON poems
+            BEGIN
+                DELETE FROM poems_fts WHERE rowid = OLD.id;
+                INSERT OR REPLACE INTO poems_fts (rowid, title, body) VALUES (NEW.id, NEW.title, {body});
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_poems_fts_delete AFTER DELETE ON poems
+            BEGIN
+                DELETE FROM poems_fts WHERE rowid = OLD.id;
+            END
+        ''')
+        if not exists:
+            self.logger.info("正在为已有诗词建立全文索引...")
+            cursor.execute(
+                f"INSERT INTO poems_fts (rowid, title, body) SELECT id, title, {normalized_text_sql('full_text')} FROM poems"
+            )
+        return True
+
+    @staticmethod
+    def _create_queue_triggers(cursor):
+        """创建维护 annotation_queue 的触发器（只对已登记到 annotation_queue_models 的模型生效）"""
+        # 标注写入或状态变化：完成则出队，未完成则（重新）入队
+        for event in ('INSERT', 'UPDATE OF status'):
+            name = 'trg_queue_annotation_insert' if event == 'INSERT' else 'trg_queue_annotation_update'
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name}
+                AFTER {event} ON annotations
+                BEGIN
+                    DELETE FROM annotation_queue
+                    WHERE NEW.status = 'completed'
+                        AND model_identifier = NEW.model_identifier AND poem_id = NEW.poem_id;
+                    INSERT OR IGNORE INTO annotation_queue (model_identifier, poem_id)
+                    SELECT NEW.model_identifier, NEW.poem_id
+                    WHERE NEW.status != 'completed'
+                        AND EXISTS (SELECT 1 FROM annotation_queue_models WHERE model_identifier = NEW.model_identifier);
+                END
+            ''')
+        # 删除已完成的标注：诗词仍存在时重新入队
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_queue_annotation_delete
+            AFTER DELETE ON annotations
+            WHEN OLD.status = 'completed'
+            BEGIN
+                INSERT OR IGNORE INTO annotation_queue (model_identifier, poem_id)
+                SELECT OLD.model_identifier, OLD.poem_id
+                WHERE EXISTS (SELECT 1 FROM annotation_queue_models WHERE model_identifier = OLD.model_identifier)
+                    AND EXISTS (SELECT 1 FROM poems WHERE id = OLD.poem_id);
+            END
+        ''')
+        # 新增诗词对所有已登记模型入队；删除诗词时出队
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_queue_poem_insert
+            AFTER INSERT ON poems
+            BEGIN
+                INSERT OR IGNORE INTO annotation_queue (model_identifier, poem_id)
+                SELECT model_identifier, NEW.id FROM annotation_queue_models;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_queue_poem_delete
+            AFTER DELETE ON poems
+            BEGIN
+                DELETE FROM annotation_queue WHERE poem_id = OLD.id;
+            END
+        ''')
+
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, definition: str) -> bool:
+        """如果表中缺少指定列则添加（用于旧数据库的表结构迁移），返回是否新增了该列"""
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        if column in existing:
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+
     def execute_query(self, query: str, params: Optional[tuple] = None):
         """执行查询操作"""
-        conn = self.connect()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
+        cursor = self._get_connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
     
     def execute_update(self, query: str, params: Optional[tuple] = None):
         """执行更新操作"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            conn.commit()
+            return cursor.rowcount
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def execute_query_with_ids(self, query: str, ids: Iterable[int], params: Optional[tuple] = None):
+        """
+        把一组ID写入当前连接的临时表后执行查询，代替超长的 IN (?, ?, ...) 参数列表。
+        query 中用 {ids} 表示该临时表（单列 id，为主键），例如：
+            "SELECT p.id FROM poems p JOIN {ids} t ON t.id = p.id"
+        """
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        try:
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS id_set (id INTEGER PRIMARY KEY)")
+            cursor.execute("DELETE FROM temp.id_set")
+            cursor.executemany("INSERT OR IGNORE INTO temp.id_set (id) VALUES (?)", ((i,) for i in ids))
+            cursor.execute(query.format(ids='temp.id_set'), params or ())
+            return cursor.fetchall()
+        finally:
+            cursor.execute("DELETE FROM temp.id_set")
+            # 结束隐式事务，避免长期持有读快照而阻碍WAL检查点
+            conn.commit()
+            cursor.close()
+
+    def iter_query(self, query: str, params: Optional[tuple] = None, batch_size: int = 5000) -> Iterator[List[Any]]:
+        """
+        使用独立连接执行查询并按批 (fetchmany) 产出结果。
+        整个迭代在同一个读事务中完成，结果对应一个一致的快照，不受期间其他写入影响。
+        """
         conn = self.connect()
+        try:
+            conn.execute("BEGIN")
+            cursor = conn.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.rollback()
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """在当前线程的持久连接上开启事务，块正常结束时提交，出现异常时回滚"""
+        conn = self._get_connection()
         cursor = conn.cursor()
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        conn.commit()
-        rowcount = cursor.rowcount
-        conn.close()
-        return rowcount
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def execute_many(self, query: str, params_seq) -> int:
+        """在一个事务中批量执行同一条更新语句 (executemany)"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(query, params_seq)
+            conn.commit()
+            return cursor.rowcount
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
 
 
 def get_database_adapter(db_type: str, db_path: str) -> DatabaseAdapter:
@@ -130,6 +709,94 @@ def get_database_adapter(db_type: str, db_path: str) -> DatabaseAdapter:
         return SQLiteAdapter(db_path)
 
 
+# 全文检索时忽略的标点与空白：日志中的句子和库中正文的标点、换行常不一致。
+# 触发器中以嵌套 REPLACE 实现，SQLite 解析器约在30层嵌套时栈溢出，因此只保留诗词正文中常见的字符
+SEARCH_IGNORED_CHARS = "，。？！、；：“”‘’《》（）·—…,.?!;: \u3000\n"
+_SEARCH_IGNORED_RE = re.compile(f"[{re.escape(SEARCH_IGNORED_CHARS)}]")
+
+
+def normalize_search_text(text: str) -> str:
+    """去除标点与空白，得到用于全文检索的文本"""
+    return _SEARCH_IGNORED_RE.sub('', text or '')
+
+
+def normalized_text_sql(expr: str) -> str:
+    """生成与 normalize_search_text 等价的SQL表达式（嵌套 REPLACE），用于触发器和回退查询"""
+    for char in SEARCH_IGNORED_CHARS:
+        literal = char.replace("'", "''")
+        expr = f"REPLACE({expr}, '{literal}', '')"
+    return expr
+
+
+def search_poem_ids_by_text(cursor, text: str, column: str = 'body') -> List[int]:
+    """
+    按子串查找诗词ID（按ID升序）。column 为 'body' 时匹配去除标点后的正文，为 'title' 时匹配标题。
+    至少3个字符时使用 poems_fts 的 trigram 索引；更短的查询或全文索引不可用时回退为扫描 poems 表。
+    """
+    if column not in ('body', 'title'):
+        raise ValueError(f"不支持的检索列: {column}")
+    needle = normalize_search_text(text) if column == 'body' else (text or '').strip()
+    if not needle:
+        return []
+    # LIKE 通配符按单字符通配处理（也能匹配其自身）
+    pattern = "%" + needle.replace('%', '_') + "%"
+    if len(needle) >= 3:
+        try:
+            cursor.execute(f"SELECT rowid FROM poems_fts WHERE {column} LIKE ? ORDER BY rowid", (pattern,))
+            return [row[0] for row in cursor.fetchall()]
+        except sqlite3.OperationalError:
+            pass # 全文索引不存在，回退为扫描
+    source = normalized_text_sql('full_text') if column == 'body' else 'title'
+    cursor.execute(f"SELECT id FROM poems WHERE {source} LIKE ? ORDER BY id", (pattern,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+# 整数时间戳列 -> 来源的ISO时间列（带 +08:00 偏移，strftime('%s') 换算为UTC的Unix秒）
+EPOCH_COLUMNS = {'created_at_epoch': 'created_at', 'updated_at_epoch': 'updated_at'}
+
+
+def ensure_epoch_columns(cursor, table: str = 'annotations') -> bool:
+    """
+    为表添加 created_at_epoch / updated_at_epoch 列并建立索引。
+    列为虚拟生成列：写入时随ISO时间自动得到，无需修改任何写入代码；已有行在建索引时一次性计算。
+    SQLite 不支持生成列（需 3.31+）时返回 False，调用方应回退为比较ISO字符串。
+    """
+    # 生成列不出现在 table_info 中，需用 table_xinfo 检查
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_xinfo({table})")}
+    try:
+        for column, source in EPOCH_COLUMNS.items():
+            if column not in existing:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} INTEGER "
+                    f"GENERATED ALWAYS AS (CAST(strftime('%s', {source}) AS INTEGER)) VIRTUAL"
+                )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})")
+    except sqlite3.OperationalError as e:
+        logging.getLogger(__name__).warning(f"当前SQLite不支持生成列，{table} 不添加整数时间戳列: {e}")
+        return False
+    return True
+
+
+def recount_counters(cursor):
+    """按当前数据重新统计 annotation_counters 与 table_counters（不提交事务）"""
+    cursor.execute("DELETE FROM annotation_counters")
+    cursor.execute('''
+        INSERT INTO annotation_counters (model_identifier, status, count)
+        SELECT model_identifier, status, COUNT(*) FROM annotations GROUP BY model_identifier, status
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO table_counters (table_name, row_count)
+        SELECT 'poems', COUNT(*) FROM poems
+        UNION ALL
+        SELECT 'authors', COUNT(*) FROM authors
+    ''')
+
+
+def poem_content_hash(title: str, author: str, full_text: str) -> str:
+    """诗词内容指纹：标题、作者、正文任一变化即不同，用于识别原文修订和过期标注"""
+    return hashlib.md5(f"{title}\x1f{author}\x1f{full_text}".encode('utf-8')).hexdigest()
+
+
 def normalize_poem_data(poem_data: Dict[str, Any]) -> Dict[str, Any]:
     """标准化诗词数据，处理字段命名差异"""
     normalized = poem_data.copy()
@@ -0,0 +1,178 @@
+"""
+多数据库查询路由
+
+每个诗词集合（唐诗、宋词、元曲……）是一个独立的SQLite数据库，诗词ID由 id_prefix 保证全局唯一。
+MultiDatabaseRouter 在一个连接上以只读方式 ATTACH 配置中的所有数据库，并创建 UNION ALL 临时视图
+（all_poems / all_annotations / all_authors，每行带 db_name 列），跨集合的统计、导出与抽样
+可以写成一条SQL，而不必在Python中逐库循环。目前 status --all-dbs 的统计和 scripts/random_sample.py --all-dbs
+的抽样经由路由完成；导出仍按库进行，因为紧凑存储的标注结果要用各库自己的 emotion_codes 表解码。
+
+同一条SQL在SQLite中只能单线程执行；需要并行时用 query_each() 在各库的独立连接上并发执行同一查询
+（sqlite3 在执行语句期间释放GIL）。
+"""
+
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 视图中各表的公共列（旧数据库可能缺少后续新增的列，因此不使用 SELECT *）
+VIEW_COLUMNS = {
+    'poems': ('id', 'title', 'author', 'paragraphs', 'full_text', 'author_desc', 'created_at', 'updated_at'),
+    'annotations': ('id', 'poem_id', 'model_identifier', 'status', 'annotation_result', 'error_message',
+                    'created_at', 'updated_at'),
+    'authors': ('name', 'description', 'short_description', 'created_at'),
+    'annotation_counters': ('model_identifier', 'status', 'count'),
+    'table_counters': ('table_name', 'row_count'),
+}
+
+
+def _quote_identifier(name: str) -> str:
+    """把数据库别名转为可安全拼入SQL的标识符"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class MultiDatabaseRouter:
+    """以只读方式 ATTACH 多个数据库并提供跨库的 UNION ALL 视图"""
+
+    def __init__(self, db_paths: Dict[str, str]):
+        """
+        :param db_paths: {数据库名: 数据库文件路径}，数据库名即视图中的 db_name 与 ATTACH 的 schema 名
+        """
+        if not db_paths:
+            raise ValueError("至少需要一个数据库才能创建查询路由")
+        self.db_paths = {name: str(Path(path)) for name, path in db_paths.items()}
+        self.logger = logging.getLogger(__name__)
+        self._conn: Optional[sqlite3.Connection] = None
+        self.views: Dict[str, List[str]] = {}
+
+    @staticmethod
+    def _ro_uri(path: str) -> str:
+        return f"{Path(path).resolve().as_uri()}?mode=ro"
+
+    def connect(self) -> sqlite3.Connection:
+        """打开路由连接：ATTACH 所有数据库并创建临时视图（只创建一次）"""
+        if self._conn is not None:
+            return self._conn
+
+        for name, path in self.db_paths.items():
+            if not Path(path).is_file():
+                raise FileNotFoundError(f"数据库 '{name}' 的文件不存在: {path}")
+
+        conn = sqlite3.connect(':memory:', uri=True, check_same_thread=False)
+        max_attached = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(self.db_paths) > max_attached:
+            conn.close()
+            raise ValueError(f"SQLite 最多只能同时 ATTACH {max_attached} 个数据库，当前配置了 {len(self.db_paths)} 个")
+
+        for name, path in self.db_paths.items():
+            conn.execute(f"ATTACH DATABASE ? AS {_quote_identifier(name)}", (self._ro_uri(path),))
+            self.logger.debug(f"已附加数据库 {name}: {path}")
+
+        self.views = {}
+        for table, columns in VIEW_COLUMNS.items():
+            shards = [name for name in self.db_paths if self._has_table(conn, name, table)]
+            if len(shards) < len(self.db_paths):
+                # 缺表的库（如尚未升级的旧库）会使视图结果不完整，不创建该视图
+                self.logger.debug(f"部分数据库缺少表 {table}，不创建视图 all_{table}")
+                continue
+            column_list = ', '.join(columns)
+            selects = [
+                f"SELECT '{name.replace(chr(39), chr(39) * 2)}' AS db_name, {column_list} FROM {_quote_identifier(name)}.{table}"
+                for name in shards
+            ]
+            conn.execute(f"CREATE TEMP VIEW all_{table} AS {' UNION ALL '.join(selects)}")
+            self.views[table] = shards
+
+        self._conn = conn
+        self.logger.info(f"查询路由已附加 {len(self.db_paths)} 个数据库: {', '.join(self.db_paths)}")
+        return conn
+
+    @staticmethod
+    def _has_table(conn: sqlite3.Connection, schema: str, table: str) -> bool:
+        row = conn.execute(
+            f"SELECT 1 FROM {_quote_identifier(schema)}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        return row is not None
+
+    def execute_query(self, query: str, params: Optional[tuple] = None) -> List[Any]:
+        """在路由连接上执行跨库查询（可引用 all_* 视图或 "<db_name>".<table>）"""
+        conn = self.connect()
+        cursor = conn.execute(query, params or ())
+        return cursor.fetchall()
+
+    def query_each(self, query: str, params: Optional[tuple] = None,
+                   max_workers: Optional[int] = None) -> Dict[str, List[Any]]:
+        """
+        在每个数据库各自的只读连接上并发执行同一条查询（查询中直接引用 poems / annotations 等表）。
+
+        :return: {数据库名: 结果行列表}
+        """
+        def run(item):
+            name, path = item
+            conn = sqlite3.connect(self._ro_uri(path), uri=True)
+            try:
+                return name, conn.execute(query, params or ()).fetchall()
+            finally:
+                conn.close()
+
+        workers = max_workers or len(self.db_paths)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(executor.map(run, self.db_paths.items()))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        全部数据库的标注统计，结构与 DataManager.get_statistics 相同，另含按数据库拆分的 by_db。
+        各库都有计数表时直接读取计数表，否则回退为对标注视图分组计数。
+        """
+        self.connect()
+        if 'table_counters' in self.views and 'annotation_counters' in self.views:
+            table_rows = self.execute_query("SELECT db_name, table_name, row_count FROM all_table_counters")
+            model_rows = self.execute_query("""
+                SELECT db_name, model_identifier, status, count FROM all_annotation_counters
+                WHERE count > 0
+                ORDER BY model_identifier, status
+            """)
+        else:
+            table_rows = self.execute_query("""
+                SELECT db_name, 'poems', COUNT(*) FROM all_poems GROUP BY db_name
+                UNION ALL
+                SELECT db_name, 'authors', COUNT(*) FROM all_authors GROUP BY db_name
+            """)
+            model_rows = self.execute_query("""
+                SELECT db_name, model_identifier, status, COUNT(*) FROM all_annotations
+                GROUP BY db_name, model_identifier, status
+                ORDER BY model_identifier, status
+            """)
+
+        by_db = {name: {'total_poems': 0, 'total_authors': 0, 'stats_by_model': {}} for name in self.db_paths}
+        for db_name, table_name, row_count in table_rows:
+            by_db[db_name][f"total_{table_name}"] = row_count
+
+        stats_by_model: Dict[str, Dict[str, int]] = {}
+        for db_name, model, status, count in model_rows:
+            for target in (stats_by_model, by_db[db_name]['stats_by_model']):
+                model_stats = target.setdefault(model, {'completed': 0, 'failed': 0, 'total_annotated': 0})
+                model_stats[status] = model_stats.get(status, 0) + count
+                model_stats['total_annotated'] += count
+
+        return {
+            'total_poems': sum(stats['total_poems'] for stats in by_db.values()),
+            'total_authors': sum(stats['total_authors'] for stats in by_db.values()),
+            'stats_by_model': stats_by_model,
+            'by_db': by_db
+        }
+
+    def close(self):
+        """关闭路由连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -7,6 +7,11 @@ import re
 from typing import Any, List, Dict, Optional
 from pathlib import Path
 
+try:
+    from .prompt_encoding import OUTPUT_FORMATS, parse_delimited_annotations
+except ImportError:
+    from prompt_encoding import OUTPUT_FORMATS, parse_delimited_annotations
+
 # 可选依赖：demjson3 和 json5
 try:
     import demjson3 as demjson
@@ -122,11 +127,13 @@ class LLMResponseParser:
         # 如果所有库都失败了
         raise ValueError("所有解析库都无法解析该字符串。")
 
-    def parse(self, text: str) -> List[Dict[str, Any]]:
+    def parse(self, text: str, output_format: str = 'json') -> List[Dict[str, Any]]:
         """
         从字符串中稳健地解析出经过内容验证的JSON数组。
 
         处理策略:
+        0. 如果 output_format 为紧凑格式（'line' / 'tsv'），先按行解析 `S1|主情感|次情感,...`，
+           失败时再回退到下面的JSON策略（模型有时仍会输出JSON）。
         1. 尝试从Markdown代码块 (```json ... ```) 中提取并进行“解析+验证”。
         2. 如果失败，尝试从整个文本中提取第一个出现的、完整的JSON数组 (`[...]`) 并进行“解析+验证”。
         3. 如果失败，尝试从整个文本中提取第一个出现的、完整的JSON对象 (`{...}`)，并查找其中符合规范的数组。
@@ -137,6 +144,7 @@ class LLMResponseParser:
 
         Args:
             text: LLM返回的原始文本。
+            output_format: 提示词中要求的输出格式，见 prompt_encoding.OUTPUT_FORMATS。
 
         Returns:
             一个经过完全验证的、包含标注信息的字典列表。
@@ -148,6 +156,14 @@ class LLMResponseParser:
             raise TypeError(f"输入必须是字符串, 而不是 {type(text)}")
 
         text = text.strip()
+
+        # 策略 0: 紧凑的行格式输出
+        delimiter = OUTPUT_FORMATS.get(output_format)
+        if delimiter:
+            try:
+                return self._validate_annotation_list_content(parse_delimited_annotations(text, delimiter))
+            except (ValueError, TypeError):
+                pass # 不是合规的紧凑格式，继续尝试JSON策略
         
         # [修改] 每个 try 块现在都捕获所有解析和验证的错误，以便继续下一个策略
         
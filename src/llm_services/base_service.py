@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List, Tuple
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List, Set, Tuple
+import hashlib
 import json
 import logging
 import os
+import string
 from pathlib import Path
 # 处理相对导入问题
 # 优先尝试相对导入（当作为包的一部分被导入时）
@@ -12,6 +15,7 @@ try:
     from ..llm_response_parser import llm_response_parser
     from ..config_manager import ConfigManager
     from ..utils.rate_limiter import AsyncTokenBucket
+    from ..prompt_encoding import encode_sentences, validate_output_format, SENTENCE_ENCODERS
 except ImportError as e:
     relative_import_failed = True
     print(f"LLMService基类模块相对导入失败: {e}")
@@ -31,12 +35,27 @@ if relative_import_failed:
         from llm_response_parser import llm_response_parser
         from config_manager import ConfigManager
         from utils.rate_limiter import AsyncTokenBucket
+        from prompt_encoding import encode_sentences, validate_output_format, SENTENCE_ENCODERS
     except ImportError as e:
         print(f"LLMService基类模块绝对导入也失败了: {e}")
         raise # Re-raise the exception to stop execution
 
 config_manager = ConfigManager()
 
+
+# 当前这首诗累计的token用量：Annotator 标注每首诗前放入一个新字典，服务每收到一次响应就把用量累加进去
+# （重试和长诗分段共享同一个字典），随标注版本一起保存
+current_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar('current_usage', default=None)
+
+
+def template_fields(template: str) -> Set[str]:
+    """提取 str.format 模板中引用的字段名（如 {author}、{title}）"""
+    return {
+        field_name.split('.')[0].split('[')[0]
+        for _, field_name, _, _ in string.Formatter().parse(template)
+        if field_name
+    }
+
 class BaseLLMService(ABC):
     """LLM服务抽象基类 (已重构)"""
     def __init__(self, config: Dict[str, Any], model_config_name: str):
@@ -77,9 +96,22 @@ class BaseLLMService(ABC):
                     f"无法为模型 '{self.model_config_name}' 解析速率限制配置，将不启用。错误: {e}"
                 )
 
+        # --- 句子编码与输出格式 ---
+        # sentence_format 控制用户提示词中句子的编码方式，output_format 控制要求模型返回的格式。
+        # 二者需要与所配置的提示词模板描述保持一致。
+        self.sentence_format = self.config.get('sentence_format', 'json_pretty').strip().lower()
+        if self.sentence_format not in SENTENCE_ENCODERS:
+            raise ValueError(
+                f"模型配置 '{model_config_name}' 的 sentence_format 无效: {self.sentence_format}。"
+                f"支持的格式: {list(SENTENCE_ENCODERS.keys())}"
+            )
+        self.output_format = validate_output_format(self.config.get('output_format', 'json'))
+
         self.system_prompt_instruction_template: Optional[str] = None
         self.system_prompt_example_template: Optional[str] = None
         self.user_prompt_template: Optional[str] = None
+        # 用户提示词模板引用的字段；只有引用了 {author_desc} 时才读取作者简介
+        self.user_prompt_fields: Set[str] = set()
 
         self._load_prompt_templates()
 
@@ -119,6 +151,7 @@ class BaseLLMService(ABC):
             raise ValueError("系统提示词（示例部分）路径未配置 ")
         if user_path:
             self.user_prompt_template = self._load_template_file(user_path)
+            self.user_prompt_fields = template_fields(self.user_prompt_template)
             self.logger.info(f"用户提示词模板加载成功: {user_path} ")
         else:
             raise ValueError("用户提示词模板路径未配置 ")
@@ -196,46 +229,59 @@ class BaseLLMService(ABC):
         
         return full_system_prompt
 
-    def _build_user_prompt(self, author: str, title: str, sentences_with_id_json: str) -> str:
+    def _build_user_prompt(self, author: str, title: str, sentences_with_id_json: str,
+                           author_desc: Optional[str] = None) -> str:
         """
         构建用户提示词的内部方法 - [修改] 使用 title 替代 rhythmic
+        模板可选引用 {author_desc}（作者简介）。
         """
         if self.user_prompt_template is None:
             raise RuntimeError("用户提示词模板未加载。 ")
         return self.user_prompt_template.format(
             author=author,
             title=title,
-            sentences_with_id_json=sentences_with_id_json
+            sentences_with_id_json=sentences_with_id_json,
+            author_desc=author_desc or ''
         )
 
-    def _generate_sentences_with_id(self, paragraphs: List[str]) -> List[Dict[str, str]]:
+    def _generate_sentences_with_id(self, paragraphs: List[str], offset: int = 0) -> List[Dict[str, str]]:
         """
         为句子生成ID并构建JSON格式（从Annotator迁移而来）
+        offset 用于长诗分块：窗口内的句子沿用其在全诗中的编号，保证ID全局一致。
         """
-        return [{"id": f"S{i+1}", "sentence": sentence} for i, sentence in enumerate(paragraphs)]
+        return [{"id": f"S{offset+i+1}", "sentence": sentence} for i, sentence in enumerate(paragraphs)]
 
     def prepare_prompts(self, poem_data: Dict[str, Any], emotion_schema: str) -> Tuple[str, str]:
         """
         集中化的提示词构建逻辑。
         这是服务类提供给外部的核心能力之一。
         [修改] 使用 poem_data['title']
+        [修改] 句子按模型配置的 sentence_format 编码（默认与历史一致的缩进JSON）
         """
-        sentences_with_id = self._generate_sentences_with_id(poem_data['paragraphs'])
-        sentences_json = json.dumps(sentences_with_id, ensure_ascii=False, indent=2)
+        sentences_with_id = self._generate_sentences_with_id(
+            poem_data['paragraphs'], poem_data.get('sentence_id_offset', 0)
+        )
+        sentences_json = encode_sentences(sentences_with_id, self.sentence_format)
 
         system_prompt = self._build_system_prompt(emotion_schema)
+        # 作者简介只在模板引用时读取（PoemRecord 首次读取时才加载作者表）
+        author_desc = poem_data.get('author_desc') if 'author_desc' in self.user_prompt_fields else None
         user_prompt = self._build_user_prompt(
             author=poem_data['author'],
             title=poem_data['title'],
-            sentences_with_id_json=sentences_json
+            sentences_with_id_json=sentences_json,
+            author_desc=author_desc
         )
         return system_prompt, user_prompt
 
     @abstractmethod
-    async def annotate_poem(self, poem: Dict[str, Any], emotion_schema: str) -> Dict[str, Any]:
+    async def annotate_poem(self, poem: Dict[str, Any], emotion_schema: str,
+                            return_samples: bool = False) -> Dict[str, Any]:
         """
         [修改] 抽象方法签名已更新。
         现在接收原始诗词数据和情感体系，负责完整的标注流程。
+        return_samples 为 True 时，返回所有通过验证的采样结果列表（例如 n>1 时的多个choice），
+        供调用方做一致性检查；不支持多采样的服务返回只含一个结果的列表。
         !! 重要 !!
         子类在实现此方法时，应在发起实际网络请求前，先调用 self._ensure_rate_limiter()，
         然后再检查并调用速率限制器：
@@ -248,6 +294,7 @@ class BaseLLMService(ABC):
         Args:
             poem: 包含诗词信息的字典。
             emotion_schema: 情感分类体系的文本。
+            return_samples: 是否返回全部采样结果。
         Returns:
             包含标注结果的字典。
         """
@@ -302,6 +349,36 @@ class BaseLLMService(ABC):
 
         # [新增] 在此添加一条简洁的 INFO 日志
         self.logger.info(f"成功接收并解析了来自 [{self.provider.upper()}] 的响应。")
+        self._accumulate_usage(usage)
+
+    @staticmethod
+    def track_usage() -> Dict[str, Any]:
+        """为当前异步任务开始一份新的用量统计，之后本任务内的响应用量都累加到返回的字典中"""
+        usage: Dict[str, Any] = {}
+        current_usage.set(usage)
+        return usage
+
+    @staticmethod
+    def _accumulate_usage(usage: Optional[Dict[str, Any]]):
+        """把一次响应的数值型用量字段累加到当前诗词的用量字典（未设置时忽略）"""
+        collector = current_usage.get()
+        if collector is None or not usage:
+            return
+        for key, value in usage.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                collector[key] = collector.get(key, 0) + value
+
+    def prompt_hash(self, emotion_schema: str) -> str:
+        """提示词指纹：模板、情感体系与句子/输出格式的哈希，用于区分不同提示词版本下的标注结果"""
+        parts = (
+            self.system_prompt_instruction_template or '',
+            self.system_prompt_example_template or '',
+            self.user_prompt_template or '',
+            emotion_schema or '',
+            self.sentence_format,
+            self.output_format,
+        )
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()[:16]
 
     def log_error_details(self, error: Exception, request_data: Optional[Dict[str, Any]] = None, prompt: Optional[str] = None):
         """记录错误详情"""
@@ -339,7 +416,7 @@ class BaseLLMService(ABC):
         try:
             self.logger.debug("开始使用LLMResponseParser统一解析并验证响应...")
             # 只需要调用一次 parse，它会处理所有解析和验证的复杂逻辑
-            validated_list = llm_response_parser.parse(response_text)
+            validated_list = llm_response_parser.parse(response_text, output_format=self.output_format)
             
             # 将原有的 INFO 日志细化
             self.logger.info(f"响应解析及内容验证成功，共 {len(validated_list)} 条标注记录。") # 保留这条简洁的INFO
@@ -116,9 +116,11 @@ class GeminiService(BaseLLMService):
             self.logger.error(error_message, exc_info=True)
             return False, error_message
 
-    async def annotate_poem(self, poem: Dict[str, Any], emotion_schema: str) -> Dict[str, Any]:
+    async def annotate_poem(self, poem: Dict[str, Any], emotion_schema: str,
+                            return_samples: bool = False) -> Dict[str, Any]:
         """
         使用 Gemini API 标注一首诗词。
+        Gemini 只解析首个候选结果，return_samples 时返回单元素列表。
         """
         request_data_for_log = None
         full_prompt = "提示词未生成"
@@ -161,7 +163,8 @@ class GeminiService(BaseLLMService):
             
             self.log_response_details(response.to_dict(), usage)
 
-            return self.validate_response(response_text)
+            result = self.validate_response(response_text)
+            return [result] if return_samples else result
             
         except (google_exceptions.RetryError, google_exceptions.DeadlineExceeded) as e:
             self.logger.warning(f"[Gemini] API 连接/超时错误，可重试: {e}")
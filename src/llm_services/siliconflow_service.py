@@ -200,10 +200,12 @@ class SiliconFlowService(BaseLLMService):
         return response_data
 
     # 实现基类的新抽象方法。
-    async def annotate_poem(self, poem: Dict[str, Any], emotion_schema: str) -> Dict[str, Any]:
+    async def annotate_poem(self, poem: Dict[str, Any], emotion_schema: str,
+                            return_samples: bool = False) -> Dict[str, Any]:
         """
         实现基类的抽象方法，并集成响应适配器和速率限制。
         此方法是唯一的API调用入口，负责完整的处理流程。
+        return_samples 为 True 时解析全部 choices（n>1），返回所有通过验证的结果。
         """
         request_data = None
         user_prompt_for_logging: str = "Prompt未生成"
@@ -243,7 +245,16 @@ class SiliconFlowService(BaseLLMService):
             self.log_response_details(adapted_response_data, usage)
             
             result = self.validate_response(response_text)
-            return result
+            if not return_samples:
+                return result
+
+            samples = [result]
+            for index, content in enumerate(self._extract_all_response_contents(adapted_response_data)[1:], start=2):
+                try:
+                    samples.append(self.validate_response(content))
+                except (ValueError, TypeError) as e:
+                    self.logger.warning(f"[{self.provider.capitalize()}] 第 {index} 个采样结果无效，已忽略: {e}")
+            return samples
 
         except httpx.HTTPStatusError as e:
             status_code = e.response.status_code
@@ -312,6 +323,14 @@ class SiliconFlowService(BaseLLMService):
         
         return content
     
+    def _extract_all_response_contents(self, response_data: Dict[str, Any]) -> List[str]:
+        """按顺序提取所有 choices 的内容（n>1 时用于多采样一致性检查）"""
+        contents = []
+        for choice in response_data.get('choices', []):
+            message = choice.get('message', {}) if isinstance(choice, dict) else {}
+            contents.append(message.get('content', '') or '')
+        return contents
+    
     def _extract_reasoning_content(self, response_data: Dict[str, Any]) -> Optional[str]:
         """
         从响应数据中提取推理内容。
@@ -2,7 +2,7 @@ import click
 import asyncio
 import sys
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 import logging
 import os
 
@@ -19,6 +19,7 @@ if src_dir not in sys.path:
 from project import Project
 from config_manager import ConfigManager
 from logging_config import setup_default_logging, get_logger
+from agreement import primary_labels_from_result, sentence_agreement
 
 # 获取主日志记录器
 logger = get_logger(__name__)
@@ -73,7 +74,8 @@ def cli(log_level, log_file, enable_file_log, project, db_name):
 @click.option('--config', default='config.ini', help='项目配置文件路径 (相对于项目目录)')
 @click.option('--init-db', is_flag=True, help='初始化数据库（从JSON文件加载数据）')
 @click.option('--clear-existing', is_flag=True, help='清空现有数据后重新初始化')
-def setup(config, init_db, clear_existing):
+@click.option('--workers', type=int, default=None, help='并行解析JSON文件的进程数（默认为CPU核数）')
+def setup(config, init_db, clear_existing, workers):
     """初始化项目环境"""
     try:
         # 从全局CLI上下文中获取项目实例
@@ -154,7 +156,7 @@ def setup(config, init_db, clear_existing):
                 # 从项目配置中获取数据源目录
                 source_dir = project_instance.root_path / data_config.get('source_dir', 'data')
                 # 加载数据并初始化
-                result = data_manager_instance.initialize_database_from_json(clear_existing=clear_existing)
+                result = data_manager_instance.initialize_database_from_json(clear_existing=clear_existing, workers=workers)
                 logger.info(f"数据库初始化完成! 作者: {result['authors']}, 诗词: {result['poems']}")
             except Exception as e:
                 logger.error(f"数据库初始化失败: {e}")
@@ -166,7 +168,8 @@ def setup(config, init_db, clear_existing):
         logger.error(f"初始化失败: {e}", exc_info=True)
 
 
-async def run_multi_model_annotation(models: Tuple[str], limit: Optional[int], id_range: Optional[str], force_rerun: bool, project_instance: Project):
+async def run_multi_model_annotation(models: Tuple[str], limit: Optional[int], id_range: Optional[str], force_rerun: bool, project_instance: Project,
+                                     only_stale: bool = False):
     """异步调度器，用于运行多模型标注任务"""
     start_id, end_id = None, None
     if id_range:
@@ -200,7 +203,8 @@ async def run_multi_model_annotation(models: Tuple[str], limit: Optional[int], i
                 limit=limit,
                 start_id=start_id,
                 end_id=end_id,
-                force_rerun=force_rerun
+                force_rerun=force_rerun,
+                only_stale=only_stale
             )
             tasks.append(task)
             logger.info(f"模型配置 '{model_alias}' 的标注任务已创建")
@@ -242,12 +246,175 @@ async def run_multi_model_annotation(models: Tuple[str], limit: Optional[int], i
     batch_logger.info("=================================")
 
 
+async def run_cascade_annotation(models: Tuple[str], limit: Optional[int], id_range: Optional[str], force_rerun: bool,
+                                 min_agreement: float, project_instance: Project):
+    """
+    级联调度器：按顺序使用模型（通常从便宜到昂贵），只有当前模型的输出未通过验证，
+    或多采样 (n>1) 主情感一致率低于 min_agreement 时，才把该诗升级给下一个模型。
+    每个模型的结果照常保存在其自身的标注记录中，最终采用的模型记录在 cascade_decisions 表。
+    """
+    start_id, end_id = None, None
+    if id_range:
+        try:
+            start_id, end_id = map(int, id_range.split(':'))
+            logger.info(f"标注范围: {start_id} - {end_id}")
+        except ValueError:
+            logger.error("范围格式错误，请使用 'start:end' 格式")
+            return
+
+    if len(models) < 2:
+        logger.error("级联模式至少需要通过 --model 指定两个模型配置（按升级顺序）。")
+        return
+    target_models = list(models)
+    cascade_id = '>'.join(target_models)
+    logger.info(f"级联标注 [{cascade_id}] - 最低一致率: {min_agreement}")
+
+    annotators = [project_instance.get_annotator(config_name=alias) for alias in target_models]
+    data_manager = project_instance.get_data_manager()
+    poems = data_manager.get_poems_pending_cascade(
+        cascade_id, limit=limit, start_id=start_id, end_id=end_id, force_rerun=force_rerun
+    )
+    if not poems:
+        logger.info(f"[{cascade_id}] 没有找到待标注的诗词。")
+        return
+
+    logger.info(f"[{cascade_id}] 找到 {len(poems)} 首待标注诗词，并发数: {annotators[0].max_workers}")
+    semaphore = asyncio.Semaphore(annotators[0].max_workers)
+    run_id = annotators[0].new_run_id()
+    logger.info(f"[{cascade_id}] 运行ID: {run_id}")
+
+    async def cascade_unit(poem):
+        async with semaphore:
+            reason = None
+            for level, annotator in enumerate(annotators):
+                result = await annotator.annotate_with_agreement(poem)
+                await data_manager.save_annotations([annotator.to_save_record(result, run_id)])
+                is_last = level == len(annotators) - 1
+                if result['status'] != 'completed':
+                    reason = f"{annotator.model_identifier}: 验证失败"
+                elif (result.get('agreement') if result.get('agreement') is not None else 1.0) < min_agreement:
+                    reason = f"{annotator.model_identifier}: 一致率 {result['agreement']:.2f} < {min_agreement}"
+                    if is_last:
+                        # 最后一个模型没有可升级的对象，仍采用其结果
+                        return annotator.model_identifier, 'completed', level, reason
+                else:
+                    return annotator.model_identifier, 'completed', level, reason
+                if not is_last:
+                    logger.info(f"诗词ID {poem['id']} 升级到下一个模型 ({reason})")
+            return annotators[-1].model_identifier, 'failed', len(annotators) - 1, reason
+
+    async def run_unit(poem):
+        final_model, status, escalations, reason = await cascade_unit(poem)
+        await data_manager.run_in_db_thread(
+            data_manager.save_cascade_decision, poem['id'], cascade_id, final_model, status, escalations, reason
+        )
+        return final_model, status
+
+    final_counts = {alias: 0 for alias in target_models}
+    failed = 0
+    for future in asyncio.as_completed([run_unit(poem) for poem in poems]):
+        final_model, status = await future
+        if status == 'completed':
+            final_counts[final_model] += 1
+        else:
+            failed += 1
+
+    logger.info(f"\n=== 级联标注最终报告 [{cascade_id}] ===")
+    for alias in target_models:
+        logger.info(f"由模型配置 [{alias}] 最终完成: {final_counts[alias]}")
+    logger.info(f"级联后仍失败: {failed}")
+    logger.info("---------------------------------")
+    cumulative = data_manager.get_cascade_statistics(cascade_id)
+    for alias in target_models:
+        logger.info(f"累计由 [{alias}] 完成: {cumulative.get(alias, 0)}")
+    logger.info("=================================")
+
+
+async def run_consensus_annotation(models: Tuple[str], limit: Optional[int], id_range: Optional[str], force_rerun: bool,
+                                   min_agreement: float, project_instance: Project):
+    """
+    共识早停调度器：按波次运行多个模型。第一波同时运行前两个模型，之后每一波只把
+    现有标注在句子级主情感一致率低于 min_agreement 的诗词交给下一个模型。
+    一致率从 annotations 表增量计算：每一波只读取本波模型的新结果。
+    """
+    start_id, end_id = None, None
+    if id_range:
+        try:
+            start_id, end_id = map(int, id_range.split(':'))
+            logger.info(f"标注范围: {start_id} - {end_id}")
+        except ValueError:
+            logger.error("范围格式错误，请使用 'start:end' 格式")
+            return
+
+    if len(models) < 2:
+        logger.error("共识模式至少需要通过 --model 指定两个模型配置。")
+        return
+    target_models = list(models)
+    waves = [target_models[:2]] + [[alias] for alias in target_models[2:]]
+    logger.info(f"共识标注 - 波次: {waves}, 最低一致率: {min_agreement}")
+
+    data_manager = project_instance.get_data_manager()
+    active_ids = data_manager.get_poem_ids(limit=limit, start_id=start_id, end_id=end_id)
+    if not active_ids:
+        logger.info("没有找到待标注的诗词。")
+        return
+
+    total_poems = len(active_ids)
+    labels_by_poem: Dict[int, Dict[str, Dict[str, str]]] = {}
+    requests_sent = 0
+    wave_reports = []
+
+    for wave_index, wave_models in enumerate(waves, start=1):
+        tasks = []
+        for alias in wave_models:
+            annotator = project_instance.get_annotator(config_name=alias)
+            todo_ids = active_ids
+            if not force_rerun:
+                done = data_manager.get_completed_poem_ids(active_ids, annotator.model_identifier)
+                todo_ids = [poem_id for poem_id in active_ids if poem_id not in done]
+            if todo_ids:
+                tasks.append(annotator.run(poem_ids=todo_ids, force_rerun=force_rerun))
+        if tasks:
+            results = await asyncio.gather(*tasks)
+            requests_sent += sum(res['total'] for res in results)
+
+        # 仅读取本波模型的结果，合并进已有的标签缓存
+        new_results = data_manager.get_completed_annotations(active_ids, wave_models)
+        for poem_id, by_model in new_results.items():
+            poem_labels = labels_by_poem.setdefault(poem_id, {})
+            for model_identifier, annotation_result in by_model.items():
+                poem_labels[model_identifier] = primary_labels_from_result(annotation_result)
+
+        still_open = []
+        for poem_id in active_ids:
+            agreement = sentence_agreement(list(labels_by_poem.get(poem_id, {}).values()))
+            # 有效标注不足两份时无法判断一致性，继续交给下一个模型
+            if agreement is None or agreement < min_agreement:
+                still_open.append(poem_id)
+        wave_reports.append((wave_models, len(active_ids), len(active_ids) - len(still_open)))
+        active_ids = still_open
+        if not active_ids:
+            break
+
+    logger.info("\n=== 共识标注最终报告 ===")
+    for index, (wave_models, entered, settled) in enumerate(wave_reports, start=1):
+        logger.info(f"第 {index} 波 {wave_models}: 参与 {entered} 首, 达成共识 {settled} 首")
+    logger.info(f"仍存在分歧: {len(active_ids)} 首")
+    logger.info(f"实际发送请求: {requests_sent}, 全量多模型标注需 {total_poems * len(target_models)}")
+    logger.info("=================================")
+
+
 @cli.command()
 @click.option('--model', 'models', multiple=True, help="指定一个或多个模型配置别名 (例如 'gpt-4o'), 可多次使用此选项。")
 @click.option('--limit', type=int, help='限制每个模型本次标注的数量')
 @click.option('--range', 'id_range', help='按ID范围进行标注 (例如: 1:100)')
 @click.option('--force-rerun', is_flag=True, help='强制重新标注已完成的条目')
-def annotate(models, limit, id_range, force_rerun):
+@click.option('--cascade', is_flag=True, help='级联模式：按 --model 的顺序依次尝试，仅在验证失败或一致率不足时升级到下一个模型')
+@click.option('--consensus', is_flag=True, help='共识早停模式：按波次运行多个模型，仅把存在分歧的诗词交给下一个模型')
+@click.option('--min-agreement', type=float, default=1.0, show_default=True,
+              help='最低主情感一致率：级联模式下比较多采样 (n>1)，共识模式下比较已有模型的标注；低于该值则交给下一个模型')
+@click.option('--only-stale', is_flag=True, help='只重新标注已过期的结果：诗词原文或提示词/情感体系在标注后发生了变化')
+def annotate(models, limit, id_range, force_rerun, cascade, consensus, min_agreement, only_stale):
     """启动一个或多个模型的并发标注任务"""
     try:
         # 从全局CLI上下文中获取项目实例
@@ -260,15 +427,30 @@ def annotate(models, limit, id_range, force_rerun):
         # 记录任务参数
         logger.info(f"任务参数 - 模型: {models or '未指定'}, 限制: {limit or '无'}, 范围: {id_range or '全部'}, 强制重跑: {force_rerun}")
         
-        asyncio.run(run_multi_model_annotation(models, limit, id_range, force_rerun, project_instance))
+        if cascade and consensus:
+            logger.error("--cascade 与 --consensus 不能同时使用。")
+            return
+        if only_stale and (cascade or consensus or force_rerun):
+            logger.error("--only-stale 不能与 --cascade、--consensus 或 --force-rerun 同时使用。")
+            return
+        if cascade:
+            asyncio.run(run_cascade_annotation(models, limit, id_range, force_rerun, min_agreement, project_instance))
+        elif consensus:
+            asyncio.run(run_consensus_annotation(models, limit, id_range, force_rerun, min_agreement, project_instance))
+        else:
+            asyncio.run(run_multi_model_annotation(models, limit, id_range, force_rerun, project_instance, only_stale))
         
         logger.info("标注任务执行完成")
     except Exception as e:
         logger.error(f"标注任务执行失败: {e}", exc_info=True)
 
 @cli.command()
-def status():
+@click.option('--recount', is_flag=True, help='先按当前数据重新统计计数表，再显示统计')
+@click.option('--all-dbs', is_flag=True, help='汇总项目配置中的所有数据库（ATTACH 后一次查询完成）')
+def status(recount, all_dbs):
     """显示标注进度统计 (按模型配置)"""
+    if recount and all_dbs:
+        raise click.UsageError("--recount 只能用于单个数据库，请配合 --db-name 使用")
     try:
         # 从全局CLI上下文中获取项目实例
         ctx = click.get_current_context()
@@ -277,12 +459,20 @@ def status():
         
         logger.info("获取标注进度统计...")
         # 使用项目实例的 DataManager 来获取统计信息
-        data_manager_instance = project_instance.get_data_manager(db_name=ctx.parent.params['db_name'])
-        stats = data_manager_instance.get_statistics()
+        if all_dbs:
+            with project_instance.get_db_router() as router:
+                stats = router.get_statistics()
+        else:
+            data_manager_instance = project_instance.get_data_manager(db_name=ctx.parent.params['db_name'])
+            if recount:
+                data_manager_instance.rebuild_counters()
+            stats = data_manager_instance.get_statistics()
         
         print("\n=== 标注进度统计 ===")
         print(f"总诗词数量: {stats.get('total_poems', 0)}")
         print(f"总作者数量: {stats.get('total_authors', 0)}")
+        for db_name, db_stats in stats.get('by_db', {}).items():
+            print(f"  - {db_name}: 诗词 {db_stats['total_poems']}, 作者 {db_stats['total_authors']}")
         
         if not stats.get('stats_by_model'):
             print("\n尚未有任何模型的标注记录。")
@@ -311,11 +501,23 @@ def status():
 
 @cli.command()
 @click.option('--format', 'output_format', default='jsonl', 
-              type=click.Choice(['jsonl', 'json']), help='输出格式')
-@click.option('--output', help='输出文件路径 (可选)')
+              type=click.Choice(['jsonl', 'parquet', 'arrow']),
+              help='输出格式：jsonl 每条标注一行；parquet/arrow 按句子展开为列式文件 (需要 pyarrow)')
+@click.option('--output', help='输出文件路径；增量模式下为分片输出目录 (可选)')
 @click.option('--model', 'model_filter', help='只导出指定模型配置的标注结果 (可选)')
-def export(output_format, output, model_filter):
+@click.option('--incremental', is_flag=True,
+              help='增量导出：只导出上次导出后有变化的标注，写成输出目录中的新分片并更新 manifest.json')
+@click.option('--lag', 'lag_seconds', type=int, default=60, show_default=True,
+              help='增量模式下不导出最近这么多秒内的更新，留给仍在提交中的写入')
+@click.option('--since', help='只导出 updated_at 不早于该时间的标注，如 2025-01-01 (可选)')
+@click.option('--until', help='只导出 updated_at 早于该时间的标注 (可选)')
+@click.option('--row-group-size', type=int, default=100000, show_default=True, help='列式格式每个行组的句子行数')
+@click.option('--compression', default='zstd', show_default=True,
+              type=click.Choice(['zstd', 'snappy', 'gzip', 'lz4', 'none']), help='列式格式的压缩算法')
+def export(output_format, output, model_filter, incremental, lag_seconds, since, until, row_group_size, compression):
     """导出标注结果"""
+    if incremental and (since or until):
+        raise click.UsageError("--incremental 使用 manifest.json 中的水位线，不能与 --since/--until 同时使用")
     try:
         # 从全局CLI上下文中获取项目实例
         ctx = click.get_current_context()
@@ -329,10 +531,29 @@ def export(output_format, output, model_filter):
         
         # 使用项目实例的 DataManager 来导出结果
         data_manager_instance = project_instance.get_data_manager(db_name=ctx.parent.params['db_name'])
+        if incremental:
+            shard = data_manager_instance.export_incremental(
+                output_dir=output,
+                output_format=output_format,
+                model_filter=model_filter,
+                lag_seconds=lag_seconds,
+                row_group_size=row_group_size,
+                compression=compression
+            )
+            if shard:
+                logger.info(f"增量分片 {shard['file']}: {shard['annotations']} 条标注，水位线 {shard['watermark']}")
+            else:
+                logger.info("没有新的变更需要导出")
+            return
+
         output_file = data_manager_instance.export_results(
             output_format=output_format,
             output_file=output,
-            model_filter=model_filter
+            model_filter=model_filter,
+            since=since,
+            until=until,
+            row_group_size=row_group_size,
+            compression=compression
         )
         
         logger.info(f"结果已导出到: {output_file}")
@@ -341,6 +562,112 @@ def export(output_format, output, model_filter):
         logger.error(f"导出失败: {e}", exc_info=True)
 
 
+@cli.command(name="convert-storage")
+@click.option('--to', 'target', type=click.Choice(['compact', 'json']), required=True,
+              help='目标存储格式：compact 只存句子序号和情感编码；json 还原为完整JSON文本')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='每个事务改写的标注条数')
+@click.option('--vacuum', is_flag=True, help='转换后执行 VACUUM，把释放的空间归还给文件系统')
+def convert_storage(target, batch_size, vacuum):
+    """转换已有标注结果的存储格式"""
+    try:
+        ctx = click.get_current_context()
+        project_name = ctx.parent.params['project']
+        project_instance = Project(project_name=project_name, project_root_dir=Path("projects"))
+        data_manager_instance = project_instance.get_data_manager(db_name=ctx.parent.params['db_name'])
+
+        db_file = Path(data_manager_instance.db_path)
+        size_before = db_file.stat().st_size
+        converted = data_manager_instance.convert_annotation_storage(target, batch_size=batch_size, vacuum=vacuum)
+        size_after = db_file.stat().st_size
+        logger.info(f"转换完成: {converted} 条标注结果已改写为 {target} 格式, "
+                    f"数据库文件 {size_before / 1024 / 1024:.1f} MB -> {size_after / 1024 / 1024:.1f} MB")
+        if data_manager_instance.annotation_storage != target:
+            logger.warning(f"配置中的 annotation_storage 为 {data_manager_instance.annotation_storage}，"
+                           f"之后新写入的标注仍将使用该格式")
+
+    except Exception as e:
+        logger.error(f"存储格式转换失败: {e}", exc_info=True)
+
+
+@cli.command(name="prompt-stats")
+@click.option('--sample', 'sample_size', type=int, default=200, help='参与对比的诗词数量 (默认: 200)')
+@click.option('--range', 'id_range', help='按ID范围抽取样本 (例如: 1:1000)')
+def prompt_stats(sample_size, id_range):
+    """对比不同句子编码格式在诗词样本上的输入token开销"""
+    try:
+        from prompt_encoding import compare_sentence_encodings, tiktoken
+
+        ctx = click.get_current_context()
+        project_name = ctx.parent.params['project']
+        project_instance = Project(project_name=project_name, project_root_dir=Path("projects"))
+
+        start_id, end_id = None, None
+        if id_range:
+            try:
+                start_id, end_id = map(int, id_range.split(':'))
+            except ValueError:
+                logger.error("范围格式错误，请使用 'start:end' 格式")
+                return
+
+        data_manager_instance = project_instance.get_data_manager(db_name=ctx.parent.params['db_name'])
+        # force_rerun=True 表示不按模型过滤，直接取范围内的诗词作为样本
+        poems = data_manager_instance.get_poems_to_annotate(
+            model_identifier='', limit=sample_size, start_id=start_id, end_id=end_id, force_rerun=True
+        )
+        if not poems:
+            print("没有找到可用于对比的诗词。")
+            return
+
+        results = compare_sentence_encodings(poems)
+        estimator = "tiktoken (cl100k_base)" if tiktoken else "启发式估算"
+
+        print(f"\n=== 句子编码token对比 (样本: {len(poems)} 首, 估算方式: {estimator}) ===")
+        print(f"{'格式':<14}{'总字符':>10}{'总token':>10}{'平均token/首':>14}{'节省':>10}")
+        for fmt, stats in results.items():
+            print(f"{fmt:<14}{stats['chars']:>10}{stats['tokens']:>10}{stats['avg_tokens']:>14.1f}{stats['saving_pct']:>9.1f}%")
+        print("\n在模型配置中设置 sentence_format / output_format 以启用紧凑格式，")
+        print("并将提示词模板指向对应的说明 (例如 config/system_prompt_instruction_line.txt)。\n")
+
+    except Exception as e:
+        logger.error(f"编码对比失败: {e}", exc_info=True)
+
+
+@cli.command(name="backfill-plan")
+@click.option('--model', 'model_identifier', required=True, help='需要回填的新模型配置别名')
+@click.option('--strategy', type=click.Choice(['disagreement', 'entropy', 'strata']), default='disagreement',
+              show_default=True, help='排序策略：一致率升序 / 主情感熵降序 / 按一致率分层轮流抽取')
+@click.option('--limit', type=int, help='队列长度上限 (即新模型本次的标注预算)')
+@click.option('--strata', type=int, default=4, show_default=True, help='strata 策略的分层数量')
+@click.option('--seed', type=int, default=42, show_default=True, help='strata 策略层内随机抽取的种子')
+@click.option('--output', '-o', required=True, help='输出的ID文件路径 (每行一个ID，可直接用于 distribute_tasks.py)')
+def backfill_plan(model_identifier, strategy, limit, strata, seed, output):
+    """按已有模型间的分歧程度为新模型生成优先级排序的标注队列"""
+    try:
+        ctx = click.get_current_context()
+        project_name = ctx.parent.params['project']
+        project_instance = Project(project_name=project_name, project_root_dir=Path("projects"))
+        data_manager_instance = project_instance.get_data_manager(db_name=ctx.parent.params['db_name'])
+
+        refreshed = data_manager_instance.refresh_poem_agreement()
+        logger.info(f"一致性表增量刷新完成，重新计算 {refreshed} 首诗词")
+
+        queue = data_manager_instance.get_backfill_queue(
+            model_identifier, strategy=strategy, limit=limit, strata=strata, seed=seed
+        )
+        if not queue:
+            logger.info(f"没有可为模型 [{model_identifier}] 回填的诗词（需已有至少两个模型的成功标注）。")
+            return
+
+        output_path = Path(output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(str(poem_id) for poem_id in queue) + '\n')
+        logger.info(f"回填队列已生成: {output_path} (策略: {strategy}, 共 {len(queue)} 首)")
+
+    except Exception as e:
+        logger.error(f"回填规划失败: {e}", exc_info=True)
+
+
 @cli.command(name="list-models")
 def list_models():
     """列出在config.ini中已配置的模型"""
@@ -358,7 +685,7 @@ def list_models():
         print("\n=== 已配置的模型 ===")
         if not configured_models:
             print("⚠️ 没有在 config.ini 中找到任何 [Model.*] 配置。")
-            print("请参考 config.ini.template 添加您的模型配置。")
+            print("请参考 config/config.ini.template 添加您的模型配置。")
             logger.warning("未找到任何模型配置")
         else:
             for name, details in configured_models.items():
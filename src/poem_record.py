@@ -0,0 +1,109 @@
+"""
+待标注诗词的紧凑内存表示
+
+待标注队列中的诗词可能要等待很久才被处理。PoemRecord 用 __slots__ 保存数据库行中的字段，
+paragraphs 保留数据库中的JSON文本，首次访问时才解码并缓存；full_text 由 paragraphs 按需拼接，
+不再从数据库读取第二份全文。content_hash 是读取时的原文指纹，随标注结果保存，用于发现原文修订后过期的标注。
+
+作者简介不随诗词查询（不再 JOIN authors），而是在首次读取 author_desc 时由共享的
+AuthorDescriptions 从作者表一次性加载，所有诗词引用同一份简介字符串。提示词模板不引用
+{author_desc} 时作者表根本不会被读取。
+
+PoemRecord 实现只读的 Mapping 接口（poem['id']、poem.get('author_desc')、dict(poem) 均可用），
+标注服务层无需修改、也无需复制即可直接使用。
+"""
+
+import json
+import sys
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+POEM_RECORD_KEYS = ('id', 'title', 'author', 'paragraphs', 'full_text', 'author_desc', 'content_hash')
+
+# 查询待标注诗词时选取的列，顺序与 PoemRecord.from_row 一致
+POEM_RECORD_COLUMNS = "p.id, p.title, p.author, p.paragraphs, p.content_hash"
+
+
+class AuthorDescriptions:
+    """作者名 -> 简介 的内存映射，首次查询时通过 loader 一次性加载；作者名驻留（sys.intern）"""
+
+    __slots__ = ('_loader', '_descriptions')
+
+    def __init__(self, loader: Callable[[], Iterable[Tuple[str, Optional[str]]]]):
+        self._loader = loader
+        self._descriptions: Optional[Dict[str, Optional[str]]] = None
+
+    def get(self, author: Optional[str]) -> Optional[str]:
+        if self._descriptions is None:
+            self._descriptions = {sys.intern(name): description for name, description in self._loader()}
+        return self._descriptions.get(author)
+
+    def invalidate(self):
+        """作者表更新后调用，下次查询时重新加载"""
+        self._descriptions = None
+
+
+class PoemRecord(Mapping):
+    """只读的诗词记录，paragraphs 延迟解码，author_desc 按需从共享的作者映射读取"""
+
+    __slots__ = ('id', 'title', 'author', 'content_hash', '_authors', '_paragraphs_raw', '_paragraphs')
+
+    def __init__(self, poem_id: int, title: Optional[str], author: Optional[str],
+                 paragraphs_raw: Optional[str], authors: Optional[AuthorDescriptions] = None,
+                 content_hash: Optional[str] = None):
+        self.id = poem_id
+        self.title = title
+        self.content_hash = content_hash
+        # 同一作者的诗词共享同一个作者名字符串
+        self.author = sys.intern(author) if isinstance(author, str) else author
+        self._authors = authors
+        self._paragraphs_raw = paragraphs_raw
+        self._paragraphs = None
+
+    @classmethod
+    def from_row(cls, row, authors: Optional[AuthorDescriptions] = None) -> 'PoemRecord':
+        """由按 POEM_RECORD_COLUMNS 选取的数据库行构造"""
+        return cls(row[0], row[1], row[2], row[3], authors, row[4])
+
+    @property
+    def author_desc(self) -> Optional[str]:
+        """作者简介；作者表中没有该作者时为 None"""
+        return self._authors.get(self.author) if self._authors is not None else None
+
+    @property
+    def paragraphs(self) -> Any:
+        """句子列表；数据库中为空值时原样返回"""
+        if self._paragraphs is None:
+            raw = self._paragraphs_raw
+            if not raw:
+                return raw
+            self._paragraphs = json.loads(raw)
+            # 解码后不再需要原始JSON文本
+            self._paragraphs_raw = None
+        return self._paragraphs
+
+    @property
+    def full_text(self) -> Any:
+        """全文，与入库时的拼接方式一致（句子以换行连接）"""
+        paragraphs = self.paragraphs
+        return '\n'.join(paragraphs) if paragraphs else paragraphs
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in POEM_RECORD_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(POEM_RECORD_KEYS)
+
+    def __len__(self) -> int:
+        return len(POEM_RECORD_KEYS)
+
+    def __repr__(self) -> str:
+        # 不读取 author_desc，避免仅因日志输出而加载作者表
+        return f"PoemRecord(id={self.id!r}, title={self.title!r}, author={self.author!r}, paragraphs={self.paragraphs!r})"
+
+
+def poem_records(rows, authors: Optional[AuthorDescriptions] = None) -> List[PoemRecord]:
+    """把查询结果行转为 PoemRecord 列表"""
+    return [PoemRecord.from_row(row, authors) for row in rows]
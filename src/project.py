@@ -15,6 +15,7 @@ try:
     from .label_parser import LabelParser as BaseLabelParser
     from .llm_factory import LLMFactory as BaseLLMFactory
     from .annotator import Annotator as BaseAnnotator
+    from .db_router import MultiDatabaseRouter
 except ImportError as e:
     relative_import_failed = True
     print(f"Project模块相对导入失败: {e}")
@@ -36,6 +37,7 @@ if relative_import_failed:
     from label_parser import LabelParser as BaseLabelParser
     from llm_factory import LLMFactory as BaseLLMFactory
     from annotator import Annotator as BaseAnnotator
+    from db_router import MultiDatabaseRouter
 
 
 logger = get_logger(__name__)
@@ -170,10 +172,25 @@ class Project:
                 db_path=str(full_db_path), 
                 source_dir=str(source_dir), 
                 output_dir=str(output_dir),
-                db_name_alias=db_name # 传递db_name_alias用于DataManager内部的ID前缀设置
+                db_name_alias=db_name, # 传递db_name_alias用于DataManager内部的ID前缀设置
+                annotation_storage=self.config_manager.get_storage_config()['annotation_storage']
             )
         return self._data_manager_instances[db_name]
 
+    def get_db_router(self) -> MultiDatabaseRouter:
+        """
+        获取附加了项目所有数据库（db_paths；单库配置时为 default）的只读查询路由，用于跨集合查询。
+        调用方负责 close()。
+        """
+        db_config = self.config_manager.get_database_config()
+        if db_config.get('db_paths'):
+            db_paths = db_config['db_paths']
+        elif db_config.get('db_path'):
+            db_paths = {'default': db_config['db_path']}
+        else:
+            raise ValueError(f"项目 '{self.name}' 的配置文件中未找到数据库路径配置。")
+        return MultiDatabaseRouter({name: str(self.root_path / path) for name, path in db_paths.items()})
+
     def get_annotator(self, config_name: str) -> BaseAnnotator:
         """获取项目专属的 Annotator 实例"""
         if config_name not in self._annotator_instances:
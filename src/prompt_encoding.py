@@ -0,0 +1,171 @@
+"""
+提示词句子编码与紧凑输出格式
+
+用户提示词中的待标注句子默认以带缩进的JSON数组呈现，缩进、键名和引号会为每一句
+额外消耗大量token。此模块提供多种可选的句子编码方式（输入）以及与之配套的紧凑
+输出格式（由 llm_response_parser 解析），并提供一个简单的token估算工具，
+用于对比不同编码在真实诗词样本上的开销。
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# 可选依赖：tiktoken，用于更准确地估算token数
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None # 如果未安装，回退到启发式估算
+
+
+# --- 输入编码 ---
+
+def _encode_json_pretty(sentences: List[Dict[str, str]]) -> str:
+    """默认格式：带缩进的JSON数组（与历史行为一致）"""
+    return json.dumps(sentences, ensure_ascii=False, indent=2)
+
+
+def _encode_json_compact(sentences: List[Dict[str, str]]) -> str:
+    """最小化JSON：去除缩进和分隔符后的空格"""
+    return json.dumps(sentences, ensure_ascii=False, separators=(',', ':'))
+
+
+def _encode_line(sentences: List[Dict[str, str]]) -> str:
+    """行格式：每行一句，形如 `S1|句子`"""
+    return '\n'.join(f"{item['id']}|{item['sentence']}" for item in sentences)
+
+
+def _encode_tsv(sentences: List[Dict[str, str]]) -> str:
+    """TSV格式：首行为表头，之后每行 `S1<TAB>句子`"""
+    rows = ['id\tsentence']
+    rows.extend(f"{item['id']}\t{item['sentence']}" for item in sentences)
+    return '\n'.join(rows)
+
+
+SENTENCE_ENCODERS = {
+    'json_pretty': _encode_json_pretty,
+    'json_compact': _encode_json_compact,
+    'line': _encode_line,
+    'tsv': _encode_tsv,
+}
+
+# 输出格式 -> 行内字段分隔符。'json' 表示沿用原有的JSON数组输出。
+OUTPUT_FORMATS = {
+    'json': None,
+    'line': '|',
+    'tsv': '\t',
+}
+
+
+def encode_sentences(sentences: List[Dict[str, str]], sentence_format: str = 'json_pretty') -> str:
+    """
+    按指定格式编码带ID的句子列表。
+
+    Args:
+        sentences: 形如 [{"id": "S1", "sentence": "..."}] 的列表。
+        sentence_format: 编码格式，见 SENTENCE_ENCODERS。
+
+    Raises:
+        ValueError: 如果编码格式不受支持。
+    """
+    encoder = SENTENCE_ENCODERS.get(sentence_format)
+    if encoder is None:
+        raise ValueError(f"不支持的句子编码格式: {sentence_format}。支持的格式: {list(SENTENCE_ENCODERS.keys())}")
+    return encoder(sentences)
+
+
+def validate_output_format(output_format: str) -> str:
+    """校验输出格式名称，返回规范化后的名称"""
+    normalized = (output_format or 'json').strip().lower()
+    if normalized not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}。支持的格式: {list(OUTPUT_FORMATS.keys())}")
+    return normalized
+
+
+# --- 紧凑输出解析 ---
+
+_CODE_FENCE_RE = re.compile(r"```[a-zA-Z]*")
+_SECONDARY_SPLIT_RE = re.compile(r"[,，;；\s]+")
+
+
+def parse_delimited_annotations(text: str, delimiter: str) -> List[Dict[str, Any]]:
+    """
+    解析行格式/TSV格式的标注输出，每行形如 `S1|05.04|06.05,11.06`。
+    次要情感列可以为空。非标注行（说明文字、表头、代码块标记）会被忽略。
+
+    Returns:
+        与JSON输出等价的字典列表: [{"id": ..., "primary": ..., "secondary": [...]}]
+
+    Raises:
+        ValueError: 如果文本中没有任何可识别的标注行。
+    """
+    results = []
+    for raw_line in _CODE_FENCE_RE.sub('', text).splitlines():
+        line = raw_line.strip()
+        if not line or delimiter not in line:
+            continue
+        parts = [part.strip() for part in line.split(delimiter)]
+        if len(parts) < 2 or not re.fullmatch(r"S\d+", parts[0]):
+            continue
+        secondary_raw = parts[2] if len(parts) > 2 else ''
+        secondary = [s for s in _SECONDARY_SPLIT_RE.split(secondary_raw) if s]
+        results.append({'id': parts[0], 'primary': parts[1], 'secondary': secondary})
+
+    if not results:
+        raise ValueError("未能在响应中找到任何符合紧凑格式的标注行")
+    return results
+
+
+# --- Token 估算 ---
+
+_CJK_RE = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str, encoding_name: str = 'cl100k_base') -> int:
+    """
+    估算文本的token数。
+    安装了 tiktoken 时使用其分词结果；否则按“每个CJK字符/标点约1个token，
+    其余字符约4个字符1个token”的经验规则估算。
+    """
+    if not text:
+        return 0
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.get_encoding(encoding_name).encode(text))
+        except Exception:
+            pass # 编码表不可用（例如离线环境），回退到启发式估算
+    cjk_count = len(_CJK_RE.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def compare_sentence_encodings(poems: List[Dict[str, Any]],
+                               formats: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    在一组诗词样本上对比不同句子编码的字符数和token数。
+
+    Args:
+        poems: 包含 'paragraphs' 字段的诗词字典列表。
+        formats: 需要对比的格式列表，默认为全部格式。
+
+    Returns:
+        {格式名: {'chars': int, 'tokens': int, 'avg_tokens': float, 'saving_pct': float}}
+        saving_pct 为相对 json_pretty 的token节省比例。
+    """
+    formats = formats or list(SENTENCE_ENCODERS.keys())
+    totals = {fmt: {'chars': 0, 'tokens': 0} for fmt in formats}
+    baseline_tokens = 0
+
+    for poem in poems:
+        sentences = [{"id": f"S{i+1}", "sentence": s} for i, s in enumerate(poem.get('paragraphs') or [])]
+        baseline_tokens += estimate_tokens(_encode_json_pretty(sentences))
+        for fmt in formats:
+            encoded = encode_sentences(sentences, fmt)
+            totals[fmt]['chars'] += len(encoded)
+            totals[fmt]['tokens'] += estimate_tokens(encoded)
+
+    sample_size = len(poems)
+    for fmt, stats in totals.items():
+        stats['avg_tokens'] = stats['tokens'] / sample_size if sample_size else 0
+        stats['saving_pct'] = (1 - stats['tokens'] / baseline_tokens) * 100 if baseline_tokens else 0
+    return totals
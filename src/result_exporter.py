@@ -0,0 +1,176 @@
+"""
+标注结果的流式导出
+
+DataManager.export_results 按批次从游标读取 poems JOIN annotations 的结果并交给这里的写入器，
+内存占用与导出总行数无关：
+- jsonl: 每条标注一行，字段与历史格式一致（annotation_result 仍为JSON字符串）；
+- parquet / arrow: 把句子级标注展开为带类型的列（每个句子一行），可直接被 pandas / DuckDB 读取，
+  无需再二次解析嵌套的JSON字符串。
+
+增量导出把每次运行的结果写成输出目录中的一个只追加分片（part-00001.jsonl ...），
+manifest.json 记录分片列表和已导出的 updated_at 水位线。
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 可选依赖：pyarrow，用于 Parquet / Arrow IPC 导出
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None # 未安装时只能导出 jsonl
+    pq = None
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+EXPORT_FORMATS = ('jsonl',) + COLUMNAR_FORMATS
+COMPRESSIONS = ('zstd', 'snappy', 'gzip', 'lz4', 'none')
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# 句子级导出的列，顺序即输出顺序
+SENTENCE_COLUMNS = (
+    'poem_id', 'title', 'author', 'model_identifier', 'sentence_index', 'sentence_id',
+    'sentence_text', 'primary_emotion', 'secondary_emotions', 'created_at', 'updated_at'
+)
+
+
+def sentence_schema():
+    """句子级导出的 Arrow schema（时间戳统一为东八区）"""
+    timestamp = pa.timestamp('us', tz='+08:00')
+    return pa.schema([
+        ('poem_id', pa.int64()),
+        ('title', pa.string()),
+        ('author', pa.string()),
+        ('model_identifier', pa.string()),
+        ('sentence_index', pa.int32()),
+        ('sentence_id', pa.string()),
+        ('sentence_text', pa.string()),
+        ('primary_emotion', pa.string()),
+        ('secondary_emotions', pa.list_(pa.string())),
+        ('created_at', timestamp),
+        ('updated_at', timestamp),
+    ])
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """解析库中的ISO时间字符串，空值或无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class JsonlWriter:
+    """逐行写入JSONL，每条标注一行"""
+
+    def __init__(self, output_path: str):
+        self._file = open(output_path, 'w', encoding='utf-8')
+        self.rows_written = 0
+
+    def write(self, record: Dict[str, Any], sentences: Optional[List[Dict[str, Any]]] = None):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.rows_written += 1
+
+    def close(self):
+        self._file.close()
+
+
+class ColumnarWriter:
+    """
+    把句子级标注按列缓冲，攒满 row_group_size 行后写出一个 Parquet 行组（或一个 Arrow 记录批）。
+    只有成功且含句子的标注会产生行。
+    """
+
+    def __init__(self, output_path: str, output_format: str, row_group_size: int = 100000,
+                 compression: str = 'zstd'):
+        if pa is None:
+            raise RuntimeError(f"导出 {output_format} 需要安装 pyarrow: pip install pyarrow")
+        if output_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"不支持的列式导出格式: {output_format}。支持的格式: {list(COLUMNAR_FORMATS)}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"不支持的压缩算法: {compression}。支持的算法: {list(COMPRESSIONS)}")
+        self.schema = sentence_schema()
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        codec = None if compression == 'none' else compression
+        if output_format == 'parquet':
+            self._writer = pq.ParquetWriter(output_path, self.schema, compression=codec or 'none')
+        else:
+            self._sink = pa.OSFile(output_path, 'wb')
+            self._writer = pa.ipc.new_file(
+                self._sink, self.schema, options=pa.ipc.IpcWriteOptions(compression=codec)
+            )
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self._columns: Dict[str, List[Any]] = {name: [] for name in SENTENCE_COLUMNS}
+        self._buffered = 0
+
+    def write(self, record: Dict[str, Any], sentences: Optional[List[Dict[str, Any]]] = None):
+        if record['status'] != 'completed' or not sentences:
+            return
+        created_at = parse_timestamp(record['created_at'])
+        updated_at = parse_timestamp(record['updated_at'])
+        columns = self._columns
+        for index, sentence in enumerate(sentences):
+            columns['poem_id'].append(record['poem_id'])
+            columns['title'].append(record['title'])
+            columns['author'].append(record['author'])
+            columns['model_identifier'].append(record['model_identifier'])
+            columns['sentence_index'].append(index)
+            columns['sentence_id'].append(sentence.get('sentence_id'))
+            columns['sentence_text'].append(sentence.get('sentence_text'))
+            columns['primary_emotion'].append(sentence.get('primary_emotion'))
+            secondary = sentence.get('secondary_emotions')
+            columns['secondary_emotions'].append(secondary if isinstance(secondary, list) else [])
+            columns['created_at'].append(created_at)
+            columns['updated_at'].append(updated_at)
+        self._buffered += len(sentences)
+        if self._buffered >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        table = pa.Table.from_pydict(self._columns, schema=self.schema)
+        self._writer.write_table(table)
+        self.rows_written += self._buffered
+        self._reset_buffer()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        if hasattr(self, '_sink'):
+            self._sink.close()
+
+
+def open_export_writer(output_path: str, output_format: str, row_group_size: int = 100000,
+                       compression: str = 'zstd'):
+    """按导出格式创建写入器"""
+    if output_format == 'jsonl':
+        return JsonlWriter(output_path)
+    return ColumnarWriter(output_path, output_format, row_group_size=row_group_size, compression=compression)
+
+
+def load_manifest(output_dir: Path) -> Optional[Dict[str, Any]]:
+    """读取增量导出目录的清单，目录中尚无清单时返回 None"""
+    manifest_path = Path(output_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(output_dir: Path, manifest: Dict[str, Any]):
+    """先写临时文件再原子替换，中途失败不会留下损坏的清单"""
+    manifest_path = Path(output_dir) / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
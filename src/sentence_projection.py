@@ -0,0 +1,59 @@
+"""
+句子级标注投影
+
+把 annotations.annotation_result 中的句子标注展开写入 sentence_annotations / sentence_emotion_links，
+可视化与统计脚本直接查询这两张表。DataManager 每次保存标注时在同一事务内调用，
+可视化的 db_setup 只用它为历史数据做一次性回填。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+_DELETE_LINKS_SQL = """
+    DELETE FROM sentence_emotion_links
+    WHERE sentence_annotation_id IN (SELECT id FROM sentence_annotations WHERE annotation_id = ?)
+"""
+_DELETE_SENTENCES_SQL = "DELETE FROM sentence_annotations WHERE annotation_id = ?"
+_INSERT_SENTENCE_SQL = """
+    INSERT OR IGNORE INTO sentence_annotations (annotation_id, poem_id, sentence_uid, sentence_text)
+    VALUES (?, ?, ?, ?)
+"""
+# 通过 (annotation_id, sentence_uid) 唯一索引找到刚写入的句子行，避免逐行取 lastrowid
+_INSERT_LINK_SQL = """
+    INSERT OR IGNORE INTO sentence_emotion_links (sentence_annotation_id, emotion_id, is_primary)
+    SELECT id, ?, ? FROM sentence_annotations WHERE annotation_id = ? AND sentence_uid = ?
+"""
+
+
+def project_sentences(cursor, annotations: List[Tuple[int, int, Optional[List[Dict[str, Any]]]]],
+                      replace: bool = True) -> int:
+    """
+    把一批标注结果投影到句子级表中，不提交事务。
+
+    :param annotations: (annotation_id, poem_id, 已解码的标注结果列表)；结果为 None（如失败的标注）时只清除旧行
+    :param replace: 是否先删除这些标注已有的句子行（回填尚无句子行的标注时可跳过）
+    :return: 写入的句子数
+    """
+    if replace:
+        annotation_ids = [(annotation_id,) for annotation_id, _, _ in annotations]
+        cursor.executemany(_DELETE_LINKS_SQL, annotation_ids)
+        cursor.executemany(_DELETE_SENTENCES_SQL, annotation_ids)
+
+    sentences, links = [], []
+    for annotation_id, poem_id, results in annotations:
+        if not isinstance(results, list):
+            continue
+        for item in results:
+            if not isinstance(item, dict) or item.get('sentence_id') is None:
+                continue
+            sentence_uid = item['sentence_id']
+            sentences.append((annotation_id, poem_id, sentence_uid, item.get('sentence_text')))
+            # 主情感先写入，与次情感重复时以主情感为准
+            if item.get('primary_emotion'):
+                links.append((item['primary_emotion'], 1, annotation_id, sentence_uid))
+            secondary = item.get('secondary_emotions')
+            if isinstance(secondary, list):
+                links.extend((emotion_id, 0, annotation_id, sentence_uid) for emotion_id in secondary if emotion_id)
+
+    cursor.executemany(_INSERT_SENTENCE_SQL, sentences)
+    cursor.executemany(_INSERT_LINK_SQL, links)
+    return len(sentences)
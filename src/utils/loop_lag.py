@@ -0,0 +1,68 @@
+# src/utils/loop_lag.py
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopLagProbe:
+    """
+    事件循环延迟探针。
+    周期性地 sleep 固定间隔，并测量实际唤醒时间比预期晚了多少；
+    如果有同步操作（例如数据库读写）阻塞了事件循环，延迟会明显上升。
+
+    用法:
+        async with EventLoopLagProbe() as probe:
+            ...
+        logger.info(probe.summary())
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def start(self):
+        """在当前事件循环中启动探针"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """停止探针"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def summary(self) -> Dict[str, float]:
+        """返回延迟统计（毫秒）"""
+        mean_lag = self.total_lag / self.samples if self.samples else 0.0
+        return {
+            'samples': self.samples,
+            'mean_lag_ms': mean_lag * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+        }
@@ -0,0 +1,55 @@
+"""测试公共夹具：把 src 加入 sys.path，并提供基于临时目录的 DataManager"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+
+def poem(title: str, author: str, paragraphs: List[str]) -> Dict[str, Any]:
+    return {'title': title, 'author': author, 'paragraphs': paragraphs}
+
+
+def write_source(source_dir: Path, name: str, poems: List[Dict[str, Any]]) -> Path:
+    path = source_dir / name
+    path.write_text(json.dumps(poems, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+def annotation_result(paragraphs: List[str], primary: str = 'E1', secondary=('E2',)) -> str:
+    """构造与标注器输出一致的标注结果JSON"""
+    return json.dumps([
+        {'sentence_id': f"S{i + 1}", 'sentence_text': text,
+         'primary_emotion': primary, 'secondary_emotions': list(secondary)}
+        for i, text in enumerate(paragraphs)
+    ], ensure_ascii=False)
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    path = tmp_path / 'source'
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def make_data_manager(tmp_path, source_dir):
+    """按需创建指向同一个临时数据库的 DataManager，测试结束后关闭"""
+    from data_manager import DataManager
+    managers = []
+
+    def factory(db_name: str = 'poetry.db', **kwargs) -> DataManager:
+        dm = DataManager(db_path=str(tmp_path / db_name), source_dir=str(source_dir),
+                         output_dir=str(tmp_path / 'output'), **kwargs)
+        managers.append(dm)
+        return dm
+
+    yield factory
+    for dm in managers:
+        dm.close()
@@ -0,0 +1,30 @@
+"""标注变更日志：触发器在同一事务内追加变更，消费者按游标增量读取"""
+
+from conftest import annotation_result, poem, write_source
+
+
+def test_changes_are_logged_and_consumed_once(make_data_manager, source_dir):
+    write_source(source_dir, 'poet.song.0.json', [poem('一', '甲', ['一。']), poem('二', '乙', ['二。'])])
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    dm.save_annotation(1, 'm', 'failed', error_message='timeout')
+    dm.save_annotation(1, 'm', 'completed', annotation_result(['一。']))
+    dm.save_annotation(2, 'm', 'completed', annotation_result(['二。']))
+
+    changes = dm.get_annotation_changes()
+    assert [(c['poem_id'], c['op'], c['status']) for c in changes] == [
+        (1, 'insert', 'failed'), (1, 'update', 'completed'), (2, 'insert', 'completed')
+    ]
+
+    seen = []
+    assert dm.consume_annotation_changes('test', lambda batch: seen.extend(batch), batch_size=2) == 3
+    assert dm.get_change_cursor('test') == changes[-1]['seq']
+    assert dm.consume_annotation_changes('test', seen.extend) == 0
+
+    # 只改写存储格式（不改 updated_at / status）的更新不记录
+    dm.db_adapter.execute_update("UPDATE annotations SET annotation_result = annotation_result")
+    dm.db_adapter.execute_update("DELETE FROM annotations WHERE poem_id = 2")
+    assert [(c['op'], c['poem_id']) for c in dm.get_annotation_changes(dm.get_change_cursor('test'))] == [('delete', 2)]
+
+    assert dm.prune_annotation_changes() == 3
+    assert [c['op'] for c in dm.get_annotation_changes()] == ['delete']
@@ -0,0 +1,87 @@
+"""紧凑存储格式：编解码往返、原文指纹校验，以及原文修订时改写回JSON"""
+
+import json
+import struct
+
+import pytest
+
+from annotation_codec import (COMPACT_RAW, StaleCompactError, collect_emotions, decode_compact,
+                              encode_compact, is_compact, rehydrate)
+from conftest import annotation_result, poem, write_source
+
+PARAGRAPHS = ['白日依山尽，', '黄河入海流。', '欲穷千里目，', '更上一层楼。']
+
+
+def codes_for(results):
+    emotions = sorted(collect_emotions(results))
+    codes = {emotion: code for code, emotion in enumerate(emotions, start=1)}
+    return codes, {code: emotion for emotion, code in codes.items()}
+
+
+def test_round_trip_is_byte_identical():
+    original = annotation_result(PARAGRAPHS, primary='04.01', secondary=('02.03', '05.01'))
+    results = json.loads(original)
+    codes, names = codes_for(results)
+
+    blob = encode_compact(results, codes, PARAGRAPHS)
+
+    assert is_compact(blob)
+    assert len(blob) < len(original.encode('utf-8'))
+    assert rehydrate(blob, names, json.dumps(PARAGRAPHS, ensure_ascii=False)) == original
+
+
+def test_results_that_cannot_round_trip_are_not_encoded():
+    results = json.loads(annotation_result(PARAGRAPHS))
+    results[1]['sentence_text'] = '黄河入海流'
+    codes, _ = codes_for(results)
+    assert encode_compact(results, codes, PARAGRAPHS) is None
+
+
+def test_decode_refuses_corrected_text():
+    results = json.loads(annotation_result(PARAGRAPHS))
+    codes, names = codes_for(results)
+    blob = encode_compact(results, codes, PARAGRAPHS)
+
+    corrected = ['白日依山盡，'] + PARAGRAPHS[1:]
+    with pytest.raises(StaleCompactError):
+        decode_compact(blob, names, corrected)
+    with pytest.raises(StaleCompactError):
+        decode_compact(blob, names, PARAGRAPHS[:2])
+
+
+def test_legacy_blob_out_of_range_raises_value_error():
+    # 早期无指纹的格式：句子序号越界时抛出 ValueError 而不是 IndexError
+    legacy = bytes([COMPACT_RAW]) + struct.pack('<HHB', 3, 1, 0)
+    assert decode_compact(legacy, {1: 'E1'}, PARAGRAPHS)[0]['sentence_text'] == PARAGRAPHS[3]
+    with pytest.raises(ValueError):
+        decode_compact(legacy, {1: 'E1'}, PARAGRAPHS[:2])
+
+
+def test_reingest_rewrites_compact_results_before_text_changes(make_data_manager, source_dir):
+    original = poem('一', '甲', ['一二三，', '四五六。'])
+    write_source(source_dir, 'poet.song.0.json', [original])
+    dm = make_data_manager(annotation_storage='compact')
+    dm.ingest_incremental(workers=1)
+    saved = annotation_result(original['paragraphs'])
+    dm.save_annotation(1, 'm', 'completed', saved)
+    stored = dm.db_adapter.execute_query("SELECT typeof(annotation_result) FROM annotations")[0][0]
+    assert stored == 'blob'
+
+    write_source(source_dir, 'poet.song.0.json', [poem('一', '甲', ['改一二，', '四五六。'])])
+    dm.ingest_incremental(workers=1)
+
+    # 仍然读出模型当时针对原文给出的结果，而不是把标注套到修订后的文本上
+    assert dm.get_completed_annotations([1]) == {1: {'m': saved}}
+
+
+def test_stale_compact_result_reads_as_none(make_data_manager, source_dir):
+    write_source(source_dir, 'poet.song.0.json', [poem('一', '甲', ['一二三，', '四五六。'])])
+    dm = make_data_manager(annotation_storage='compact')
+    dm.ingest_incremental(workers=1)
+    dm.save_annotation(1, 'm', 'completed', annotation_result(['一二三，', '四五六。']))
+
+    # 绕过导入流程直接改写原文（如手工修订数据库）
+    dm.db_adapter.execute_update("UPDATE poems SET paragraphs = ? WHERE id = 1",
+                                 (json.dumps(['一二三，'], ensure_ascii=False),))
+
+    assert dm.get_completed_annotations([1]) == {1: {'m': None}}
@@ -0,0 +1,73 @@
+"""标注历史：每次保存追加版本并更新 current_version_id；原文修订后历史版本仍可读取"""
+
+import asyncio
+import json
+
+from conftest import annotation_result, poem, write_source
+
+PARAGRAPHS = ['床前明月光，', '疑是地上霜。', '举头望明月，', '低头思故乡。']
+
+
+def setup_poem(make_data_manager, source_dir, **kwargs):
+    write_source(source_dir, 'poet.song.0.json', [poem('静夜思', '李白', PARAGRAPHS)])
+    dm = make_data_manager(**kwargs)
+    dm.ingest_incremental(workers=1)
+    return dm
+
+
+def record(result, run_id, prompt_hash, usage=None):
+    return {'poem_id': 1, 'model_identifier': 'm', 'status': 'completed', 'annotation_result': result,
+            'error_message': None, 'run_id': run_id, 'prompt_hash': prompt_hash, 'usage': usage}
+
+
+def test_saving_twice_appends_versions_and_moves_pointer(make_data_manager, source_dir):
+    dm = setup_poem(make_data_manager, source_dir)
+    first = annotation_result(PARAGRAPHS, primary='E1')
+    second = annotation_result(PARAGRAPHS, primary='E2')
+
+    assert asyncio.run(dm.save_annotations([record(first, 'run-1', 'h1', {'total_tokens': 120})])) == 1
+    assert asyncio.run(dm.save_annotations([record(second, 'run-2', 'h2')])) == 1
+
+    versions = dm.get_annotation_versions(poem_id=1, model_identifier='m')
+    assert [(v['run_id'], v['prompt_hash'], v['is_current']) for v in versions] == [
+        ('run-1', 'h1', False), ('run-2', 'h2', True)
+    ]
+    assert versions[0]['usage'] == {'total_tokens': 120}
+    assert versions[1]['usage'] is None
+    assert [v['annotation_result'] for v in versions] == [first, second]
+
+    current = dm.db_adapter.execute_query(
+        "SELECT current_version_id, annotation_result FROM annotations WHERE poem_id = 1 AND model_identifier = 'm'"
+    )
+    assert len(current) == 1
+    assert current[0]['current_version_id'] == versions[1]['id']
+    assert current[0]['annotation_result'] == second
+
+    compared = dm.compare_prompt_versions('m', 'h1', 'h2')
+    assert [(c['poem_id'], c['result_a'], c['result_b']) for c in compared] == [(1, first, second)]
+
+
+def test_versions_stay_readable_after_poem_is_shortened(make_data_manager, source_dir):
+    dm = setup_poem(make_data_manager, source_dir, annotation_storage='compact')
+    saved = annotation_result(PARAGRAPHS)
+    dm.save_annotation(1, 'm', 'completed', saved, prompt_hash='h1')
+    assert dm.db_adapter.execute_query("SELECT typeof(annotation_result) FROM annotation_versions")[0][0] == 'blob'
+
+    write_source(source_dir, 'poet.song.0.json', [poem('静夜思', '李白', PARAGRAPHS[:2])])
+    dm.ingest_incremental(workers=1)
+
+    versions = dm.get_annotation_versions(poem_id=1)
+    assert [v['annotation_result'] for v in versions] == [saved]
+    assert dm.compare_prompt_versions('m', 'h1', 'h1')[0]['result_a'] == saved
+
+
+def test_versions_with_mismatched_text_do_not_crash(make_data_manager, source_dir):
+    dm = setup_poem(make_data_manager, source_dir, annotation_storage='compact')
+    dm.save_annotation(1, 'm', 'completed', annotation_result(PARAGRAPHS))
+    dm.db_adapter.execute_update("UPDATE poems SET paragraphs = ? WHERE id = 1",
+                                 (json.dumps(PARAGRAPHS[:1], ensure_ascii=False),))
+
+    assert [v['annotation_result'] for v in dm.get_annotation_versions(poem_id=1)] == [None]
+    output = dm.export_results(output_file=str(source_dir.parent / 'export.jsonl'))
+    with open(output, encoding='utf-8') as f:
+        assert [json.loads(line)['annotation_result'] for line in f] == [None]
@@ -0,0 +1,63 @@
+"""计数表：由触发器随写入维护，与实际 COUNT(*) 一致；新建时从已有数据回填"""
+
+import sqlite3
+
+from conftest import annotation_result, poem, write_source
+
+POEMS = [poem(f"题{i}", '佚名', [f"第{i}首。"]) for i in range(1, 6)]
+
+
+def actual_counts(dm):
+    rows = dm.db_adapter.execute_query(
+        "SELECT model_identifier, status, COUNT(*) FROM annotations GROUP BY model_identifier, status"
+    )
+    return {(row[0], row[1]): row[2] for row in rows}
+
+
+def counter_counts(dm):
+    return {(row[0], row[1]): row[2] for row in dm._annotation_counts()}
+
+
+def test_counters_follow_inserts_updates_and_deletes(make_data_manager, source_dir):
+    write_source(source_dir, 'poet.song.0.json', POEMS)
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    for poem_id in range(1, 6):
+        status = 'completed' if poem_id % 2 else 'failed'
+        dm.save_annotation(poem_id, 'm1', status, annotation_result([f"第{poem_id}首。"]) if status == 'completed' else None)
+    dm.save_annotation(1, 'm2', 'completed', annotation_result(['第1首。']))
+    assert counter_counts(dm) == actual_counts(dm) == {('m1', 'completed'): 3, ('m1', 'failed'): 2, ('m2', 'completed'): 1}
+
+    # 状态变化、删除标注、删除诗词
+    dm.save_annotation(2, 'm1', 'completed', annotation_result(['第2首。']))
+    dm.db_adapter.execute_update("DELETE FROM annotations WHERE poem_id = 3 AND model_identifier = 'm1'")
+    dm.db_adapter.execute_update("DELETE FROM poems WHERE id = 5")
+    assert counter_counts(dm) == actual_counts(dm)
+    assert dm.get_statistics()['total_poems'] == 4
+    assert dm.get_statistics()['stats_by_model']['m1']['completed'] == actual_counts(dm)[('m1', 'completed')]
+
+
+def test_counters_are_backfilled_and_rebuilt(make_data_manager, source_dir, tmp_path):
+    write_source(source_dir, 'poet.song.0.json', POEMS)
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    dm.save_annotation(1, 'm1', 'completed', annotation_result(['第1首。']))
+    dm.close()
+
+    # 模拟升级前的旧数据库：删除计数表及其触发器，重新打开时应从已有数据统计填充
+    conn = sqlite3.connect(tmp_path / 'poetry.db')
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%counter%'").fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+    conn.execute("DROP TABLE annotation_counters")
+    conn.execute("DROP TABLE table_counters")
+    conn.commit()
+    conn.close()
+
+    dm = make_data_manager()
+    assert counter_counts(dm) == {('m1', 'completed'): 1}
+    assert dm.get_statistics()['total_poems'] == 5
+
+    # 计数偏差后可重新统计
+    dm.db_adapter.execute_update("UPDATE annotation_counters SET count = 99")
+    dm.rebuild_counters()
+    assert counter_counts(dm) == actual_counts(dm)
@@ -0,0 +1,48 @@
+"""多数据库查询路由：只读 ATTACH 各库，跨库视图带 db_name，统计与逐库查询结果一致"""
+
+import sqlite3
+
+import pytest
+
+from conftest import annotation_result, poem, write_source
+from db_router import MultiDatabaseRouter
+
+
+@pytest.fixture
+def two_databases(make_data_manager, source_dir, tmp_path):
+    write_source(source_dir, 'poet.song.0.json', [poem('一', '甲', ['一。']), poem('二', '乙', ['二。'])])
+    tang = make_data_manager('tang.db')
+    tang.ingest_incremental(workers=1)
+    tang.save_annotation(1, 'm', 'completed', annotation_result(['一。']))
+    tang.save_annotation(2, 'm', 'failed', error_message='timeout')
+    song = make_data_manager('song.db')
+    song.ingest_incremental(workers=1)
+    song.save_annotation(1, 'm', 'completed', annotation_result(['一。']))
+    return {'tang': str(tmp_path / 'tang.db'), 'song': str(tmp_path / 'song.db')}, tang, song
+
+
+def test_views_and_statistics_span_databases(two_databases):
+    paths, tang, song = two_databases
+    with MultiDatabaseRouter(paths) as router:
+        rows = router.execute_query(
+            "SELECT db_name, status, COUNT(*) FROM all_annotations GROUP BY db_name, status ORDER BY db_name, status"
+        )
+        assert [tuple(row) for row in rows] == [('song', 'completed', 1), ('tang', 'completed', 1), ('tang', 'failed', 1)]
+
+        stats = router.get_statistics()
+        assert stats['by_db']['tang'] == tang.get_statistics()
+        assert stats['by_db']['song'] == song.get_statistics()
+        assert stats['total_poems'] == 4
+        assert stats['stats_by_model']['m'] == {'completed': 2, 'failed': 1, 'total_annotated': 3}
+
+        each = router.query_each("SELECT COUNT(*) FROM annotations")
+        assert {name: rows[0][0] for name, rows in each.items()} == {'tang': 2, 'song': 1}
+
+
+def test_router_is_read_only(two_databases):
+    paths, _, _ = two_databases
+    with MultiDatabaseRouter(paths) as router:
+        with pytest.raises(sqlite3.OperationalError):
+            router.execute_query('DELETE FROM "tang".annotations')
+    with pytest.raises(FileNotFoundError):
+        MultiDatabaseRouter({'missing': paths['tang'] + '.none'}).connect()
@@ -0,0 +1,58 @@
+"""增量导出：分片 + manifest 水位线，只导出上次之后变化的标注"""
+
+import json
+
+import pytest
+
+from conftest import annotation_result, poem, write_source
+from result_exporter import MANIFEST_NAME, load_manifest
+
+POEMS = [poem(f"题{i}", '佚名', [f"第{i}首一，", f"第{i}首二。"]) for i in range(1, 4)]
+
+
+def read_shard(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_incremental_export_writes_only_new_changes(make_data_manager, source_dir, tmp_path):
+    write_source(source_dir, 'poet.song.0.json', POEMS)
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    for poem_id in (1, 2):
+        dm.save_annotation(poem_id, 'm', 'completed', annotation_result(POEMS[poem_id - 1]['paragraphs']))
+    out = tmp_path / 'sync'
+
+    # 刚写入的变更仍在延迟窗口内，不导出
+    assert dm.export_incremental(str(out), lag_seconds=60) is None
+
+    first = dm.export_incremental(str(out), lag_seconds=0)
+    assert first['file'] == 'part-00001.jsonl' and first['annotations'] == 2 and first['after'] is None
+    assert sorted(row['poem_id'] for row in read_shard(out / first['file'])) == [1, 2]
+    assert load_manifest(out)['watermark'] == first['watermark']
+
+    # 没有新的变更
+    assert dm.export_incremental(str(out), lag_seconds=0) is None
+
+    dm.save_annotation(2, 'm', 'failed', error_message='timeout')
+    dm.save_annotation(3, 'm', 'completed', annotation_result(POEMS[2]['paragraphs']))
+    second = dm.export_incremental(str(out), lag_seconds=0)
+    assert second['file'] == 'part-00002.jsonl' and second['after'] == first['watermark']
+    rows = {row['poem_id']: row['status'] for row in read_shard(out / second['file'])}
+    assert rows == {2: 'failed', 3: 'completed'}
+
+    manifest = json.loads((out / MANIFEST_NAME).read_text(encoding='utf-8'))
+    assert [shard['file'] for shard in manifest['shards']] == ['part-00001.jsonl', 'part-00002.jsonl']
+    assert manifest['watermark'] == second['watermark']
+
+
+def test_incremental_export_rejects_changed_format(make_data_manager, source_dir, tmp_path):
+    write_source(source_dir, 'poet.song.0.json', POEMS[:1])
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    dm.save_annotation(1, 'm', 'completed', annotation_result(POEMS[0]['paragraphs']))
+    out = tmp_path / 'sync'
+    dm.export_incremental(str(out), lag_seconds=0, model_filter='m')
+
+    with pytest.raises(ValueError):
+        dm.export_incremental(str(out), lag_seconds=0, model_filter='other')
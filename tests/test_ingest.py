@@ -0,0 +1,115 @@
+"""增量导入：文件变化时按内容/标题作者找回原有ID，原文修订的诗词重新入队"""
+
+import json
+import sqlite3
+
+from conftest import annotation_result, poem, write_source
+
+FILE = 'poet.song.0.json'
+A = poem('春晓', '孟浩然', ['春眠不觉晓，', '处处闻啼鸟。'])
+B = poem('静夜思', '李白', ['床前明月光，', '疑是地上霜。'])
+C = poem('登鹳雀楼', '王之涣', ['白日依山尽，', '黄河入海流。'])
+
+
+def poems_by_id(dm):
+    return {row['id']: (row['title'], row['full_text']) for row in dm.db_adapter.execute_query(
+        "SELECT id, title, full_text FROM poems")}
+
+
+def test_reingest_keeps_ids_when_poem_inserted_at_top(make_data_manager, source_dir):
+    write_source(source_dir, FILE, [A, B, C])
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    assert {poem_id: title for poem_id, (title, _) in poems_by_id(dm).items()} == {1: '春晓', 2: '静夜思', 3: '登鹳雀楼'}
+    dm.save_annotation(3, 'm', 'completed', annotation_result(C['paragraphs']))
+
+    inserted = poem('相思', '王维', ['红豆生南国，', '春来发几枝。'])
+    write_source(source_dir, FILE, [inserted, A, B, C])
+    stats = dm.ingest_incremental(workers=1)
+
+    assert stats['changed_files'] == 1
+    assert {poem_id: title for poem_id, (title, _) in poems_by_id(dm).items()} == {
+        1: '春晓', 2: '静夜思', 3: '登鹳雀楼', 4: '相思'
+    }
+    # 标注仍然对应原来的诗词，且不被视为过期
+    assert dm.get_stale_poem_ids('m') == []
+
+
+def test_reingest_corrected_text_requeues_and_marks_stale(make_data_manager, source_dir):
+    write_source(source_dir, FILE, [A, B, C])
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    dm.ensure_pending_queue('m')
+    for poem_id, item in ((1, A), (2, B), (3, C)):
+        dm.save_annotation(poem_id, 'm', 'completed', annotation_result(item['paragraphs']))
+    assert dm.count_pending('m') == 0
+
+    corrected = poem('静夜思', '李白', ['床前看月光，', '疑是地上霜。'])
+    write_source(source_dir, FILE, [A, corrected, C])
+    dm.ingest_incremental(workers=1)
+
+    assert poems_by_id(dm)[2] == ('静夜思', '床前看月光，\n疑是地上霜。')
+    assert dm.get_stale_poem_ids('m') == [2]
+    queued = dm.db_adapter.execute_query("SELECT poem_id FROM annotation_queue WHERE model_identifier = 'm'")
+    assert [row[0] for row in queued] == [2]
+
+    # 重新标注后出队，不再过期
+    dm.save_annotation(2, 'm', 'completed', annotation_result(corrected['paragraphs']))
+    assert dm.get_stale_poem_ids('m') == []
+    assert dm.count_pending('m') == 0
+
+
+def test_reingest_corrected_text_of_pending_poem(make_data_manager, source_dir):
+    write_source(source_dir, FILE, [A, B, C])
+    dm = make_data_manager()
+    dm.ingest_incremental(workers=1)
+    dm.ensure_pending_queue('m')
+    dm.save_annotation(1, 'm', 'completed', annotation_result(A['paragraphs']))
+
+    # 诗词2仍在队列中，修订其原文不应与已有的队列行冲突
+    corrected = poem('静夜思', '李白', ['床前看月光，', '疑是地上霜。'])
+    write_source(source_dir, FILE, [A, corrected, C])
+    dm.ingest_incremental(workers=1)
+
+    assert poems_by_id(dm)[2] == ('静夜思', '床前看月光，\n疑是地上霜。')
+    queued = dm.db_adapter.execute_query(
+        "SELECT poem_id FROM annotation_queue WHERE model_identifier = 'm' ORDER BY poem_id")
+    assert [row[0] for row in queued] == [2, 3]
+
+
+def test_first_ingest_into_legacy_database_keeps_annotations(make_data_manager, source_dir, tmp_path):
+    # 升级前的数据库：poems 没有 content_hash，annotations 没有 source_hash，也没有导入清单
+    write_source(source_dir, FILE, [A, B, C])
+    conn = sqlite3.connect(tmp_path / 'poetry.db')
+    conn.executescript('''
+        CREATE TABLE poems (id INTEGER PRIMARY KEY, title TEXT, author TEXT, paragraphs TEXT, full_text TEXT,
+                            author_desc TEXT, created_at TEXT, updated_at TEXT);
+        CREATE TABLE annotations (id INTEGER PRIMARY KEY, poem_id INTEGER, model_identifier TEXT NOT NULL,
+                                  status TEXT NOT NULL CHECK(status IN ('completed', 'failed')),
+                                  annotation_result TEXT, error_message TEXT, created_at TEXT, updated_at TEXT,
+                                  FOREIGN KEY(poem_id) REFERENCES poems(id));
+        CREATE TABLE authors (name TEXT PRIMARY KEY, description TEXT, short_description TEXT, created_at TEXT);
+        CREATE UNIQUE INDEX uidx_poem_model ON annotations(poem_id, model_identifier);
+    ''')
+    for poem_id, item in ((1, A), (2, B), (3, C)):
+        conn.execute(
+            "INSERT INTO poems (id, title, author, paragraphs, full_text, author_desc) VALUES (?, ?, ?, ?, ?, '')",
+            (poem_id, item['title'], item['author'], json.dumps(item['paragraphs'], ensure_ascii=False),
+             '\n'.join(item['paragraphs']))
+        )
+    for poem_id, item in ((1, A), (2, B)):
+        conn.execute(
+            "INSERT INTO annotations (poem_id, model_identifier, status, annotation_result) VALUES (?, 'm', 'completed', ?)",
+            (poem_id, annotation_result(item['paragraphs']))
+        )
+    conn.commit()
+    conn.close()
+
+    dm = make_data_manager()
+    dm.ensure_pending_queue('m')
+    assert dm.count_pending('m') == 1
+    dm.ingest_incremental(workers=1)
+
+    # 原文未变：已有标注不过期，也不重新入队
+    assert dm.get_stale_poem_ids('m') == []
+    assert dm.count_pending('m') == 1